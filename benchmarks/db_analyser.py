@@ -0,0 +1,35 @@
+import os
+import time
+
+import numpy as np
+import soundfile as sf
+
+from src.pymouth.analyser import DBAnalyser, RMSAnalyser
+
+AIUEO = os.path.join(os.path.dirname(__file__), '..', 'tests', 'aiueo.wav')
+
+
+def bench(analyser, audio: np.ndarray, samplerate: int, block_size: int = 4096, repeat: int = 5) -> float:
+    """
+    :return: 每块平均耗时(秒)
+    """
+    blocks = [audio[i:i + block_size] for i in range(0, len(audio), block_size)]
+    analyser.process(blocks[0], samplerate)  # warm up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for block in blocks:
+            analyser.process(block, samplerate)
+    return (time.perf_counter() - t0) / (repeat * len(blocks))
+
+
+def main():
+    audio, samplerate = sf.read(AIUEO, dtype=np.float32)
+    db = bench(DBAnalyser(), audio, samplerate)
+    rms = bench(RMSAnalyser(), audio, samplerate)
+    print(f'DBAnalyser : {db * 1e6:10.1f} us/block')
+    print(f'RMSAnalyser: {rms * 1e6:10.1f} us/block')
+    print(f'speedup    : {db / rms:10.1f} x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+TESTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests')
+
+# 日语元音的前两个共振峰(Hz), 用于合成测试音频
+FORMANTS = {
+    'a': (800, 1200),
+    'i': (300, 2300),
+    'u': (300, 1400),
+    'e': (500, 1900),
+    'o': (500, 800),
+}
+
+
+def synthetic_vowels(samplerate: int, seconds_per_vowel: float = 0.5, f0: float = 120.0, seed: int = 0) -> np.ndarray:
+    """
+    合成 あいうえお 的测试音频: 基频为 f0 的谐波, 按共振峰加权, 元音之间插入微弱的噪声作为静音段.
+    结果只取决于参数, 不同机器、不同版本之间可以直接比较
+    :return: 单声道 float32
+    """
+    rng = np.random.default_rng(seed)
+    n = int(samplerate * seconds_per_vowel)
+    t = np.arange(n) / samplerate
+    harmonics = np.arange(1, int(samplerate / 2 / f0))
+    segments = []
+    for f1, f2 in FORMANTS.values():
+        freqs = harmonics * f0
+        gains = np.exp(-((freqs - f1) / 120) ** 2) + 0.6 * np.exp(-((freqs - f2) / 160) ** 2) + 0.02
+        y = (gains[:, None] * np.sin(2 * np.pi * freqs[:, None] * t)).sum(axis=0)
+        y *= np.hanning(n)
+        segments.append(0.5 * y / np.abs(y).max())
+        segments.append(rng.normal(0, 1e-3, n // 4))
+    return np.concatenate(segments).astype(np.float32)
+
+
+def recorded(name: str = 'aiueo.wav') -> tuple[np.ndarray, int]:
+    """
+    tests 目录下的录音
+    :return: (音频, 采样率)
+    """
+    return sf.read(os.path.join(TESTS_DIR, name), dtype=np.float32)
+
+
+def blocks(audio: np.ndarray, block_size: int) -> list[np.ndarray]:
+    """按块切分, 丢弃最后不完整的一块, 保证每次测量的块长度相同"""
+    return [audio[i:i + block_size] for i in range(0, len(audio) - block_size + 1, block_size)]
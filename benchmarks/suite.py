@@ -0,0 +1,300 @@
+"""
+pymouth 性能基准
+
+运行并保存结果:
+    python -m benchmarks.suite run -o results.json
+只运行部分基准(名称包含给定字符串):
+    python -m benchmarks.suite run -k vowel -k 44100
+只测量冷启动(导入到第一块分析完成):
+    python -m benchmarks.suite run -k startup
+比较两次结果, 中位数变慢超过阈值时返回非0:
+    python -m benchmarks.suite compare base.json results.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+from websockets.sync.server import serve
+
+from .fixtures import synthetic_vowels, recorded, blocks
+
+SAMPLERATES = (16000, 22050, 44100, 48000)
+BLOCK_SIZES = (1024, 2048, 4096)
+
+
+def measure(fn, args: list, repeat: int, audio_seconds: float | None = None) -> dict:
+    """
+    对 args 中的每一项调用 fn, 重复 repeat 轮, 第一轮之前先预热一次
+    :param audio_seconds: 每次调用处理的音频时长, 用于计算实时倍率
+    """
+    fn(*args[0])
+    samples = []
+    for _ in range(repeat):
+        for a in args:
+            t0 = time.perf_counter()
+            fn(*a)
+            samples.append(time.perf_counter() - t0)
+    samples.sort()
+    median = statistics.median(samples)
+    res = {
+        'calls': len(samples),
+        'mean_us': statistics.fmean(samples) * 1e6,
+        'median_us': median * 1e6,
+        'p95_us': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6,
+        'per_second': 1 / median if median else float('inf'),
+    }
+    if audio_seconds is not None:
+        res['realtime_factor'] = audio_seconds / median if median else float('inf')
+    return res
+
+
+def bench_analysers(selected, repeat: int):
+    # compare 不需要音频设备, 只在运行基准时导入
+    from src.pymouth.analyser import VowelAnalyser, DBAnalyser, RMSAnalyser, get_n_fft, softmax
+
+    from src.pymouth.analyser import default_templates
+    from src.pymouth.templates import TemplateBank
+
+    fixtures = [('synthetic', sr, synthetic_vowels(sr)) for sr in SAMPLERATES]
+    # 重采样到 16kHz 后分析, 模板内容不影响耗时
+    bank16k = TemplateBank(default_templates().templates, samplerate=16000)
+    audio, sr = recorded()
+    fixtures.append(('aiueo.wav', sr, audio))
+
+    for fixture, sr, audio in fixtures:
+        for block_size in BLOCK_SIZES:
+            args = [(b, sr) for b in blocks(audio, block_size)]
+            params = f'[{fixture},sr={sr},block={block_size}]'
+
+            name = 'get_n_fft' + params
+            if selected(name):
+                yield name, measure(get_n_fft, [(block_size, sr)], repeat * 100)
+
+            cases = [
+                ('VowelAnalyser._audio2vowel', VowelAnalyser(), '_audio2vowel'),
+                ('VowelAnalyser(streaming)._audio2vowel', VowelAnalyser(streaming=True), '_audio2vowel'),
+                ('DBAnalyser.process', DBAnalyser(), 'process'),
+                ('RMSAnalyser.process', RMSAnalyser(), 'process'),
+            ]
+            if sr != 16000:
+                cases += [
+                    ('VowelAnalyser(analysis_rate=16000)._audio2vowel', VowelAnalyser(templates=bank16k), '_audio2vowel'),
+                    ('VowelAnalyser(streaming,analysis_rate=16000)._audio2vowel',
+                     VowelAnalyser(streaming=True, templates=bank16k), '_audio2vowel'),
+                ]
+            for label, analyser, method in cases:
+                name = label + params
+                if not selected(name):
+                    continue
+                analyser._begin_session(sr, block_size)
+                yield name, measure(getattr(analyser, method), args, repeat, audio_seconds=block_size / sr)
+
+    # 大模板库: aiueo.wav 中每个元音的所有候选块, 比较剪枝与逐个计算
+    audio, sr = recorded()
+    bank = TemplateBank.from_recording(audio, sr, [(v, i * 4096 / sr, (i + 6) * 4096 / sr) for v, i in
+                                                   (('A', 3), ('I', 13), ('U', 23), ('E', 34), ('O', 46))],
+                                       per_vowel=None, fallback=default_templates())
+    args = [(b, sr) for b in blocks(audio, 4096)]
+    for pruning in ('exact', 'approximate', None):
+        name = f'VowelAnalyser._audio2vowel[templates={len(bank)},pruning={pruning}]'
+        if selected(name):
+            analyser = VowelAnalyser(templates=bank, pruning=pruning)
+            yield name, measure(analyser._audio2vowel, args, repeat, audio_seconds=4096 / sr)
+
+    name = 'softmax[6]'
+    if selected(name):
+        x = -np.random.default_rng(0).uniform(0, 50, 6)
+        yield name, measure(softmax, [(x, 10.0)], repeat * 1000)
+
+
+class FakeVTS:
+    """
+    本地的 VTubeStudio API 模拟服务器, 对每个请求立即响应, 会话视为已认证.
+    只用于测量适配器自身的开销, 不包含VTS的处理时间
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.server = serve(self.handler, 'localhost', 0)
+        self.uri = f'ws://localhost:{self.server.socket.getsockname()[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def handler(self, ws):
+        for message in ws:
+            req = json.loads(message)
+            self.messages += 1
+            data = {'currentSessionAuthenticated': True} if req['messageType'] == 'APIStateRequest' else {}
+            ws.send(json.dumps({'requestID': req['requestID'], 'messageType': req['messageType'], 'data': data}))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.thread.join()
+
+
+def bench_adapter(selected, repeat: int):
+    from src.pymouth.adapter import VTSAdapter
+    from src.pymouth.analyser import VowelAnalyser, DBAnalyser, RMSAnalyser
+
+    audio, sr = recorded()
+    duration = len(audio) / sr
+    cases = [
+        ('VTSAdapter(VowelAnalyser)', lambda: VowelAnalyser()),
+        ('VTSAdapter(DBAnalyser)', lambda: DBAnalyser()),
+        ('VTSAdapter(RMSAnalyser)', lambda: RMSAnalyser()),
+    ]
+    with FakeVTS() as vts:
+        for label, factory in cases:
+            name = f'{label}.action_block[aiueo.wav,sr={sr},block=4096]'
+            if not selected(name):
+                continue
+            with VTSAdapter(factory(), ws_uri=vts.uri) as adapter:
+                def run():
+                    adapter.action_block(audio, sr, output_device=None, auto_play=False)
+
+                res = measure(run, [()], repeat, audio_seconds=duration)
+            res['messages'] = vts.messages
+            vts.messages = 0
+            yield name, res
+
+
+# 在新的解释器中测量冷启动: 导入耗时, 以及从导入开始到第一块分析完成的耗时
+STARTUP_SCRIPT = '''
+import json, sys, time
+t0 = time.perf_counter()
+{imports}
+t1 = time.perf_counter()
+import numpy as np
+block = np.random.default_rng(0).uniform(-0.5, 0.5, 4096).astype(np.float32)
+{first_block}
+t2 = time.perf_counter()
+heavy = ('librosa', 'numba', 'scipy', 'sounddevice', 'soundfile', 'websockets')
+print(json.dumps({{'import': t1 - t0, 'first_block': t2 - t0, 'modules': [m for m in heavy if m in sys.modules]}}))
+'''
+
+STARTUP_CASES = [
+    ('import pymouth', 'import src.pymouth', 'pass'),
+    ('VowelAnalyser', 'from src.pymouth import VowelAnalyser', 'VowelAnalyser().process(block, 44100)'),
+    ('RMSAnalyser', 'from src.pymouth import RMSAnalyser', 'RMSAnalyser().process(block, 44100)'),
+    ('VTSAdapter', 'from src.pymouth import VTSAdapter, VowelAnalyser', 'VowelAnalyser().process(block, 44100)'),
+    # 参照: 旧版本通过 librosa 计算MFCC时的启动耗时
+    ('librosa.feature.mfcc', 'import librosa', 'librosa.feature.mfcc(y=block, sr=44100, n_fft=1024, dct_type=1, n_mfcc=3)'),
+]
+
+
+def bench_startup(selected, repeat: int):
+    root = os.path.join(os.path.dirname(__file__), '..')
+    for label, imports, first_block in STARTUP_CASES:
+        name = f'startup[{label}]'
+        if not selected(name):
+            continue
+        script = STARTUP_SCRIPT.format(imports=imports, first_block=first_block)
+        runs = []
+        # 每个进程只能测一次冷启动, 至少运行3次取中位数
+        for _ in range(max(repeat, 3)):
+            out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=root,
+                                 check=True).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        first_block = statistics.median(r['first_block'] for r in runs)
+        yield name, {
+            'calls': len(runs),
+            'import_us': statistics.median(r['import'] for r in runs) * 1e6,
+            'median_us': first_block * 1e6,
+            'mean_us': statistics.fmean(r['first_block'] for r in runs) * 1e6,
+            'modules': runs[-1]['modules'],
+        }
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run(args) -> int:
+    def selected(name: str) -> bool:
+        return all(k in name for k in args.keyword)
+
+    results = {}
+    for suite in (bench_startup, bench_analysers, bench_adapter):
+        for name, res in suite(selected, args.repeat):
+            results[name] = res
+            print(f'{name:<72} {res["median_us"]:>12.1f} us', file=sys.stderr)
+
+    report = {'meta': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)['results']
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)['results']
+
+    regressions = 0
+    print(f'{"benchmark":<72} {"base us":>12} {"new us":>12} {"ratio":>8}')
+    for name in sorted(base.keys() & new.keys()):
+        b, n = base[name]['median_us'], new[name]['median_us']
+        ratio = n / b if b else float('inf')
+        mark = ''
+        if ratio > 1 + args.threshold:
+            mark = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            mark = '  improved'
+        print(f'{name:<72} {b:>12.1f} {n:>12.1f} {ratio:>7.2f}x{mark}')
+    for name in sorted(base.keys() - new.keys()):
+        print(f'{name:<72} missing in {args.new}')
+    for name in sorted(new.keys() - base.keys()):
+        print(f'{name:<72} new')
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description='pymouth benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='运行基准并输出JSON')
+    p.add_argument('-o', '--output', help='结果文件, 默认输出到stdout')
+    p.add_argument('-k', '--keyword', action='append', default=[], help='只运行名称包含该字符串的基准, 可重复')
+    p.add_argument('-r', '--repeat', type=int, default=3, help='每个基准重复的轮数')
+    p.set_defaults(func=run)
+
+    p = sub.add_parser('compare', help='比较两次结果')
+    p.add_argument('base')
+    p.add_argument('new')
+    p.add_argument('-t', '--threshold', type=float, default=0.1, help='中位数相对变化超过该比例视为回归')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
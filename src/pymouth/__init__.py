@@ -1,3 +1,49 @@
-from .adapter import VTSAdapter
-from .analyser import Analyser, DBAnalyser, VowelAnalyser
-from .vts_websockets import VTSWebSocket, VTSPluginInfo, VTSParameterData
+import importlib
+from typing import TYPE_CHECKING
+
+# 按需导入: 只有用到某个类时才导入对应的模块(以及 sounddevice / soundfile / websockets 等依赖)
+_exports = {
+    'VTSAdapter': '.adapter',
+    'AsyncVTSAdapter': '.adapter',
+    'AnalysisCache': '.cache',
+    'Analyser': '.analyser',
+    'DBAnalyser': '.analyser',
+    'RMSAnalyser': '.analyser',
+    'VowelAnalyser': '.analyser',
+    'LipSyncEngine': '.engine',
+    'LipSyncTrack': '.track',
+    'PlaybackSession': '.session',
+    'TemplateBank': '.templates',
+    'Metrics': '.metrics',
+    'SnapshotReporter': '.metrics',
+    'VTSWebSocket': '.vts_websockets',
+    'AsyncVTSWebSocket': '.vts_websockets',
+    'VTSPluginInfo': '.vts_websockets',
+    'VTSParameterData': '.vts_websockets',
+}
+
+__all__ = list(_exports)
+
+if TYPE_CHECKING:
+    from .adapter import VTSAdapter, AsyncVTSAdapter
+    from .cache import AnalysisCache
+    from .analyser import Analyser, DBAnalyser, RMSAnalyser, VowelAnalyser
+    from .engine import LipSyncEngine
+    from .session import PlaybackSession
+    from .track import LipSyncTrack
+    from .templates import TemplateBank
+    from .metrics import Metrics, SnapshotReporter
+    from .vts_websockets import VTSWebSocket, AsyncVTSWebSocket, VTSPluginInfo, VTSParameterData
+
+
+def __getattr__(name: str):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
@@ -1,8 +1,12 @@
-import numpy as np
-import soundfile as sf
+import asyncio
 
 from .analyser import Analyser, DBAnalyser, VowelAnalyser
-from .vts_websockets import VTSWebSocket, VTSPluginInfo, VTSParameterData
+from .metrics import Metrics
+from .audio_source import AudioInput
+from .publisher import ParameterPublisher
+from .session import PlaybackSession
+from .track import LipSyncTrack
+from .vts_websockets import VTSWebSocket, AsyncVTSWebSocket, VTSPluginInfo, VTSParameterData
 
 
 class VTSAdapter:
@@ -14,7 +18,10 @@ class VTSAdapter:
                  plugin_info: VTSPluginInfo = VTSPluginInfo(plugin_name='pymouth',
                                                             developer='organics',
                                                             authentication_token_path='./pymouth_vts_token.txt',
-                                                            plugin_icon=None)
+                                                            plugin_icon=None),
+                 publish_rate: float | None = None,
+                 publish_epsilon: float = 0.01,
+                 metrics: Metrics | None = None
                  ):
         """
         VTubeStudio Adapter.
@@ -34,6 +41,11 @@ class VTSAdapter:
 
         :param ws_uri: websocket uri 默认：ws://localhost:8001
         :param plugin_info: 插件信息,可以自定义
+        :param publish_rate: 口型参数的发布频率(Hz), 例如30或60. 默认为None, 每个分析块发送一次.
+            设置后会在两次分析结果之间插值, 并以固定频率合并发送, 口型更平滑, 且不增加分析开销
+        :param publish_epsilon: 仅在设置 publish_rate 时有效, 变化小于这个值的参数不发送
+        :param metrics: 热路径统计, 同时交给分析仪和VTS客户端. 默认为None, 不统计.
+            可通过 metrics.snapshot() 读取, 或 metrics.to_prometheus() 导出
         """
 
         if vowel_vts_mouth_param is None:
@@ -47,87 +59,209 @@ class VTSAdapter:
             }
 
         self.analyser = analyser
+        self.metrics = metrics
+        if metrics is not None:
+            analyser.metrics = metrics
 
         self.db_vts_mouth_param = db_vts_mouth_param
         self.vowel_vts_mouth_param = vowel_vts_mouth_param
 
         self.ws_uri = ws_uri
         self.plugin_info = plugin_info
-        self.vts = VTSWebSocket(ws_uri, plugin_info)
+        self.vts = VTSWebSocket(ws_uri, plugin_info, metrics=metrics)
+        self.publisher = ParameterPublisher(lambda params: self.vts.set_params(params),
+                                            rate=publish_rate,
+                                            epsilon=publish_epsilon) if publish_rate else None
 
     def __enter__(self):
-        self.vts.connect()
+        if self.vts.client is None:
+            self.vts.connect()
+        if self.publisher is not None:
+            self.publisher.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.publisher is not None:
+            self.publisher.stop()
         self.vts.close()
 
+    def warmup(self, samplerate: int | float = 44100, output_device: int | None = None, channels: int = 1):
+        """
+        预热分析仪和输出设备(见 Analyser.warmup), 并提前完成与VTS的连接和认证.
+        可以在 `with` 之前调用, 第一次 action 时不再有额外的延迟
+        :param samplerate: 之后要播放的音频的采样率
+        :param output_device: 输出设备Index, 为None时不预热音频设备
+        :param channels: 声道数
+        """
+        self.analyser.warmup(samplerate, 4096, output_device, channels)
+        if self.vts.client is None:
+            self.vts.connect()
+
     def __db_callback(self, y: float, data):
+        if self.publisher is not None:
+            self.publisher.update({self.db_vts_mouth_param: y})
+            return
         self.vts.set_single_param(VTSParameterData(self.db_vts_mouth_param, y))
 
     def __vowel_callback(self, vowel_dict: dict, data):
+        if self.publisher is not None:
+            self.publisher.update({self.vowel_vts_mouth_param[k]: v for k, v in vowel_dict.items()})
+            return
         params = [VTSParameterData(self.vowel_vts_mouth_param[k], v) for k, v in vowel_dict.items()]
         self.vts.set_params(params)
 
+    def __callback(self, track: LipSyncTrack | None):
+        # 使用轨道时按轨道的类型发送参数, 否则按分析仪的类型
+        if track is not None:
+            return self.__vowel_callback if track.kind == 'vowel' else self.__db_callback
+        if isinstance(self.analyser, DBAnalyser):
+            return self.__db_callback
+        if isinstance(self.analyser, VowelAnalyser):
+            return self.__vowel_callback
+        return None
+
+    def interrupt(self):
+        """立即中断正在播放的语音, 口型闭合. 见 Analyser.interrupt"""
+        self.analyser.interrupt()
+
+    def open_session(self, output_device: int, samplerate: int = 44100, channels: int = 1) -> PlaybackSession:
+        """
+        打开常驻的播放会话(见 Analyser.open_session), 输出设备只打开一次, 之后用 session.play(audio) 提交的语音无缝连续播放.
+        :param output_device: 输出设备Index
+        :param samplerate: 输出流的采样率, 采样率不同的语音会先重采样
+        :param channels: 输出流的声道数
+        """
+        return self.analyser.open_session(output_device, samplerate, self.__callback(None), channels)
+
     def action(self,
-               audio: np.ndarray | str | sf.SoundFile,
+               audio: AudioInput,
                samplerate: int | float,
                output_device: int,
                finished_callback=None,
                interrupt_listening=None,
-               auto_play: bool = True):
+               auto_play: bool = True,
+               track: LipSyncTrack | str | None = None):
 
         """
         启动分析器开始分析音频数据, 注意:此方法为非阻塞方法,会立即返回
-        :param audio: 音频数据, 可以是文件path, 可以是SoundFile对象, 也可以是ndarray
+        :param audio: 音频数据, 可以是文件path, 可以是SoundFile对象, 可以是ndarray,
+            也可以是PCM块的同步或异步迭代器(例如流式TTS的输出), 第一块到达后立即开始播放
         :param samplerate: 采样率, 这取决与音频数据的采样率, 如果你无法获取到音频数据的采样率, 可以尝试输出设备的采样率.
         :param output_device: 输出设备Index, 这取决与硬件或虚拟设备. 可用 audio_devices_utils.py 打印当前系统音频设备信息
         :param finished_callback: 音频处理完成后,会回调这个方法
         :param auto_play: 是否自动播放音频,默认为True,会播放音频(自动将audio写入指定`output_device`)
+        :param track: 预先生成的口型轨道或轨道文件路径(见 pymouth.track.bake). 指定后播放时不做任何分析, 直接按轨道发送参数
+        :return: 是否开始处理. 分析仪既不是 DBAnalyser 也不是 VowelAnalyser 时不处理, finished_callback 也不会被调用
         """
-
-        if isinstance(self.analyser, DBAnalyser):
-            self.analyser.action_noblock(audio,
-                                         samplerate,
-                                         output_device,
-                                         self.__db_callback,
-                                         finished_callback,
-                                         interrupt_listening,
-                                         auto_play,
-                                         block_size=4096)
-        elif isinstance(self.analyser, VowelAnalyser):
-            self.analyser.action_noblock(audio,
-                                         samplerate,
-                                         output_device,
-                                         self.__vowel_callback,
-                                         finished_callback,
-                                         interrupt_listening,
-                                         auto_play,
-                                         block_size=4096)
+        if isinstance(track, str):
+            track = LipSyncTrack.load(track)
+        callback = self.__callback(track)
+        if callback is None:
+            return False
+        self.analyser.action_noblock(audio,
+                                     samplerate,
+                                     output_device,
+                                     callback,
+                                     finished_callback,
+                                     interrupt_listening,
+                                     auto_play,
+                                     block_size=4096,
+                                     track=track)
+        return True
 
     def action_block(self,
-                     audio: np.ndarray | str | sf.SoundFile,
+                     audio: AudioInput,
                      samplerate: int | float,
                      output_device: int,
                      finished_callback=None,
                      interrupt_listening=None,
-                     auto_play: bool = True):
+                     auto_play: bool = True,
+                     track: LipSyncTrack | str | None = None):
+        if isinstance(track, str):
+            track = LipSyncTrack.load(track)
+        callback = self.__callback(track)
+        if callback is None:
+            return
+        self.analyser.action_block(audio,
+                                   samplerate,
+                                   output_device,
+                                   callback,
+                                   finished_callback,
+                                   interrupt_listening,
+                                   auto_play,
+                                   block_size=4096,
+                                   track=track)
 
-        if isinstance(self.analyser, DBAnalyser):
-            self.analyser.action_block(audio,
-                                       samplerate,
-                                       output_device,
-                                       self.__db_callback,
-                                       finished_callback,
-                                       interrupt_listening,
-                                       auto_play,
-                                       block_size=4096)
-        elif isinstance(self.analyser, VowelAnalyser):
-            self.analyser.action_block(audio,
-                                       samplerate,
-                                       output_device,
-                                       self.__vowel_callback,
-                                       finished_callback,
-                                       interrupt_listening,
-                                       auto_play,
-                                       block_size=4096)
+
+class AsyncVTSAdapter(VTSAdapter):
+    def __init__(self,
+                 analyser: Analyser,
+                 db_vts_mouth_param: str = 'MouthOpen',
+                 vowel_vts_mouth_param: dict[str, str] = None,
+                 ws_uri: str = 'ws://localhost:8001',
+                 plugin_info: VTSPluginInfo = VTSPluginInfo(plugin_name='pymouth',
+                                                            developer='organics',
+                                                            authentication_token_path='./pymouth_vts_token.txt',
+                                                            plugin_icon=None),
+                 publish_rate: float | None = None,
+                 publish_epsilon: float = 0.01,
+                 metrics: Metrics | None = None
+                 ):
+        """
+        asyncio版本的 VTubeStudio Adapter, 参数与 VTSAdapter 相同.
+        口型参数通过 AsyncVTSWebSocket 发送, 不等待VTS响应, 分析线程不会因为网络往返而阻塞.
+        需要在 `async with` 中使用.
+        """
+        super().__init__(analyser, db_vts_mouth_param, vowel_vts_mouth_param, ws_uri, plugin_info,
+                         publish_rate, publish_epsilon, metrics)
+        self.vts = AsyncVTSWebSocket(ws_uri, plugin_info, metrics=metrics)
+
+    def __enter__(self):
+        raise TypeError('Use "async with" for AsyncVTSAdapter')
+
+    async def __aenter__(self):
+        if self.vts.client is None:
+            await self.vts.connect()
+        if self.publisher is not None:
+            self.publisher.start()
+        return self
+
+    async def warmup(self, samplerate: int | float = 44100, output_device: int | None = None, channels: int = 1):
+        """
+        与 VTSAdapter.warmup 相同, 分析仪的预热在线程中执行, 不阻塞事件循环
+        """
+        await asyncio.to_thread(self.analyser.warmup, samplerate, 4096, output_device, channels)
+        if self.vts.client is None:
+            await self.vts.connect()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.publisher is not None:
+            self.publisher.stop()
+        await self.vts.close()
+
+    async def action_block(self,
+                           audio: AudioInput,
+                           samplerate: int | float,
+                           output_device: int,
+                           finished_callback=None,
+                           interrupt_listening=None,
+                           auto_play: bool = True,
+                           track: LipSyncTrack | str | None = None):
+        """
+        与 VTSAdapter.action_block 相同, 但不会阻塞事件循环, 音频处理完毕后返回
+        """
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def on_finished():
+            # finished_callback 抛出异常时也要结束等待
+            try:
+                if finished_callback is not None:
+                    finished_callback()
+            finally:
+                loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+
+        if not self.action(audio, samplerate, output_device, on_finished, interrupt_listening, auto_play, track):
+            # 与 VTSAdapter.action_block 相同, 不支持的分析仪不做任何处理
+            return
+        await finished
@@ -1,12 +1,32 @@
+import asyncio
+import functools
+import threading
+import time
 import traceback
 from abc import ABCMeta
-from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterable, TYPE_CHECKING
+from concurrent.futures import Executor, ThreadPoolExecutor
 
-import librosa
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
-from dtw import dtw
+
+from .audio_source import AudioInput, open_audio, iter_async, split_list_by_n, convert, ReadAhead
+from .cache import AnalysisCache
+from .dtw_engine import warmup as dtw_warmup
+from .features import StreamingMFCC, BlockMFCC, HOP_LENGTH, get_plan, analysis_hop
+from .metrics import Metrics, NULL_TIMER
+from .playback import CallbackPlayer, AnalysisWorker, PresentationScheduler, CALLBACK_FRAMES
+from .resample import Resampler, get_resampler
+from .templates import TemplateBank, VOWELS
+
+# 近似剪枝时, 被跳过的元音的概率不超过最可能元音的这个比例
+PRUNING_TOLERANCE = 1e-3
+# 播放时轮询 interrupt_listening 的间隔(秒)
+INTERRUPT_POLL = 0.005
+
+if TYPE_CHECKING:
+    import sounddevice as sd
+    from .session import PlaybackSession
+    from .track import LipSyncTrack
 
 
 class Analyser(metaclass=ABCMeta):
@@ -65,9 +85,102 @@ class Analyser(metaclass=ABCMeta):
                  [80.5309, 6.884417],
                  [71.37026, 22.482405]]
 
-    def __init__(self, temperature: float = 10.0):
+    def __init__(self,
+                 temperature: float = 10.0,
+                 streaming: bool = False,
+                 callback_playback: bool = False,
+                 lookahead: int = 0,
+                 metrics: Metrics | None = None,
+                 cache: AnalysisCache | None = None,
+                 templates: TemplateBank | str | None = None,
+                 pruning: str | None = 'exact',
+                 analysis_rate: int | None = None,
+                 reuse_buffers: bool = False,
+                 read_ahead: int = 0,
+                 memory_map: bool = False):
+        """
+        :param temperature: softmax温度, 值越大口型越平滑, 不可<=0
+        :param streaming: 是否使用流式MFCC. 开启后同一次播放中块与块之间的帧会被保留,
+            每块只计算新增的帧, 过短的尾块也不会被直接当作无声处理
+        :param callback_playback: 是否使用回调播放. 开启后音频由 sounddevice 回调从环形缓冲区读取,
+            分析和callback在独立线程中执行, 分析或发送参数变慢不会导致音频欠载
+        :param lookahead: 预先分析的块数. 大于0时使用回调播放, 提前 lookahead 块分析音频,
+            并在这块音频真正被听到时(根据输出设备报告的延迟)才调用callback, 口型与声音对齐
+        :param metrics: 热路径统计, 记录各阶段耗时、队列深度和丢弃/迟到的块数. 默认为None, 不统计
+        :param cache: 分析结果缓存. 相同内容的音频块(流式时为相同的前缀)直接返回缓存的结果, 跳过MFCC和DTW.
+            可以在多个分析器之间共享. 默认为None, 不缓存
+        :param templates: 元音模板库, 或 TemplateBank.save 保存的文件路径. 默认为内置的模板(V_A ... V_Silence)
+        :param pruning: 模板较多时的DTW剪枝. 'exact': 用下界和提前终止跳过不可能是最小值的模板, 结果与不剪枝完全相同;
+            'approximate': 另外跳过概率不超过最可能元音 PRUNING_TOLERANCE 倍的元音; None: 计算所有模板
+        :param analysis_rate: 分析采样率. 音频先用多相滤波器重采样到这个采样率再计算MFCC, 与播放的采样率无关,
+            例如 16000 只分析语音频带. 帧移按时间换算, 每块的帧数不变. 模板必须按相同的采样率生成
+            (TemplateBank.from_recording(analysis_rate=...)), 采样率不同时抛出 ValueError.
+            默认使用模板库的采样率, 内置模板按原始采样率分析, 不能与 analysis_rate 一起使用.
+            注意重采样会增加每块的计算量(22050 / 44100 的音频分析到 16000 时比直接分析慢约四成),
+            这个参数只用于让同一套模板适用于不同采样率的音频, 不能节省CPU
+        :param reuse_buffers: 复用每次播放会话中的缓冲区: 文件直接读入预分配的块缓冲区, 格式转换和流式MFCC的中间结果
+            写入会话的工作区, 长时间的流式会话中每块几乎不再分配内存. 开启后 callback 收到的 data 只在回调期间有效,
+            需要保留时请复制
+        :param read_ahead: 文件输入时在后台线程中预先读取的块数, 读取和解码变慢不会阻塞播放. 默认为0, 在播放线程中读取.
+            预读跟不上播放的次数记录在 metrics 的 read_stalls 计数器中
+        :param memory_map: PCM WAV 文件不经过解码, 直接映射到内存(见 audio_source.map_wav), 几个小时的文件也能立即打开.
+            callback 收到的 data 是映射的视图, 只要还有引用, 文件就保持映射, Windows 上在此期间不能删除文件.
+            默认为False, 由 soundfile 读取
+        """
+        if lookahead < 0:
+            raise ValueError("Lookahead must not be negative")
+        if read_ahead < 0:
+            raise ValueError("Read ahead must not be negative")
+        if pruning not in (None, 'exact', 'approximate'):
+            raise ValueError(f'Unknown pruning mode: {pruning}')
         self.executor = ThreadPoolExecutor(1)
         self.temperature = temperature
+        self.pruning = pruning
+        self.streaming = streaming
+        self.callback_playback = callback_playback
+        self.lookahead = lookahead
+        # 共享的分析线程池, 为None时在播放线程或独立线程中分析. 见 LipSyncEngine
+        self.analysis_executor: Executor | None = None
+        # 回调播放时累计的欠载次数, 以及环形缓冲区溢出和分析积压被丢弃的块数
+        self.underflow_count = 0
+        self.overflow_count = 0
+        # 发布时已经晚于声音的结果数
+        self.late_count = 0
+        self.metrics = metrics
+        self.cache = cache
+        self.mfcc_stream: StreamingMFCC | None = None
+        # 流式会话中, 上一块的缓存键, 以及命中缓存后还没有输入 mfcc_stream 的块(只保留重建状态需要的最后几块)
+        self._cache_chain = b''
+        self._cache_pending: list[np.ndarray] = []
+        self._cache_pending_size = 0
+        # 已经输入 mfcc_stream 的样本数, 以及在它之后被丢弃、没有输入的样本数
+        self._stream_position = 0
+        self._cache_dropped = 0
+        if templates is None:
+            templates = default_templates()
+        elif isinstance(templates, str):
+            templates = TemplateBank.load(templates)
+        if analysis_rate is None:
+            analysis_rate = templates.samplerate
+        elif analysis_rate <= 0:
+            raise ValueError("Analysis rate must be positive")
+        elif templates.samplerate != analysis_rate:
+            # 内置模板(samplerate 为None)是按原始采样率计算的, 也不能用于其他分析采样率
+            raise ValueError(f'Templates were computed at {templates.samplerate or "the source samplerate"}, '
+                             f'not {analysis_rate}')
+        self.templates = templates
+        self.analysis_rate = analysis_rate
+        self.reuse_buffers = reuse_buffers
+        self.read_ahead = read_ahead
+        self.memory_map = memory_map
+        # reuse_buffers 时单声道 float32 转换的工作区
+        self._mono: np.ndarray | None = None
+        # 流式会话的重采样器, 保留块与块之间的滤波器状态
+        self.resampler: Resampler | None = None
+        # 正在进行的 action 的中断标记和回调播放器, 见 interrupt
+        self._cancel: threading.Event | None = None
+        self._player: CallbackPlayer | None = None
+        self._interrupted_at = 0.0
 
     def __enter__(self):
         return self
@@ -76,7 +189,7 @@ class Analyser(metaclass=ABCMeta):
         pass
 
     def action_noblock(self,
-                       audio: np.ndarray | str | sf.SoundFile,
+                       audio: AudioInput,
                        samplerate: int | float,
                        output_device: int,
                        callback,
@@ -84,8 +197,15 @@ class Analyser(metaclass=ABCMeta):
                        interrupt_listening=None,
                        auto_play: bool = True,
                        dtype: np.dtype = np.float32,
-                       block_size: int = 4096):
+                       block_size: int = 4096,
+                       track: 'LipSyncTrack | None' = None):
 
+        if isinstance(audio, AsyncIterable):
+            # 异步迭代器属于调用者的事件循环, 分析线程通过这个循环取数据
+            try:
+                audio = iter_async(audio, asyncio.get_running_loop())
+            except RuntimeError:
+                pass
         self.executor.submit(self.action_block,
                              *(audio,
                                samplerate,
@@ -95,10 +215,11 @@ class Analyser(metaclass=ABCMeta):
                                interrupt_listening,
                                auto_play,
                                dtype,
-                               block_size))
+                               block_size,
+                               track))
 
     def action_block(self,
-                     audio: np.ndarray | str | sf.SoundFile,
+                     audio: AudioInput,
                      samplerate: int | float,
                      output_device: int,
                      callback,
@@ -106,81 +227,545 @@ class Analyser(metaclass=ABCMeta):
                      interrupt_listening=None,
                      auto_play: bool = True,
                      dtype: np.dtype = np.float32,
-                     block_size: int = 4096):
-
+                     block_size: int = 4096,
+                     track: 'LipSyncTrack | None' = None):
+        """
+        :param callback: callback(result, data), 每块音频调用一次. 被中断时最后以无声的结果(见 silence)
+            和一块全0的数据(block_size 帧, 声道数与音频相同)再调用一次
+        :param interrupt_listening: 返回True时中断. 播放时只在后台的轮询线程中每 INTERRUPT_POLL 秒调用一次,
+            不播放(auto_play=False)时在每块之前调用, 不会被两个线程同时调用
+        :param track: 预先生成的口型轨道(见 track.bake). 指定后只播放音频并按播放位置查表, 不做任何分析
+        """
+        source = None
         stream = None
+        player = None
+        worker = None
+        scheduler = None
+        interrupted = False
+        # 中断标记, interrupt 或 interrupt_listening 设置
+        cancel = self._cancel = threading.Event()
+        done = threading.Event()
+
+        # 播放时在后台轮询, 一块音频写完之前也能中断. 这时播放线程只检查中断标记, interrupt_listening 只在一个线程中调用
+        watching = auto_play and interrupt_listening is not None
+
+        def check() -> bool:
+            if not watching and interrupt_listening is not None and not cancel.is_set() and interrupt_listening():
+                self._interrupt(cancel)
+            return cancel.is_set()
+
+        if watching:
+            threading.Thread(target=self._watch, args=(interrupt_listening, cancel, done), daemon=True).start()
         try:
-            if isinstance(audio, np.ndarray):
-                # 声道验证
-                if audio.ndim <= 0 or audio.ndim > 2:
-                    raise ValueError('Audio channel verification failed. Only single or dual channels are supported.')
-
-                stream = sd.OutputStream(samplerate=samplerate,
-                                         blocksize=block_size,
-                                         device=output_device,
-                                         channels=audio.ndim,  # if data.shape[1] != channels:
-                                         dtype=dtype).__enter__() if auto_play else None
-
-                datas = split_list_by_n(audio, block_size)
-                for data in datas:
-                    if interrupt_listening is not None and interrupt_listening():
-                        break
-                    self.play(callback, data, samplerate, stream)
+            with open_audio(audio, samplerate, block_size, dtype, reuse_buffers=self.reuse_buffers,
+                            read_ahead=self.read_ahead, memory_map=self.memory_map) as source:
+                # 文件输入时以文件的采样率为准, 分析和播放都使用音频真实的采样率
+                samplerate = source.samplerate
+                self._begin_session(samplerate, block_size)
+                metrics = self.metrics
+                blocks = source if metrics is None else metrics.timed_blocks(source, samplerate)
+
+                if track is None:
+                    def analyse(frame, d):
+                        return self.process(d, samplerate)
+                else:
+                    def analyse(frame, d):
+                        return track.at(frame / source.samplerate)
 
-            elif isinstance(audio, str):
-                with sf.SoundFile(audio) as f:
-                    stream = sd.OutputStream(samplerate=f.samplerate,
+                if auto_play and (self.callback_playback or self.lookahead):
+                    # 音频回调只从环形缓冲区取数据, 分析和回调在独立线程中执行, 播放永远不会等待分析
+                    player = CallbackPlayer(source.samplerate, source.channels, output_device, dtype, block_size,
+                                            buffer_blocks=self.lookahead + 1 if self.lookahead else 4,
+                                            # 流式输入第一块到达就开始播放, 剩余的缓冲区用来吸收到达时间的抖动
+                                            prebuffer_blocks=1 if source.live else None)
+                    self._player = player
+                    # 每块同时交给分析线程和环形缓冲区, 两边都用完后才放回缓冲区池,
+                    # 否则分析先完成时, 还在写入环形缓冲区的块可能已经被读取线程覆盖
+                    release_lock = threading.Lock()
+
+                    def release(d, users):
+                        # users: 这块还没有用完的一方的数量, 两边共享的计数
+                        with release_lock:
+                            users[0] -= 1
+                            if users[0]:
+                                return
+                        source.release(d)
+
+                    if self.lookahead:
+                        # 提前分析, 等这块音频被听到时再发布结果
+                        scheduler = PresentationScheduler(player.presentation_time)
+
+                        def publish(res, d, users):
+                            with self._time('callback'):
+                                callback(res, d)
+                            release(d, users)
+
+                        def handler(item):
+                            frame, d, users = item
+                            with self._time('process'):
+                                res = analyse(frame, d)
+                            scheduler.submit(frame, lambda: publish(res, d, users))
+                    else:
+                        def handler(item):
+                            frame, d, users = item
+                            with self._time('process'):
+                                res = analyse(frame, d)
+                            with self._time('callback'):
+                                callback(res, d)
+                            release(d, users)
+
+                    worker = AnalysisWorker(handler, executor=self.analysis_executor)
+                    for data in blocks:
+                        if check():
+                            player.fade_out()
+                            break
+                        users = [2]
+                        worker.submit((player.ring.write_index, data, users))
+                        with self._time('write'):
+                            written = player.write(data)
+                        # 已经复制到环形缓冲区
+                        release(data, users)
+                        if metrics is not None:
+                            metrics.set_gauge('analysis_queue_depth', worker.pending())
+                            metrics.set_gauge('playback_buffer_frames', player.ring.available())
+                            if scheduler is not None:
+                                metrics.set_gauge('presentation_queue_depth', scheduler.queue.qsize())
+                        if not written:
+                            break
+                    player.drain()
+                    return
+
+                if auto_play:
+                    # 只在需要播放时导入, 不播放的部署不需要 PortAudio
+                    import sounddevice as sd
+                    stream = sd.OutputStream(samplerate=source.samplerate,
                                              blocksize=block_size,
                                              device=output_device,
-                                             channels=f.channels,
-                                             dtype=dtype).__enter__() if auto_play else None
-                    while True:
-                        if interrupt_listening is not None and interrupt_listening():
+                                             channels=source.channels,  # if data.shape[1] != channels:
+                                             dtype=dtype).__enter__()
+
+                if self.analysis_executor is not None:
+                    # 分析在共享线程池中执行. 不播放时等待分析, 不丢弃数据
+                    def handler(item):
+                        frame, d = item
+                        with self._time('process'):
+                            res = analyse(frame, d)
+                        with self._time('callback'):
+                            callback(res, d)
+                        source.release(d)
+
+                    worker = AnalysisWorker(handler, executor=self.analysis_executor)
+                    position = 0
+                    for data in blocks:
+                        if check():
                             break
-                        data = f.read(block_size, dtype=dtype)
-                        if not len(data):
+                        if stream is not None and not self._write(stream, data, cancel):
                             break
-                        self.play(callback, data, samplerate, stream)
-
-            elif isinstance(audio, sf.SoundFile):
-                stream = sd.OutputStream(samplerate=audio.samplerate,
-                                         blocksize=block_size,
-                                         device=output_device,
-                                         channels=audio.channels,
-                                         dtype=dtype).__enter__() if auto_play else None
+                        worker.submit((position, data), block=stream is None)
+                        position += len(data)
+                        if metrics is not None:
+                            metrics.set_gauge('analysis_queue_depth', worker.pending())
+                    return
 
-                while True:
-                    if interrupt_listening is not None and interrupt_listening():
-                        break
-                    data = audio.read(block_size, dtype=dtype)
-                    if not len(data):
+                process = None
+                if track is not None:
+                    from .track import TrackCursor
+                    process = TrackCursor(track, source.samplerate)
+                for data in blocks:
+                    if check():
                         break
-                    self.play(callback, data, samplerate, stream)
+                    self.play(callback, data, samplerate, stream, process, cancel)
+                    source.release(data)
 
         except Exception:
             traceback.print_exc()
         finally:
+            done.set()
+            interrupted = cancel.is_set()
             if stream is not None:
+                if interrupted:
+                    # 丢弃输出设备中还没有播放的音频
+                    stream.abort()
                 stream.__exit__()
+            if source is not None and isinstance(source.blocks, ReadAhead):
+                self._count('read_stalls', source.blocks.stall_count)
+            if worker is not None:
+                worker.join(discard=interrupted)
+                self.overflow_count += worker.dropped_count
+                self._count('dropped_blocks', worker.dropped_count)
+            if scheduler is not None:
+                scheduler.join(discard=interrupted)
+                self.late_count += scheduler.late_count
+                self._count('late_blocks', scheduler.late_count)
+            if player is not None:
+                player.close()
+                self.underflow_count += player.underflow_count
+                self.overflow_count += player.overflow_count
+                self._count('underflows', player.underflow_count)
+                self._count('dropped_blocks', player.overflow_count)
+            self.mfcc_stream = None
+            self.resampler = None
+            self._cache_pending = []
+            if interrupted:
+                # 之前的结果都已经丢弃或发布完, 最后把口型设为无声
+                try:
+                    channels = 1 if source is None else source.channels
+                    callback(self.silence(track), np.zeros(block_size if channels == 1 else (block_size, channels),
+                                                            dtype=dtype))
+                except Exception:
+                    traceback.print_exc()
+                if self.metrics is not None:
+                    self.metrics.observe('interrupt', time.perf_counter() - self._interrupted_at)
+                    if player is not None and player.interrupt_latency is not None:
+                        self.metrics.observe('interrupt_audio', player.interrupt_latency)
+            self._player = None
+            if self._cancel is cancel:
+                self._cancel = None
 
             if finished_callback is not None:
                 finished_callback()
 
-    def play(self, callback, data: np.ndarray, samplerate: int | float, stream: sd.OutputStream):
-        if stream is not None:
-            stream.write(data)
-        callback(self.process(data, samplerate), data)
+    def interrupt(self):
+        """
+        立即中断正在进行的 action, 可以在任何线程中调用. 与 interrupt_listening 返回True时相同:
+        回调播放(callback_playback / lookahead)时在下一次音频回调(最多 CALLBACK_FRAMES 帧之后)淡出并停止,
+        同步播放(默认)时在当前的小段写完后丢弃输出设备中缓冲的音频, 没有淡出, 波形直接截断, 可能有轻微的爆音;
+        需要淡出时请使用 callback_playback=True, lookahead 或播放会话(open_session). 还没有发布的分析结果被丢弃,
+        然后以无声的结果(见 silence)调用一次 callback, 口型立即闭合.
+        没有正在进行的 action 时什么都不做
+        """
+        self._interrupt(self._cancel)
+
+    def _interrupt(self, cancel: threading.Event | None):
+        # 只中断 cancel 所属的那次 action, 轮询线程不会误中断之后开始的 action
+        if cancel is None or cancel.is_set() or cancel is not self._cancel:
+            return
+        self._interrupted_at = time.perf_counter()
+        cancel.set()
+        player = self._player
+        if player is not None:
+            player.fade_out()
+
+    def _watch(self, interrupt_listening, cancel: threading.Event, done: threading.Event):
+        # 在块的中间也检查中断, 不需要等这一块写完
+        while not done.wait(INTERRUPT_POLL):
+            try:
+                if interrupt_listening():
+                    self._interrupt(cancel)
+                    return
+            except Exception:
+                traceback.print_exc()
+                return
+
+    def silence(self, track: 'LipSyncTrack | None' = None):
+        """
+        无声时的结果, 中断时用来闭合口型. 与 process 的返回值格式相同
+        :param track: 使用口型轨道时按轨道的类型
+        """
+        if track is not None and track.kind == 'db':
+            return 0.0
+        return dict(zip(VOWELS, [1.0, 0.0, 0.0, 0.0, 0.0, 0.0]))
+
+    def open_session(self,
+                     output_device: int | None,
+                     samplerate: int,
+                     callback,
+                     channels: int = 1,
+                     dtype: np.dtype = np.float32,
+                     block_size: int = 4096) -> 'PlaybackSession':
+        """
+        打开常驻的播放会话: 输出流只打开一次, 之后用 session.play(audio) 提交的语音排队无缝播放,
+        口型状态在句子之间延续. 参数见 PlaybackSession
+        """
+        from .session import PlaybackSession
+        return PlaybackSession(self, output_device, samplerate, callback, channels, dtype, block_size,
+                               buffer_blocks=self.lookahead + 1 if self.lookahead else 4)
+
+    def warmup(self,
+               samplerate: int | float,
+               block_size: int = 4096,
+               output_device: int | None = None,
+               channels: int = 1,
+               dtype: np.dtype = np.float32):
+        """
+        预热. 第一次分析时才会发生的准备工作都在这里提前完成, 避免第一句话的口型滞后:
+        加载或编译DTW内核(编译结果缓存在磁盘上, 之后的进程启动时直接加载), 创建MFCC计划,
+        启动分析线程, 用一块噪声走一遍完整的分析流程, 以及初始化 PortAudio 并试打开一次输出设备(加载驱动).
+        输出流打开后立即关闭, 不会保持打开, 之后的 action 仍会重新打开设备; 需要常开的输出流请使用 open_session.
+        分析器的状态(流式MFCC, 包络等)在预热后恢复原状. 参数应与之后调用 action 时相同.
+        :param samplerate: 采样率
+        :param block_size: 块大小
+        :param output_device: 输出设备Index, 为None时不预热音频设备
+        :param channels: 声道数, 仅用于打开输出设备
+        :param dtype: 数据类型, 仅用于打开输出设备
+        """
+        self._warmup_kernels()
+        self.executor.submit(lambda: None).result()
+
+        # 预热的耗时不计入统计, 噪声的结果也不写入缓存
+        metrics, self.metrics = self.metrics, None
+        cache, self.cache = self.cache, None
+        try:
+            self._begin_session(samplerate, block_size)
+            block = np.random.default_rng(0).uniform(-0.5, 0.5, block_size).astype(np.float32)
+            self.process(block, samplerate)
+        finally:
+            # 清除噪声留下的状态(例如 RMSAnalyser 的包络), 之后直接调用 process 时从闭嘴开始
+            self._begin_session(samplerate, block_size)
+            self.mfcc_stream = None
+            self.resampler = None
+            self.metrics = metrics
+            self.cache = cache
+
+        if output_device is not None:
+            import sounddevice as sd
+            with sd.OutputStream(samplerate=samplerate,
+                                 blocksize=block_size,
+                                 device=output_device,
+                                 channels=channels,
+                                 dtype=dtype):
+                pass
+
+    def analyse(self,
+                audio: AudioInput,
+                samplerate: int | float,
+                hop: int = 4096,
+                chunk_seconds: float = 60.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        离线分析整段音频, 不播放, 不回调.
+        每 hop 个样本输出一行结果, 与 streaming=True 时 action_block(block_size=hop) 逐块回调的结果相同,
+        但一段音频只做一次STFT, 所有块一起与模板库比较, 远快于实时.
+        :param audio: 音频数据, 与 action_block 相同
+        :param samplerate: 采样率, 文件输入时以文件的采样率为准
+        :param hop: 每行结果对应的样本数
+        :param chunk_seconds: 长音频分段处理, 每段的时长(秒). 内存占用只与这个值有关, 与音频总时长无关
+        :return: (results, timestamps)
+            results: 每块一行, 与 process 的返回值对应. VowelAnalyser 为 (T, 6), 列顺序见 VOWELS; DBAnalyser 为 (T,)
+            timestamps: shape (T,), 每块开始的时间(秒)
+        """
+        return self._analyse_vowels(audio, samplerate, hop, chunk_seconds)
+
+    def _analyse_vowels(self, audio: AudioInput, samplerate: int | float, hop: int,
+                        chunk_seconds: float) -> tuple[np.ndarray, np.ndarray]:
+        templates = self.templates
+        min_frames = templates.length
+        chunk = hop * max(1, int(chunk_seconds * samplerate / hop))
+        results = []
+        with open_audio(audio, samplerate, chunk) as source:
+            samplerate = source.samplerate
+            rate = self._rate(samplerate)
+            if rate == samplerate:
+                resampler = None
+                block_mfcc = BlockMFCC(samplerate, get_n_fft(hop, samplerate), hop, context=min_frames)
+            else:
+                # 与流式分析相同的连续重采样, 每块的样本数由重采样器累计输出的样本数决定
+                resampler = Resampler(samplerate, rate)
+                block_mfcc = BlockMFCC(rate, get_n_fft(resampler.output_count(hop), rate), hop, context=min_frames,
+                                       hop_length=analysis_hop(samplerate, rate))
+            consumed = 0
+            for data in source:
+                data = channel_conversion(data)
+                if resampler is None:
+                    mfccs, ends, counts = block_mfcc.push(data)
+                else:
+                    block_ends = [resampler.output_count(consumed + min(i + hop, len(data)))
+                                  for i in range(0, len(data), hop)]
+                    mfccs, ends, counts = block_mfcc.push(resampler.push(data), np.array(block_ends))
+                consumed += len(data)
+
+                # 与流式分析相同: 一块的帧数不足模板长度时, 用前面的帧补足
+                lengths = np.minimum(ends, np.maximum(counts, min_frames))
+                scores = np.zeros((ends.size, len(VOWELS)))
+                # 过短的音频会导致无法比较，直接按无声处理
+                scores[:, 0] = 1
+                for m in np.unique(lengths[lengths >= 5]):
+                    idx = np.flatnonzero(lengths == m)
+                    queries = mfccs[(ends[idx] - m)[:, None] + np.arange(m)]
+                    distances = self._distances(queries)
+                    scores[idx] = softmax(-distances, temperature=self.temperature, axis=1)
+                results.append(scores)
+
+        scores = np.concatenate(results) if results else np.empty((0, len(VOWELS)))
+        return scores, np.arange(scores.shape[0]) * hop / samplerate
+
+    def _begin_session(self, samplerate: int | float, block_size: int):
+        rate = self._rate(samplerate)
+        self.resampler = None
+        if not self.streaming:
+            self.mfcc_stream = None
+        elif rate == samplerate:
+            self.mfcc_stream = StreamingMFCC(samplerate, get_n_fft(block_size, samplerate),
+                                             reuse_buffers=self.reuse_buffers)
+        else:
+            self.resampler = Resampler(samplerate, rate)
+            self.mfcc_stream = StreamingMFCC(rate, get_n_fft(self.resampler.output_count(block_size), rate),
+                                             analysis_hop(samplerate, rate), reuse_buffers=self.reuse_buffers)
+        self._cache_pending = []
+        self._cache_pending_size = 0
+        self._stream_position = 0
+        self._cache_dropped = 0
+        if self.mfcc_stream is not None:
+            self._cache_chain = AnalysisCache.key('streaming', self.temperature, samplerate, self.mfcc_stream.plan.n_fft,
+                                                  self.templates.fingerprint, self.pruning == 'approximate', rate)
+
+    def _rate(self, samplerate: int | float) -> int | float:
+        return samplerate if self.analysis_rate is None else self.analysis_rate
+
+    def _stream_mfcc(self, audio_data: np.ndarray) -> np.ndarray:
+        self._stream_position += len(audio_data)
+        if self.resampler is not None:
+            with self._time('resample'):
+                audio_data = self.resampler.push(audio_data)
+        with self._time('mfcc'):
+            return self.mfcc_stream.push(audio_data, min_frames=self.templates.length)
+
+    def _warmup_kernels(self):
+        """
+        加载或编译这个分析器会用到的DTW内核
+        """
+        # 只加载这个模板库和剪枝方式会用到的内核
+        dtw_warmup(pruned=self.templates.uses_pruning(*self._pruning_args()))
+
+    def _pruning_args(self) -> tuple[bool, float]:
+        """
+        :return: TemplateBank.distances 的 prune 和 margin
+        """
+        if self.pruning == 'approximate':
+            # 距离比最小距离大 margin 时, softmax 后的概率不超过最大概率的 PRUNING_TOLERANCE 倍
+            return True, self.temperature * np.log(1 / PRUNING_TOLERANCE)
+        return self.pruning is not None, np.inf
+
+    def _distances(self, query: np.ndarray) -> np.ndarray:
+        prune, margin = self._pruning_args()
+        return self.templates.distances(query, prune=prune, margin=margin)
+
+    def _cache_key(self, audio_data: np.ndarray, samplerate: int | float) -> bytes:
+        if self.mfcc_stream is None:
+            return AnalysisCache.key(self.temperature, samplerate, self.templates.fingerprint,
+                                     self.pruning == 'approximate', self._rate(samplerate), audio_data)
+        # 流式分析的结果与之前的块有关, 把上一块的键串进来, 只有从会话开头起内容都相同才会命中
+        self._cache_chain = AnalysisCache.key(self._cache_chain, audio_data)
+        return self._cache_chain
+
+    def play(self, callback, data: np.ndarray, samplerate: int | float, stream: 'sd.OutputStream', process=None,
+             cancel: threading.Event | None = None):
+        """
+        :param process: 代替 self.process 计算结果, 例如 TrackCursor
+        :param cancel: 中断标记, 设置后不再写入这块剩余的部分, 也不再回调
+        """
+        if stream is not None and not self._write(stream, data, cancel):
+            return
+        with self._time('process'):
+            res = (process or self.process)(data, samplerate)
+        with self._time('callback'):
+            callback(res, data)
+
+    def _write(self, stream: 'sd.OutputStream', data: np.ndarray, cancel: threading.Event | None) -> bool:
+        """
+        分成不超过 CALLBACK_FRAMES 帧的小段写入输出流, 每段之前检查中断
+        :return: 是否全部写入
+        """
+        with self._time('write'):
+            for i in range(0, len(data), CALLBACK_FRAMES):
+                if cancel is not None and cancel.is_set():
+                    return False
+                stream.write(data[i:i + CALLBACK_FRAMES])
+        return True
+
+    def _time(self, stage: str):
+        return NULL_TIMER if self.metrics is None else self.metrics.time(stage)
+
+    def _count(self, name: str, value: int):
+        if self.metrics is not None and value:
+            self.metrics.inc(name, value)
 
     def process(self, data: np.ndarray, samplerate: int | float):
         pass
 
+    def _channel_conversion(self, audio_data: np.ndarray) -> np.ndarray:
+        if not self.reuse_buffers:
+            return channel_conversion(audio_data)
+        n = len(audio_data)
+        if self._mono is None or self._mono.size < n:
+            self._mono = np.empty(n, dtype=np.float32)
+        return channel_conversion(audio_data, self._mono[:n])
+
     def _audio2vowel(self, audio_data: np.ndarray, samplerate: int | float) -> dict[str, float]:
-        audio_data = channel_conversion(audio_data)
+        audio_data = self._channel_conversion(audio_data)
+
+        key = None
+        if self.cache is not None:
+            key = self._cache_key(audio_data, samplerate)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count('cache_hits', 1)
+                if self.mfcc_stream is not None:
+                    # 暂时不计算这块的帧, 之后的块未命中时再补上, 整句命中时完全不需要计算
+                    self._defer(audio_data)
+                return dict(zip(VOWELS, cached.tolist()))
+            self._count('cache_misses', 1)
+            if self._cache_pending:
+                self._catch_up()
+        res = self._vowel_scores(audio_data, samplerate)
+        if key is not None:
+            self.cache.put(key, [res[k] for k in VOWELS])
+        return res
 
+    def _defer(self, audio_data: np.ndarray):
+        """
+        保存命中缓存的块. 只保留最后 _cache_window 个样本所在的块, 长时间整句命中时内存不会增长:
+        更早的块直接丢弃, 之后从保留的块重建 mfcc_stream 的状态; 重采样时无法从中间重建, 改为立即计算
+        """
+        pending = self._cache_pending
+        pending.append(np.array(audio_data, dtype=np.float32))
+        self._cache_pending_size += pending[-1].size
+        window = self._cache_window()
+        while self._cache_pending_size - pending[0].size >= window:
+            block = pending.pop(0)
+            self._cache_pending_size -= block.size
+            if self.resampler is None:
+                self._cache_dropped += block.size
+            else:
+                self._stream_mfcc(block)
+
+    def _cache_window(self) -> int:
+        # 模板长度的帧, 加上它们之前的重叠部分和重建时开头的0填充
+        plan = self.mfcc_stream.plan
+        return self.templates.length * plan.hop_length + 2 * plan.n_fft
+
+    def _catch_up(self):
+        """把暂时没有计算的块输入 mfcc_stream, 结果与一直逐块计算时相同"""
+        if self._cache_dropped:
+            # 从保留的块重新开始: 先补0, 使帧的位置与从会话开头连续计算时对齐, 最前面几帧不同, 但不会被用到
+            start = self._stream_position + self._cache_dropped
+            self.mfcc_stream.reset()
+            align = start % self.mfcc_stream.plan.hop_length
+            if align:
+                self.mfcc_stream.push(np.zeros(align, dtype=np.float32))
+            self._stream_position = start
+            self._cache_dropped = 0
+        for block in self._cache_pending:
+            self._stream_mfcc(block)
+        self._cache_pending = []
+        self._cache_pending_size = 0
+
+    def _vowel_scores(self, audio_data: np.ndarray, samplerate: int | float) -> dict[str, float]:
         # TODO 这里可能要做人声滤波 , 人声分离比较复杂且耗费性能，暂时不提供支持
         # 对线性声谱图应用mel滤波器后，取log，得到log梅尔声谱图，然后对log滤波能量（log梅尔声谱）做DCT离散余弦变换（傅里叶变换的一种），然后保留第2到第13个系数，得到的这12个系数就是MFCC
-        n_fft = get_n_fft(audio_data.size, samplerate)
-        mfccs = librosa.feature.mfcc(y=audio_data, sr=samplerate, n_fft=n_fft, dct_type=1, n_mfcc=3)[1:].T
+        if self.mfcc_stream is not None:
+            # 流式会话: 只计算这块音频新增的帧, 帧数不足时用上一块的帧补足到模板长度
+            mfccs = self._stream_mfcc(audio_data)
+        else:
+            rate = self._rate(samplerate)
+            hop_length = HOP_LENGTH
+            if rate != samplerate:
+                with self._time('resample'):
+                    audio_data = get_resampler(samplerate, rate).resample(audio_data)
+                hop_length = analysis_hop(samplerate, rate)
+            n_fft = get_n_fft(audio_data.size, rate)
+            with self._time('mfcc'):
+                # 与 librosa.feature.mfcc(y, sr, n_fft=n_fft, dct_type=1, n_mfcc=3)[1:].T 相同, 但只依赖NumPy
+                mfccs = get_plan(rate, n_fft, hop_length).mfcc(audio_data)
         # 过短的音频会导致无法比较，直接按无声处理
         if mfccs.shape[0] < 5:
             return {
@@ -192,19 +777,15 @@ class Analyser(metaclass=ABCMeta):
                 'VoiceO': 0,
             }
 
-        # 通过DTW(动态时间规整算法) 计算 当前帧窗与元音帧窗的距离，值越小越相似
-        si = dtw(self.V_Silence, mfccs, distance_only=True).normalizedDistance
-        a = dtw(self.V_A, mfccs, distance_only=True).normalizedDistance
-        i = dtw(self.V_I, mfccs, distance_only=True).normalizedDistance
-        u = dtw(self.V_U, mfccs, distance_only=True).normalizedDistance
-        e = dtw(self.V_E, mfccs, distance_only=True).normalizedDistance
-        o = dtw(self.V_O, mfccs, distance_only=True).normalizedDistance
+        # 通过DTW(动态时间规整算法) 一次计算 当前帧窗与所有元音帧窗的距离，值越小越相似
+        with self._time('dtw'):
+            distances = self._distances(mfccs)
 
-        # log = f"Silence:{si:f}, A:{a:f}, I:{i:f}, U:{u:f}, E:{e:f}, O:{o:f}"
+        # log = "Silence:{:f}, A:{:f}, I:{:f}, U:{:f}, E:{:f}, O:{:f}".format(*distances)
         # print(log)
         # 对距离取负，值越大越相似，再对相似度进行softmax，取相似度的概率分布。这里 temperature 取大值降低置信度，可以使输出元音的整体概率更平滑，口型更加真实。
-        r = np.array([-1 * i for i in [si, a, i, u, e, o]])
-        r = softmax(r, temperature=self.temperature).tolist()
+        with self._time('softmax'):
+            r = softmax(-distances, temperature=self.temperature).tolist()
         # print([f"{t:f}" for t in r])
 
         res = {
@@ -220,12 +801,54 @@ class Analyser(metaclass=ABCMeta):
 
 
 class DBAnalyser(Analyser):
-    def __init__(self, temperature: float = 10.0):
-        super().__init__(temperature=temperature)
+    def __init__(self,
+                 temperature: float = 10.0,
+                 streaming: bool = False,
+                 callback_playback: bool = False,
+                 lookahead: int = 0,
+                 metrics: Metrics | None = None,
+                 cache: AnalysisCache | None = None,
+                 templates: TemplateBank | str | None = None,
+                 pruning: str | None = 'exact',
+                 analysis_rate: int | None = None,
+                 reuse_buffers: bool = False,
+                 read_ahead: int = 0,
+                 memory_map: bool = False):
+        super().__init__(temperature=temperature,
+                         streaming=streaming,
+                         callback_playback=callback_playback,
+                         lookahead=lookahead,
+                         metrics=metrics,
+                         cache=cache,
+                         templates=templates,
+                         pruning=pruning,
+                         analysis_rate=analysis_rate,
+                         reuse_buffers=reuse_buffers,
+                         read_ahead=read_ahead,
+                         memory_map=memory_map)
 
     def process(self, data: np.ndarray, samplerate: int | float):
         return self._audio2db(data, samplerate)
 
+    def silence(self, track: 'LipSyncTrack | None' = None):
+        if track is not None and track.kind == 'vowel':
+            return super().silence(track)
+        return 0.0
+
+    def analyse(self,
+                audio: AudioInput,
+                samplerate: int | float,
+                hop: int = 4096,
+                chunk_seconds: float = 60.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        离线分析整段音频, 见 Analyser.analyse
+        :return: (results, timestamps), results shape (T,)
+        """
+        scores, timestamps = self._analyse_vowels(audio, samplerate, hop, chunk_seconds)
+        # 与 _audio2db 相同: 最可能的是无声时闭嘴, 否则张开到最大概率
+        top = scores.max(axis=1)
+        return np.where(top != scores[:, 0], top, 0.0), timestamps
+
     def _audio2db(self, audio_data: np.ndarray, samplerate: int | float) -> float:
         res = self._audio2vowel(audio_data, samplerate)
         vs = res['VoiceSilence']
@@ -233,30 +856,137 @@ class DBAnalyser(Analyser):
         return max if max != vs else 0
 
 
+class RMSAnalyser(DBAnalyser):
+    def __init__(self,
+                 attack: float = 0.01,
+                 release: float = 0.15,
+                 noise_floor: float = -50.0,
+                 ceiling: float = -10.0,
+                 callback_playback: bool = False,
+                 lookahead: int = 0,
+                 metrics: Metrics | None = None,
+                 reuse_buffers: bool = False,
+                 read_ahead: int = 0,
+                 memory_map: bool = False):
+        """
+        基于能量(RMS)的分贝分析仪, 不经过MFCC和DTW, 只输出 MouthOpen 所需的一个值.
+        与 DBAnalyser 的用法完全相同, 可以直接交给 VTSAdapter 使用.
+        :param attack: 包络上升时间常数(秒), 越小张嘴越快
+        :param release: 包络下降时间常数(秒), 越小闭嘴越快
+        :param noise_floor: 噪声底(dBFS), 低于这个值视为闭嘴
+        :param ceiling: 满开口对应的响度(dBFS), 高于这个值视为完全张嘴
+        :param callback_playback: 是否使用回调播放, 见 Analyser
+        :param lookahead: 预先分析的块数, 见 Analyser
+        :param metrics: 热路径统计, 见 Analyser
+        :param reuse_buffers: 复用块缓冲区, 见 Analyser
+        :param read_ahead: 文件输入时预先读取的块数, 见 Analyser
+        :param memory_map: PCM WAV 文件映射到内存, 见 Analyser
+        """
+        if attack < 0 or release < 0:
+            raise ValueError("Attack and release must not be negative")
+        if ceiling <= noise_floor:
+            raise ValueError("Ceiling must be greater than noise floor")
+        super().__init__(callback_playback=callback_playback, lookahead=lookahead, metrics=metrics,
+                         reuse_buffers=reuse_buffers, read_ahead=read_ahead, memory_map=memory_map)
+        self.attack = attack
+        self.release = release
+        self.noise_floor = noise_floor
+        self.ceiling = ceiling
+        self.envelope = 0.0
+
+    def _warmup_kernels(self):
+        # 不经过DTW
+        pass
+
+    def _begin_session(self, samplerate: int | float, block_size: int):
+        super()._begin_session(samplerate, block_size)
+        self.envelope = 0.0
+
+    def analyse(self,
+                audio: AudioInput,
+                samplerate: int | float,
+                hop: int = 4096,
+                chunk_seconds: float = 60.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        离线分析整段音频, 见 Analyser.analyse
+        :return: (results, timestamps), results shape (T,)
+        """
+        chunk = hop * max(1, int(chunk_seconds * samplerate / hop))
+        results = []
+        with open_audio(audio, samplerate, chunk) as source:
+            samplerate = source.samplerate
+            self._begin_session(samplerate, hop)
+            for data in source:
+                for i in range(0, len(data), hop):
+                    results.append(self._audio2db(data[i:i + hop], samplerate))
+        self.mfcc_stream = None
+        return np.array(results), np.arange(len(results)) * hop / samplerate
+
+    def _audio2db(self, audio_data: np.ndarray, samplerate: int | float) -> float:
+        audio_data = self._channel_conversion(audio_data)
+        if not audio_data.size:
+            return self.envelope
+
+        x = audio_data.astype(np.float32, copy=False)
+        rms = np.sqrt(np.dot(x, x) / x.size)
+        db = 20 * np.log10(max(float(rms), 1e-10))
+        level = min(max((db - self.noise_floor) / (self.ceiling - self.noise_floor), 0.0), 1.0)
+
+        # 一阶包络, 上升和下降使用不同的时间常数
+        tau = self.attack if level > self.envelope else self.release
+        alpha = 1.0 - float(np.exp(-audio_data.size / samplerate / tau)) if tau > 0 else 1.0
+        self.envelope += alpha * (level - self.envelope)
+        return self.envelope
+
+
 class VowelAnalyser(Analyser):
-    def __init__(self, temperature: float = 10.0):
-        super().__init__(temperature=temperature)
+    def __init__(self,
+                 temperature: float = 10.0,
+                 streaming: bool = False,
+                 callback_playback: bool = False,
+                 lookahead: int = 0,
+                 metrics: Metrics | None = None,
+                 cache: AnalysisCache | None = None,
+                 templates: TemplateBank | str | None = None,
+                 pruning: str | None = 'exact',
+                 analysis_rate: int | None = None,
+                 reuse_buffers: bool = False,
+                 read_ahead: int = 0,
+                 memory_map: bool = False):
+        super().__init__(temperature=temperature,
+                         streaming=streaming,
+                         callback_playback=callback_playback,
+                         lookahead=lookahead,
+                         metrics=metrics,
+                         cache=cache,
+                         templates=templates,
+                         pruning=pruning,
+                         analysis_rate=analysis_rate,
+                         reuse_buffers=reuse_buffers,
+                         read_ahead=read_ahead,
+                         memory_map=memory_map)
 
     def process(self, data: np.ndarray, samplerate: int | float):
         return self._audio2vowel(data, samplerate)
 
 
-def channel_conversion(audio: np.ndarray):
-    # 如果音频数据为立体声，则将其转换为单声道
-    if audio.ndim == 2 and audio.shape[1] == 2:
-        return audio[:, 0]
-    return audio
+@functools.cache
+def default_templates() -> TemplateBank:
+    # 模板顺序与输出顺序一致: Silence, A, I, U, E, O. 所有分析器共享同一个模板库, 不要修改
+    return TemplateBank([Analyser.V_Silence, Analyser.V_A, Analyser.V_I, Analyser.V_U, Analyser.V_E, Analyser.V_O])
 
 
-def split_list_by_n(list_collection, n):
+def channel_conversion(audio: np.ndarray, out: np.ndarray | None = None):
     """
-    将集合均分，每份n个元素
-    :param list_collection:
-    :param n:
-    :return:返回的结果为评分后的每份可迭代对象
+    :param out: 需要转换格式时写入这个数组, 长度与 audio 相同
     """
-    for i in range(0, len(list_collection), n):
-        yield list_collection[i: i + n]
+    # 如果音频数据为立体声，则将其转换为单声道
+    if audio.ndim == 2 and audio.shape[1] == 2:
+        audio = audio[:, 0]
+    # 整数PCM(例如TTS输出的int16)和float16按满量程转换为float32, 其他浮点格式保持不变
+    if audio.dtype.kind != 'f' or audio.dtype.itemsize < 4:
+        audio = convert(audio, np.float32, out)
+    return audio
 
 
 n_fft_ref_list = [128, 512, 1024, 2048, 4096]
@@ -277,7 +1007,7 @@ def get_n_fft(audio_block_size: int, sample_rate: int, milliseconds: int = 23) -
     return min(n_fft_ref_list, key=lambda n_fft_ref: abs(n_fft_ref - n_fft))
 
 
-def softmax(x: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+def softmax(x: np.ndarray, temperature: float = 1.0, axis: int = 0) -> np.ndarray:
     """
     带温度参数的softmax函数
     temperature > 1：使分布更平滑（降低置信度）
@@ -287,6 +1017,7 @@ def softmax(x: np.ndarray, temperature: float = 1.0) -> np.ndarray:
     参数:
     x -- 输入向量或矩阵(numpy数组)
     temperature -- 温度参数(正数，默认为1.0)
+    axis -- 沿哪个维度归一化, 对 (T, 6) 的矩阵逐行计算时为1
 
     返回:
     s -- softmax计算结果(与x形状相同)
@@ -299,5 +1030,5 @@ def softmax(x: np.ndarray, temperature: float = 1.0) -> np.ndarray:
 
     # 防止数值溢出，减去最大值
     x = x / temperature
-    e_x = np.exp(x - np.max(x))
-    return e_x / e_x.sum(axis=0, keepdims=True)
+    e_x = np.exp(x - np.max(x, axis=axis, keepdims=True))
+    return e_x / e_x.sum(axis=axis, keepdims=True)
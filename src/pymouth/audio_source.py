@@ -0,0 +1,529 @@
+import asyncio
+import collections
+import io
+import itertools
+import queue
+import struct
+import sys
+import threading
+import weakref
+from typing import Iterator, Iterable, AsyncIterable, BinaryIO, Union, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import soundfile as sf
+
+# action_block 支持的音频输入
+AudioInput = Union[np.ndarray, str, 'sf.SoundFile', bytes, bytearray, memoryview, BinaryIO,
+                   Iterable[np.ndarray], AsyncIterable[np.ndarray]]
+
+
+class AudioSource:
+    def __init__(self,
+                 samplerate: int | float,
+                 channels: int,
+                 blocks: Iterator[np.ndarray],
+                 close=None,
+                 live: bool = False,
+                 pool: 'BufferPool | None' = None):
+        """
+        统一的音频输入, 按 block_size 逐块输出音频数据.
+        :param samplerate: 音频数据本身的采样率, 用于打开输出设备
+        :param channels: 声道数
+        :param blocks: 音频块迭代器
+        :param close: 关闭时需要释放的资源
+        :param live: 数据是否是边生成边到达的(例如流式TTS), 这种输入应该尽快开始播放
+        :param pool: 块所在的缓冲区池, 块用完后通过 release 放回
+        """
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocks = blocks
+        self.live = live
+        self.pool = pool
+        self._close = close
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.blocks
+
+    def release(self, block: np.ndarray):
+        """
+        块已经不再使用(播放、分析和回调都已完成), 它的缓冲区可以用来读取之后的块. 没有缓冲区池时什么都不做
+        """
+        if self.pool is not None:
+            self.pool.release(block)
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
+class BufferPool:
+    def __init__(self, shape: tuple[int, ...], dtype: np.dtype = np.float32):
+        """
+        块缓冲区池, 与一次播放会话绑定. acquire 取出一个空闲的缓冲区, 没有空闲的才分配新的,
+        块用完后 release 放回, 稳定运行时不再分配内存. acquire 和 release 可以在不同的线程中调用.
+        :param shape: 缓冲区形状, (block_size,) 或 (block_size, channels)
+        :param dtype: 数据类型
+        """
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        # 分配过的缓冲区数, 即同时在使用中的块数的最大值
+        self.allocated = 0
+        self._free = collections.deque()
+        # 只接受本池分配的缓冲区, 丢弃后没有放回的缓冲区被回收时自动移除
+        self._owned = weakref.WeakValueDictionary()
+
+    def acquire(self) -> np.ndarray:
+        try:
+            return self._free.pop()
+        except IndexError:
+            buf = np.empty(self.shape, dtype=self.dtype)
+            self._owned[id(buf)] = buf
+            self.allocated += 1
+            return buf
+
+    def release(self, block: np.ndarray):
+        """
+        :param block: acquire 取出的缓冲区或它的切片. 其他数组(例如调用者传入的音频的切片)会被忽略
+        """
+        buf = block if block.base is None else block.base
+        if self._owned.get(id(buf)) is buf:
+            self._free.append(buf)
+
+
+def open_audio(audio: AudioInput,
+               samplerate: int | float,
+               block_size: int = 4096,
+               dtype: np.dtype = np.float32,
+               reuse_buffers: bool = False,
+               read_ahead: int = 0,
+               memory_map: bool = False) -> AudioSource:
+    """
+    打开 action_block 支持的任意音频输入
+    :param audio: 音频数据, 可以是文件path, 可以是SoundFile对象, 可以是ndarray,
+        可以是内存中的编码音频(WAV/FLAC/OGG 等格式的 bytes, bytearray, memoryview, 或 BytesIO 等文件对象),
+        也可以是PCM块(ndarray)的同步或异步迭代器, 块的大小任意, 例如流式TTS的输出.
+        ndarray 和PCM块可以是 int16 / int32 / float16 等任意格式, 按满量程转换为 dtype
+    :param samplerate: 调用者给出的采样率, ndarray 和迭代器没有采样率信息时使用
+    :param block_size: 每块的帧数
+    :param dtype: 输出的块的数据类型, 也是读取文件时的数据类型
+    :param reuse_buffers: 是否复用块缓冲区. 开启后文件直接读入(以及需要转换格式的数据直接转换到)池中的缓冲区,
+        块用完后必须调用 source.release(block) 放回, 之后这块的数据会被覆盖
+    :param read_ahead: 文件输入时, 在后台线程中预先读取(解码)的块数, 慢速磁盘、网络文件系统或压缩格式的解码
+        不会阻塞播放. 为0时在调用者的线程中同步读取.
+    :param memory_map: 文件路径输入时, PCM WAV 文件(16/32位整数, 32/64位浮点)不经过 soundfile 解码,
+        直接映射到内存, 按块输出视图(见 map_wav). 块被引用期间文件保持映射, Windows 上不能删除
+    """
+    dtype = np.dtype(dtype)
+    if isinstance(audio, np.ndarray):
+        # 声道验证
+        if audio.ndim <= 0 or audio.ndim > 2:
+            raise ValueError('Audio channel verification failed. Only single or dual channels are supported.')
+        blocks = split_list_by_n(audio, block_size)
+        pool = None
+        if audio.dtype != dtype:
+            # 格式相同时直接输出切片, 不复制
+            pool = BufferPool((block_size, *audio.shape[1:]), dtype) if reuse_buffers else None
+            blocks = (convert(b, dtype, None if pool is None else pool.acquire()[:len(b)]) for b in blocks)
+        return AudioSource(samplerate, audio.ndim, blocks, pool=pool)
+
+    elif _is_soundfile(audio):
+        pool = _file_pool(audio, block_size, dtype) if reuse_buffers else None
+        return _read_ahead(AudioSource(audio.samplerate, audio.channels, read_blocks(audio, block_size, dtype, pool),
+                                       pool=pool),
+                           read_ahead)
+
+    elif isinstance(audio, (str, bytes, bytearray, memoryview)) or hasattr(audio, 'read'):
+        return _read_ahead(_open_encoded(audio, block_size, dtype, reuse_buffers, memory_map), read_ahead)
+
+    elif isinstance(audio, AsyncIterable):
+        return open_chunks(iter_async(audio), samplerate, block_size, dtype, reuse_buffers)
+
+    elif isinstance(audio, Iterable):
+        return open_chunks(audio, samplerate, block_size, dtype, reuse_buffers)
+
+    raise TypeError(f'Unsupported audio type: {type(audio)}')
+
+
+def open_chunks(chunks: Iterable[np.ndarray],
+                samplerate: int | float,
+                block_size: int = 4096,
+                dtype: np.dtype = np.float32,
+                reuse_buffers: bool = False) -> AudioSource:
+    """
+    打开PCM块迭代器. 会等待第一个块到达以确定声道数, 之后按 block_size 重新分块,
+    凑满一块立即输出, 不会等待整段音频结束.
+    """
+    it = iter(chunks)
+    first = next(it, None)
+    if first is None:
+        return AudioSource(samplerate, 1, iter(()), close=getattr(it, 'close', None), live=True)
+    first = np.asarray(first)
+    if first.ndim <= 0 or first.ndim > 2:
+        raise ValueError('Audio channel verification failed. Only single or dual channels are supported.')
+    channels = 1 if first.ndim == 1 else first.shape[1]
+    pool = BufferPool((block_size, *first.shape[1:]), dtype) if reuse_buffers else None
+    return AudioSource(samplerate,
+                       channels,
+                       reblock(itertools.chain((first,), it), block_size, dtype, pool),
+                       close=getattr(it, 'close', None),
+                       live=True,
+                       pool=pool)
+
+
+def _open_encoded(audio, block_size: int, dtype: np.dtype, reuse_buffers: bool, memory_map: bool) -> AudioSource:
+    """
+    打开文件路径, 内存中的编码数据或文件对象. 能直接使用的PCM WAV 数据(memory_map 时包括文件)作为数组的视图,
+    其他格式由 soundfile 解码. 调用者传入的文件对象不会被关闭
+    """
+    if isinstance(audio, str):
+        mapped = map_wav(audio) if memory_map else None
+    else:
+        if isinstance(audio, io.BytesIO):
+            # 由 bytes 创建且没有修改过的 BytesIO, getvalue 返回原对象, 不复制
+            audio = audio.getvalue()
+        elif not isinstance(audio, (bytes, bytearray, memoryview)) and not _seekable(audio):
+            # 不能定位的流(例如HTTP响应)先读入内存, soundfile 需要定位
+            audio = audio.read()
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            mapped = view_wav(audio)
+            audio = io.BytesIO(audio)
+        else:
+            mapped = None
+    # 浮点WAV读为整数时 soundfile 不缩放, 32位整数转16位时直接截断, 这两种情况仍交给 soundfile, 保持结果一致
+    if mapped is not None and (dtype.kind == 'f' or mapped[0].dtype == dtype):
+        data, samplerate = mapped
+        return open_audio(data, samplerate, block_size, dtype, reuse_buffers)
+    import soundfile as sf
+    f = sf.SoundFile(audio)
+    pool = _file_pool(f, block_size, dtype) if reuse_buffers else None
+    return AudioSource(f.samplerate, f.channels, read_blocks(f, block_size, dtype, pool), close=f.close, pool=pool)
+
+
+def _seekable(f) -> bool:
+    try:
+        return f.seekable()
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def _read_ahead(source: AudioSource, depth: int) -> AudioSource:
+    if depth <= 0:
+        return source
+    blocks = ReadAhead(source.blocks, depth)
+    close = source._close
+
+    def close_all():
+        # 先停止读取线程, 再关闭文件, 不会在读取的过程中关闭
+        blocks.close()
+        if close is not None:
+            close()
+
+    source.blocks = blocks
+    source._close = close_all
+    return source
+
+
+class ReadAhead:
+    def __init__(self, blocks: Iterator[np.ndarray], depth: int):
+        """
+        在后台线程中预先读取音频块, 最多缓存 depth 块. 读取中的异常会在取到对应位置时抛出.
+        :param blocks: 音频块迭代器, 只在后台线程中使用
+        :param depth: 预读的块数
+        """
+        if depth <= 0:
+            raise ValueError("Read ahead depth must be positive")
+        self.blocks = blocks
+        self.queue = queue.Queue(depth)
+        # 取块时队列为空(读取跟不上消费)的次数
+        self.stall_count = 0
+        self._done = False
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for block in self.blocks:
+                if not self._put((block, None)):
+                    return
+        except Exception as e:
+            self._put((None, e))
+        else:
+            self._put(None)
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> np.ndarray:
+        if self._done:
+            raise StopIteration
+        if self.queue.empty():
+            self.stall_count += 1
+        item = self.queue.get()
+        if item is None:
+            self._done = True
+            raise StopIteration
+        block, error = item
+        if error is not None:
+            self._done = True
+            raise error
+        return block
+
+    def close(self):
+        """停止读取, 等待正在进行的读取完成"""
+        self._done = True
+        self._stop.set()
+        # 取出队列中的块, 让阻塞在 put 上的读取线程立即退出
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.01)
+            except queue.Empty:
+                pass
+
+
+# WAV 格式标签和位深 -> 可以直接映射的样本类型
+_WAV_DTYPES = {(1, 16): '<i2', (1, 32): '<i4', (3, 32): '<f4', (3, 64): '<f8'}
+
+
+def map_wav(path: str) -> tuple[np.ndarray, int] | None:
+    """
+    把PCM WAV 文件的数据块映射到内存(numpy.memmap), 不读取也不解码, 按需由操作系统分页载入.
+    几个小时的文件打开时也只需要解析文件头.
+    :param path: 文件路径
+    :return: (data, samplerate), data 的 shape 与 SoundFile.read 相同: 单声道 (frames,), 立体声 (frames, 2).
+        不是 WAV, 或者是不能直接映射的格式(8/24位, 压缩编码, 多于两个声道等)时返回 None, 由 soundfile 读取
+    """
+    try:
+        with open(path, 'rb') as f:
+            def read_at(pos, n):
+                f.seek(pos)
+                return f.read(n)
+
+            layout = _wav_layout(read_at, f.seek(0, 2))
+    except OSError:
+        return None
+    if layout is None:
+        return None
+    dtype, shape, offset, samplerate = layout
+    data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+    return data.view(np.ndarray), samplerate
+
+
+def view_wav(buffer) -> tuple[np.ndarray, int] | None:
+    """
+    内存中的PCM WAV 数据(例如TTS服务返回的 bytes)直接作为数组的视图, 不复制也不解码. 格式要求与 map_wav 相同
+    :param buffer: bytes, bytearray, memoryview 等支持缓冲区协议的对象
+    :return: (data, samplerate), 不能直接使用时返回 None
+    """
+    buffer = memoryview(buffer).cast('B')
+    layout = _wav_layout(lambda pos, n: buffer[pos:pos + n].tobytes(), buffer.nbytes)
+    if layout is None:
+        return None
+    dtype, shape, offset, samplerate = layout
+    data = np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=offset)
+    return data.reshape(shape), samplerate
+
+
+def _wav_layout(read_at, total: int) -> tuple[np.dtype, tuple[int, ...], int, int] | None:
+    """
+    解析 WAV 文件头
+    :param read_at: (位置, 字节数) -> bytes
+    :param total: 总字节数
+    :return: (dtype, shape, offset, samplerate), 数据块从 offset 开始. 不能直接使用时返回 None
+    """
+    header = read_at(0, 12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:] != b'WAVE':
+        return None
+    fmt = None
+    pos = 12
+    while True:
+        chunk = read_at(pos, 8)
+        if len(chunk) < 8:
+            return None
+        name, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        pos += 8
+        if name == b'data':
+            break
+        if name == b'fmt ':
+            body = read_at(pos, size)
+            if len(body) < 16:
+                return None
+            tag, channels, samplerate, _, align, bits = struct.unpack('<HHIIHH', body[:16])
+            if tag == 0xFFFE and len(body) >= 26:
+                # WAVE_FORMAT_EXTENSIBLE, 实际格式在子格式GUID的前两个字节
+                tag = struct.unpack('<H', body[24:26])[0]
+            fmt = tag, channels, samplerate, align, bits
+        pos += size + (size & 1)
+    if fmt is None:
+        return None
+    tag, channels, samplerate, align, bits = fmt
+    dtype = _WAV_DTYPES.get((tag, bits))
+    if dtype is None or channels not in (1, 2) or align != channels * bits // 8:
+        return None
+    # 边录边写的文件数据块大小可能是0或0xFFFFFFFF, 以实际的长度为准
+    if size == 0 or pos + size > total:
+        size = total - pos
+    frames = size // align
+    if frames <= 0:
+        return None
+    return np.dtype(dtype), (frames, channels) if channels > 1 else (frames,), pos, samplerate
+
+
+def _file_pool(f: 'sf.SoundFile', block_size: int, dtype: np.dtype) -> BufferPool:
+    # 与 SoundFile.read 的返回值相同: 单声道为一维
+    return BufferPool((block_size,) if f.channels == 1 else (block_size, f.channels), dtype)
+
+
+def convert(data: np.ndarray, dtype: np.dtype, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    转换样本格式. 整数PCM与浮点之间按满量程缩放(int16 的 32768 对应 1.0), 超出范围的值截断; 浮点之间直接转换.
+    :param data: 音频数据
+    :param dtype: 目标类型
+    :param out: 写入这个数组(形状与 data 相同), 为None时分配新的数组. 格式相同且没有 out 时直接返回 data
+    """
+    dtype = np.dtype(dtype)
+    src = data.dtype
+    if out is None:
+        if src == dtype:
+            return data
+        out = np.empty(data.shape, dtype=dtype)
+    if src.kind not in 'if' or dtype.kind not in 'if':
+        raise TypeError(f'Unsupported sample format: {src} -> {dtype}')
+    if src.kind == dtype.kind or src == dtype:
+        if src.kind == 'i' and src != dtype:
+            # 整数之间先转为浮点
+            return convert(convert(data, np.float64), dtype, out)
+        np.copyto(out, data, casting='unsafe')
+    elif src.kind == 'i':
+        np.multiply(data, 1.0 / _full_scale(src), out=out, dtype=dtype, casting='unsafe')
+    else:
+        full = _full_scale(dtype)
+        np.copyto(out, np.clip(np.rint(data * full), -full, full - 1), casting='unsafe')
+    return out
+
+
+def _full_scale(dtype: np.dtype) -> float:
+    return float(1 << (np.dtype(dtype).itemsize * 8 - 1))
+
+
+def reblock(chunks: Iterable[np.ndarray], block_size: int, dtype: np.dtype = np.float32,
+            pool: BufferPool | None = None) -> Iterator[np.ndarray]:
+    """
+    把任意大小的音频块重新分为 block_size 大小的块, 最后一块可能不足 block_size.
+    格式相同且对齐时直接输出原数据的切片, 不做复制. 格式不同时按满量程转换, 见 convert.
+    :param pool: 拼接和转换的结果写入池中的缓冲区, 为None时每块分配新的数组
+    """
+    dtype = np.dtype(dtype)
+    buffer = None
+    size = 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        while len(chunk):
+            if size == 0 and len(chunk) >= block_size:
+                if chunk.dtype == dtype:
+                    yield chunk[:block_size]
+                else:
+                    yield convert(chunk[:block_size], dtype, None if pool is None else pool.acquire())
+                chunk = chunk[block_size:]
+                continue
+            if buffer is None:
+                buffer = np.empty((block_size, *chunk.shape[1:]), dtype=dtype) if pool is None else pool.acquire()
+            n = min(block_size - size, len(chunk))
+            convert(chunk[:n], dtype, buffer[size:size + n])
+            size += n
+            chunk = chunk[n:]
+            if size == block_size:
+                yield buffer
+                buffer = None
+                size = 0
+    if size:
+        yield buffer[:size]
+
+
+def iter_async(chunks: AsyncIterable, loop: asyncio.AbstractEventLoop | None = None) -> Iterator:
+    """
+    在同步代码中逐个取出异步迭代器的元素.
+    :param chunks: 异步迭代器
+    :param loop: 异步迭代器所属的事件循环, 这个循环必须在另一个线程中运行.
+        为None时使用一个私有的事件循环, 此时当前线程不能有正在运行的事件循环
+    """
+    ait = aiter(chunks)
+    own_loop = None
+    if loop is None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError('Async audio cannot be consumed on a running event loop, use action_noblock instead.')
+        own_loop = asyncio.new_event_loop()
+
+    async def next_chunk():
+        return await anext(ait)
+
+    try:
+        while True:
+            try:
+                if own_loop is not None:
+                    yield own_loop.run_until_complete(next_chunk())
+                else:
+                    yield asyncio.run_coroutine_threadsafe(next_chunk(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        if own_loop is not None:
+            own_loop.run_until_complete(own_loop.shutdown_asyncgens())
+            own_loop.close()
+
+
+def _is_soundfile(audio) -> bool:
+    # 没有导入过 soundfile 时不可能是 SoundFile 对象, 不需要为了判断类型而导入
+    sf = sys.modules.get('soundfile')
+    return sf is not None and isinstance(audio, sf.SoundFile)
+
+
+def read_blocks(f: 'sf.SoundFile', block_size: int, dtype: np.dtype = np.float32,
+                pool: BufferPool | None = None) -> Iterator[np.ndarray]:
+    """
+    :param pool: 直接读入池中的缓冲区(SoundFile.read(out=...)), 为None时每块分配新的数组
+    """
+    while True:
+        if pool is None:
+            data = f.read(block_size, dtype=dtype)
+        else:
+            buf = pool.acquire()
+            data = f.read(block_size, out=buf)
+            if not len(data):
+                pool.release(buf)
+        if not len(data):
+            break
+        yield data
+
+
+def split_list_by_n(list_collection, n):
+    """
+    将集合均分，每份n个元素
+    :param list_collection:
+    :param n:
+    :return:返回的结果为评分后的每份可迭代对象
+    """
+    for i in range(0, len(list_collection), n):
+        yield list_collection[i: i + n]
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 每个条目除了键和值以外的大致开销(字节), 用于估算内存预算
+ENTRY_OVERHEAD = 160
+
+
+class AnalysisCache:
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, directory: str | None = None):
+        """
+        按内容寻址的分析结果缓存. 键是音频块内容和分析参数的哈希, 值是分析结果,
+        相同的音频(例如重复的问候语、口头禅、错误提示)再次出现时直接返回结果, 不再计算MFCC和DTW.
+        可以被多个分析器和线程共享.
+        :param max_bytes: 内存中最多占用的字节数, 超过时淘汰最久未使用的条目
+        :param directory: 磁盘缓存目录, 为None时只缓存在内存中. 磁盘缓存在进程之间共享, 不会自动淘汰
+        """
+        if max_bytes <= 0:
+            raise ValueError("Max bytes must be positive")
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(*parts) -> bytes:
+        """
+        计算缓存键. parts 可以是 bytes, str, 数字或 np.ndarray, 数组按 dtype, shape 和内容计算
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                h.update(f'{part.dtype.str}{part.shape}'.encode())
+                h.update(np.ascontiguousarray(part).data)
+            elif isinstance(part, bytes):
+                h.update(part)
+            else:
+                h.update(repr(part).encode())
+            # 分隔符, 避免不同的切分方式得到相同的键
+            h.update(b'\x00')
+        return h.digest()
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key: bytes, value: np.ndarray):
+        value = np.array(value, dtype=np.float64)
+        value.flags.writeable = False
+        with self._lock:
+            self._insert(key, value)
+        self._store(key, value)
+
+    def _insert(self, key: bytes, value: np.ndarray):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= self._size(key, old)
+        self._entries[key] = value
+        self.bytes += self._size(key, value)
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            k, v = self._entries.popitem(last=False)
+            self.bytes -= self._size(k, v)
+            self.evictions += 1
+
+    @staticmethod
+    def _size(key: bytes, value: np.ndarray) -> int:
+        return len(key) + value.nbytes + ENTRY_OVERHEAD
+
+    def _path(self, key: bytes) -> str:
+        name = key.hex()
+        return os.path.join(self.directory, name[:2], name[2:])
+
+    def _load(self, key: bytes) -> np.ndarray | None:
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data or len(data) % 8:
+            return None
+        return np.frombuffer(data, dtype='<f8')
+
+    def _store(self, key: bytes, value: np.ndarray):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换, 其他进程不会读到写了一半的条目
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(value.astype('<f8').tobytes())
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hit_rate(),
+            }
+
+    def clear(self):
+        """清空内存中的条目和统计, 不删除磁盘缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
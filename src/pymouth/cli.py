@@ -0,0 +1,189 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# 目录输入时处理的文件类型
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.aiff', '.aif')
+TRACK_EXTENSION = '.pmt'
+ANALYSERS = ('vowel', 'db', 'rms')
+
+
+def find_audio(paths: list[str]) -> list[str]:
+    """
+    展开输入: 目录(递归查找音频文件), glob模式, 或文件路径
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.lower().endswith(AUDIO_EXTENSIONS))
+        elif glob.has_magic(path):
+            files.extend(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+        else:
+            files.append(path)
+    # 去重并保持顺序稳定
+    return sorted(set(os.path.normpath(f) for f in files))
+
+
+def track_path(file: str, output: str | None, base: str | None) -> str:
+    """
+    轨道文件路径. 没有指定输出目录时与音频放在一起, 否则在输出目录中保持相对目录结构
+    """
+    name = os.path.splitext(file)[0] + TRACK_EXTENSION
+    if output is None:
+        return name
+    rel = os.path.relpath(name, base) if base else os.path.basename(name)
+    return os.path.join(output, rel)
+
+
+def _analyser_class(name: str):
+    from .analyser import VowelAnalyser, DBAnalyser, RMSAnalyser
+    return {'vowel': VowelAnalyser, 'db': DBAnalyser, 'rms': RMSAnalyser}[name]
+
+
+def _existing_track(file: str, out: str, analyser: str, hop: int, dtype: str) -> dict | None:
+    """
+    已有轨道的分析器, 参数和源音频的内容哈希都相同时返回跳过的结果, 否则返回None
+    """
+    import numpy as np
+    from .track import LipSyncTrack, hash_audio
+
+    t0 = time.perf_counter()
+    if not os.path.exists(out):
+        return None
+    try:
+        existing = LipSyncTrack.load(out)
+        if (existing.analyser != _analyser_class(analyser).__name__ or existing.hop != hop
+                or existing.values.dtype != np.dtype(dtype) or existing.source_hash != hash_audio(file, 44100)):
+            return None
+    except Exception:
+        # 轨道损坏或音频无法读取时交给 _bake_file 处理
+        return None
+    return {'file': file, 'track': out, 'status': 'skipped', 'hash': existing.source_hash.hex(),
+            'duration': existing.duration, 'seconds': time.perf_counter() - t0}
+
+
+def _bake_file(file: str, out: str, analyser: str, hop: int, dtype: str) -> dict:
+    """
+    在工作进程中执行
+    """
+    from .track import bake
+
+    t0 = time.perf_counter()
+    res = {'file': file, 'track': out}
+    try:
+        track = bake(_analyser_class(analyser)(), file, 44100, hop)
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        # 先写临时文件再替换, 中断时不会留下损坏的轨道
+        tmp = out + '.tmp'
+        track.save(tmp, dtype=dtype)
+        os.replace(tmp, out)
+        return {**res, 'status': 'baked', 'hash': track.source_hash.hex(), 'duration': track.duration,
+                'seconds': time.perf_counter() - t0}
+    except Exception:
+        return {**res, 'status': 'failed', 'error': traceback.format_exc(), 'seconds': time.perf_counter() - t0}
+
+
+def _warmup(analyser: str):
+    # 每个工作进程启动时加载这个分析器用到的JIT内核, 不计入第一个文件
+    _analyser_class(analyser)()._warmup_kernels()
+
+
+def bake_command(args) -> int:
+    files = find_audio(args.paths)
+    if not files:
+        print('No audio files found', file=sys.stderr)
+        return 1
+    base = os.path.commonpath([os.path.abspath(os.path.dirname(f)) for f in files]) if args.output else None
+    outputs = [track_path(os.path.abspath(f), args.output, base) for f in files]
+    # a.wav 和 a.flac 会生成同一个轨道文件
+    sources: dict[str, list[str]] = {}
+    for f, out in zip(files, outputs):
+        sources.setdefault(os.path.normcase(out), []).append(f)
+    conflicts = [names for names in sources.values() if len(names) > 1]
+    if conflicts:
+        for names in conflicts:
+            print(f'Same track file for: {", ".join(names)}', file=sys.stderr)
+        return 1
+
+    t0 = time.perf_counter()
+    results = []
+
+    def report(res: dict):
+        results.append(res)
+        if not args.quiet:
+            print(f'[{len(results)}/{len(files)}] {res["status"]:<7} {res["file"]}', file=sys.stderr)
+        if res['status'] == 'failed':
+            print(res['error'], file=sys.stderr)
+
+    # 先在本进程中检查已有的轨道(主要是解码和哈希, 用线程并行), 全部跳过时不必启动工作进程和编译内核
+    pending = list(zip(files, outputs))
+    if not args.force:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            existing = list(pool.map(lambda p: _existing_track(*p, args.analyser, args.hop, args.dtype), pending))
+        for res in existing:
+            if res is not None:
+                report(res)
+        pending = [p for p, res in zip(pending, existing) if res is None]
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=_warmup, initargs=(args.analyser,)) as pool:
+            futures = [pool.submit(_bake_file, f, out, args.analyser, args.hop, args.dtype) for f, out in pending]
+            for future in as_completed(futures):
+                report(future.result())
+    elapsed = time.perf_counter() - t0
+
+    counts = {s: sum(1 for r in results if r['status'] == s) for s in ('baked', 'skipped', 'failed')}
+    audio_seconds = sum(r['duration'] for r in results if r['status'] == 'baked')
+    summary = {
+        **counts,
+        'files': len(results),
+        'elapsed': elapsed,
+        'files_per_second': len(results) / elapsed if elapsed else 0.0,
+        'audio_seconds': audio_seconds,
+        'realtime_factor': audio_seconds / elapsed if elapsed else 0.0,
+    }
+
+    if args.index:
+        index = {r['file']: {k: r[k] for k in ('track', 'hash', 'duration')}
+                 for r in sorted(results, key=lambda r: r['file']) if r['status'] != 'failed'}
+        with open(args.index, 'w', encoding='utf-8') as f:
+            json.dump({'analyser': args.analyser, 'hop': args.hop, 'tracks': index}, f, indent=2, ensure_ascii=False)
+
+    print(f'{summary["files"]} files: {counts["baked"]} baked, {counts["skipped"]} skipped, {counts["failed"]} failed '
+          f'in {elapsed:.2f}s ({summary["files_per_second"]:.1f} files/s, {summary["realtime_factor"]:.0f}x realtime)',
+          file=sys.stderr)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    return 1 if counts['failed'] else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='pymouth', description='pymouth command line tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('bake', help='批量生成口型轨道, 不需要音频设备和VTubeStudio')
+    p.add_argument('paths', nargs='+', help='音频文件, 目录(递归查找)或glob模式, 例如 "voice/**/*.wav"')
+    p.add_argument('-o', '--output', help='输出目录, 默认与音频文件放在一起')
+    p.add_argument('-a', '--analyser', choices=ANALYSERS, default='vowel', help='vowel 生成元音轨道, db/rms 生成开口轨道')
+    p.add_argument('--hop', type=int, default=4096, help='每行对应的样本数, 应与播放时的 block_size 相同')
+    p.add_argument('--dtype', choices=('float16', 'float32'), default='float16')
+    p.add_argument('-j', '--jobs', type=int, default=None, help='进程数, 默认为CPU核数')
+    p.add_argument('--index', help='同时写出JSON索引: 源文件 -> 轨道文件, 内容哈希, 时长')
+    p.add_argument('-f', '--force', action='store_true', help='内容哈希未变的文件也重新生成')
+    p.add_argument('-q', '--quiet', action='store_true', help='不输出每个文件的进度')
+    p.add_argument('--json', action='store_true', help='把统计结果以JSON输出到stdout')
+    p.set_defaults(func=bake_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import functools
+
+import numpy as np
+
+
+def dtw_bank(bank: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    一次计算 query 与模板库中所有模板的DTW归一化距离.
+    等价于对每个模板调用 dtw(template, query, distance_only=True).normalizedDistance
+    (欧氏距离, symmetric2 步进模式), 但所有模板在同一次向量化计算中完成.
+    如果环境中安装了 numba, 会使用JIT编译的内核, 否则使用NumPy反对角线向量化实现.
+    :param bank: 模板库, shape (K, N, D), K个长度为N的模板
+    :param query: 待匹配的帧序列, shape (M, D)
+    :return: shape (K,) 每个模板的归一化距离, 值越小越相似
+    """
+    query = np.asarray(query)
+    if query.ndim != 2:
+        raise ValueError(f'Shape mismatch. query: {query.shape}')
+    return dtw_bank_batch(bank, query[None])[0]
+
+
+def dtw_bank_batch(bank: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """
+    与 dtw_bank 相同, 但一次比较多个等长的 query, 用于整段音频的离线分析
+    :param bank: 模板库, shape (K, N, D)
+    :param queries: shape (Q, M, D), Q个长度为M的帧序列
+    :return: shape (Q, K)
+    """
+    # JIT内核只编译连续float64这一种签名
+    bank = np.ascontiguousarray(bank, dtype=np.float64)
+    queries = np.ascontiguousarray(queries, dtype=np.float64)
+    if bank.ndim != 3 or queries.ndim != 3 or bank.shape[2] != queries.shape[2]:
+        raise ValueError(f'Shape mismatch. bank: {bank.shape}, queries: {queries.shape}')
+
+    kernel = _numba_kernel()
+    if kernel is not None:
+        return kernel(bank, queries)
+    return _dtw_bank_numpy(bank, queries)
+
+
+def dtw_groups(bank: np.ndarray,
+               lower: np.ndarray,
+               upper: np.ndarray,
+               offsets: np.ndarray,
+               queries: np.ndarray,
+               margin: float = np.inf) -> np.ndarray:
+    """
+    模板按组(元音)连续存放时, 每组取最小的DTW距离, 用下界剪枝和提前终止跳过不可能成为最小值的模板.
+    每个模板先用 LB_Keogh 式的下界筛选: 起点的本地距离, 加上 query 之后每一帧到模板包络(每维的最小/最大值)的距离,
+    再加上模板之后每一帧到 query 包络的距离. symmetric2 的路径从起点出发后进入每一行和每一列各一次,
+    横竖步权重为1, 对角步权重为2且同时进入一行一列, 所以下界不会超过真实距离.
+    每组按下界从小到大计算, 下界大于这组当前最小距离的模板直接跳过;
+    计算中某一行的累计代价已经超过当前最小距离时提前终止.
+    结果与对所有模板调用 dtw_bank_batch 后按组取最小值完全相同.
+    没有安装 numba 时不剪枝.
+    :param bank: 模板库, shape (K, N, D), 同一组的模板连续存放
+    :param lower: 每个模板每一维的最小值, shape (K, D)
+    :param upper: 每个模板每一维的最大值, shape (K, D)
+    :param offsets: 每组在 bank 中的起始位置, 最后一项为 K, shape (G + 1,)
+    :param queries: shape (Q, M, D)
+    :param margin: 近似剪枝. 一组的下界比已知的全局最小距离还大 margin 以上时, 不再计算这组, 直接以下界作为它的距离.
+        为inf时不做近似
+    :return: shape (Q, G)
+    """
+    bank = np.ascontiguousarray(bank, dtype=np.float64)
+    queries = np.ascontiguousarray(queries, dtype=np.float64)
+    if bank.ndim != 3 or queries.ndim != 3 or bank.shape[2] != queries.shape[2]:
+        raise ValueError(f'Shape mismatch. bank: {bank.shape}, queries: {queries.shape}')
+
+    kernel = _numba_pruned_kernel()
+    if kernel is not None:
+        return kernel(bank,
+                      np.ascontiguousarray(lower, dtype=np.float64),
+                      np.ascontiguousarray(upper, dtype=np.float64),
+                      np.ascontiguousarray(offsets, dtype=np.int64),
+                      queries,
+                      float(margin))
+    distances = dtw_bank_batch(bank, queries)
+    return np.minimum.reduceat(distances, np.asarray(offsets[:-1], dtype=np.intp), axis=1)
+
+
+def local_distance(bank: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    模板库与 query 两两帧之间的欧氏距离
+    :param query: shape (M, D), 或 (Q, M, D)
+    :return: shape (K, N, M), 或 (Q, K, N, M)
+    """
+    diff = bank[:, :, None, :] - query[..., None, None, :, :]
+    return np.sqrt(np.einsum('...d,...d->...', diff, diff))
+
+
+def warmup(pruned: bool = True) -> bool:
+    """
+    提前加载或编译JIT内核
+    :param pruned: 是否也加载剪枝内核(dtw_groups). 不会用到剪枝时不必为它花编译时间
+    :return: 是否使用JIT内核
+    """
+    if _numba_kernel() is None:
+        return False
+    return not pruned or _numba_pruned_kernel() is not None
+
+
+def _dtw_bank_numpy(bank: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    :param query: shape (M, D) 时返回 (K,), shape (Q, M, D) 时返回 (Q, K)
+    """
+    k, n, _ = bank.shape
+    m = query.shape[-2]
+    # 所有 (query, 模板) 组合一起计算
+    d = local_distance(bank, query).reshape(-1, n, m)
+    p = d.shape[0]
+
+    # 按反对角线(s = i + j)重排代价矩阵, 同一条反对角线上的格子互不依赖, 可以用切片一次性计算.
+    # 行偏移2, 列偏移1, 用inf填充越界格子. 起点(0,0)只计一次本地距离.
+    ds = np.full((p, n + m + 1, n + 1), np.inf)
+    si, ii = _skew_index(n, m)
+    ds[:, si + 2, ii + 1] = d[:, ii, si - ii]
+    g = np.full_like(ds, np.inf)
+    g[:, 0, 0] = -d[:, 0, 0]
+    for s in range(2, n + m + 1):
+        c = ds[:, s, 1:]
+        g[:, s, 1:] = np.minimum(g[:, s - 2, :-1] + 2 * c, np.minimum(g[:, s - 1, :-1], g[:, s - 1, 1:]) + c)
+    return (g[:, n + m, n] / (n + m)).reshape(query.shape[:-2] + (k,))
+
+
+@functools.cache
+def _skew_index(n: int, m: int) -> tuple[np.ndarray, np.ndarray]:
+    i, j = np.meshgrid(np.arange(n), np.arange(m), indexing='ij')
+    return (i + j).ravel(), i.ravel()
+
+
+@functools.cache
+def _numba_kernel():
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    # 指定签名后在这里立即编译, 编译结果缓存在磁盘上(__pycache__, 不可写时为用户缓存目录), 之后的进程直接加载
+    @numba.njit('float64[:, ::1](float64[:, :, ::1], float64[:, :, ::1])', cache=True, nogil=True)
+    def kernel(bank, queries):
+        k, n, dim = bank.shape
+        q, m, _ = queries.shape
+        res = np.empty((q, k))
+        g = np.empty((n, m))
+        for p in range(q):
+            query = queries[p]
+            for t in range(k):
+                for i in range(n):
+                    for j in range(m):
+                        c = 0.0
+                        for x in range(dim):
+                            diff = bank[t, i, x] - query[j, x]
+                            c += diff * diff
+                        c = np.sqrt(c)
+                        if i == 0 and j == 0:
+                            g[i, j] = c
+                            continue
+                        best = np.inf
+                        if i > 0 and j > 0:
+                            best = g[i - 1, j - 1] + 2 * c
+                        if i > 0:
+                            best = min(best, g[i - 1, j] + c)
+                        if j > 0:
+                            best = min(best, g[i, j - 1] + c)
+                        g[i, j] = best
+                res[p, t] = g[n - 1, m - 1] / (n + m)
+        return res
+
+    return kernel
+
+
+@functools.cache
+def _numba_pruned_kernel():
+    try:
+        from .dtw_jit import pruned_kernel
+    except ImportError:
+        return None
+    return pruned_kernel
@@ -0,0 +1,120 @@
+import numpy as np
+from numba import njit
+
+# dtw_engine.dtw_groups 使用的JIT内核, 只有安装了 numba 时才会导入这个模块.
+# 辅助函数和内核都定义在模块级: 闭包中定义的函数无法缓存, 每个进程都要重新编译
+
+# 剪枝比较时的相对余量, 只在确实更大时才跳过, 避免舍入误差改变结果
+_PRUNE_EPS = 1e-9
+
+
+@njit(cache=True, nogil=True, inline='always')
+def box_bound(frames, lower, upper):
+    # 除第一帧以外, 每一帧到包络(超矩形)的欧氏距离之和
+    total = 0.0
+    for i in range(1, frames.shape[0]):
+        s = 0.0
+        for x in range(frames.shape[1]):
+            v = frames[i, x]
+            d = max(lower[x] - v, v - upper[x], 0.0)
+            s += d * d
+        total += np.sqrt(s)
+    return total
+
+
+@njit(cache=True, nogil=True, inline='always')
+def dtw_abandon(template, query, g, limit):
+    # 与 _numba_kernel 的计算完全相同, 某一行的最小累计代价超过 limit 时提前终止, 返回inf
+    n, dim = template.shape
+    m = query.shape[0]
+    for i in range(n):
+        row_min = np.inf
+        for j in range(m):
+            c = 0.0
+            for x in range(dim):
+                diff = template[i, x] - query[j, x]
+                c += diff * diff
+            c = np.sqrt(c)
+            if i == 0 and j == 0:
+                best = c
+            else:
+                best = np.inf
+                if i > 0 and j > 0:
+                    best = g[i - 1, j - 1] + 2 * c
+                if i > 0:
+                    best = min(best, g[i - 1, j] + c)
+                if j > 0:
+                    best = min(best, g[i, j - 1] + c)
+            g[i, j] = best
+            row_min = min(row_min, best)
+        if row_min > limit:
+            return np.inf
+    return g[n - 1, m - 1] / (n + m)
+
+
+@njit(cache=True, nogil=True, inline='always')
+def sort_by(keys, index, lo, hi):
+    # 插入排序, 每组的模板很少, 不需要分配内存
+    for a in range(lo + 1, hi):
+        v = index[a]
+        b = a - 1
+        while b >= lo and keys[index[b]] > keys[v]:
+            index[b + 1] = index[b]
+            b -= 1
+        index[b + 1] = v
+
+
+@njit('float64[:, ::1](float64[:, :, ::1], float64[:, ::1], float64[:, ::1], int64[::1], '
+            'float64[:, :, ::1], float64)', cache=True, nogil=True)
+def pruned_kernel(bank, lower, upper, offsets, queries, margin):
+    k, n, dim = bank.shape
+    q, m, _ = queries.shape
+    groups = offsets.size - 1
+    scale = n + m
+    res = np.empty((q, groups))
+    g = np.empty((n, m))
+    lb = np.empty(k)
+    order = np.empty(k, dtype=np.int64)
+    group_lb = np.empty(groups)
+    group_order = np.empty(groups, dtype=np.int64)
+    q_lower = np.empty(dim)
+    q_upper = np.empty(dim)
+    for p in range(q):
+        query = queries[p]
+        for x in range(dim):
+            q_lower[x] = query[:, x].min()
+            q_upper[x] = query[:, x].max()
+        # 下界: 起点的本地距离, 加上之后每一帧到对方包络的距离, 只需要 O((N + M) * D)
+        for t in range(k):
+            s = 0.0
+            for x in range(dim):
+                diff = bank[t, 0, x] - query[0, x]
+                s += diff * diff
+            lb[t] = (np.sqrt(s) + box_bound(bank[t], q_lower, q_upper)
+                     + box_bound(query, lower[t], upper[t])) / scale
+            order[t] = t
+        for gi in range(groups):
+            sort_by(lb, order, offsets[gi], offsets[gi + 1])
+            group_lb[gi] = lb[order[offsets[gi]]]
+            group_order[gi] = gi
+        sort_by(group_lb, group_order, 0, groups)
+
+        # 下界最小的组先计算, 尽早得到全局最小距离
+        best_all = np.inf
+        for gi in group_order:
+            if group_lb[gi] > best_all + margin:
+                res[p, gi] = group_lb[gi]
+                continue
+            best = np.inf
+            for idx in range(offsets[gi], offsets[gi + 1]):
+                t = order[idx]
+                limit = best * (1 + _PRUNE_EPS)
+                # 按下界从小到大计算, 之后的模板都不可能更小
+                if lb[t] > limit:
+                    break
+                d = dtw_abandon(bank[t], query, g, limit * scale)
+                if d < best:
+                    best = d
+            res[p, gi] = best
+            best_all = min(best_all, best)
+    return res
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .analyser import Analyser
+from .audio_source import AudioInput
+
+
+class _MeteredExecutor(ThreadPoolExecutor):
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers, thread_name_prefix='pymouth-analysis')
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        def metered():
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                with self._lock:
+                    self.busy_seconds += dt
+
+        return super().submit(metered)
+
+
+class LipSyncStream:
+    def __init__(self, engine: 'LipSyncEngine', name: str, analyser: Analyser, sink):
+        """
+        引擎中的一路语音, 由 LipSyncEngine.add_stream 创建.
+        每一路有独立的分析器(会话状态互不影响), 同一路的语音按提交顺序依次处理.
+        """
+        self.engine = engine
+        self.name = name
+        self.analyser = analyser
+        self.sink = sink
+        self.active = 0
+        self.audio_seconds = 0.0
+
+    def action(self,
+               audio: AudioInput,
+               samplerate: int | float,
+               output_device: int,
+               finished_callback=None,
+               interrupt_listening=None,
+               auto_play: bool = True,
+               block_size: int = 4096):
+        """
+        提交一段语音, 立即返回. 参数与 Analyser.action_noblock 相同, 分析结果交给这一路的 sink
+        """
+        engine = self.engine
+
+        def sink(res, data):
+            engine._account(self, len(data) / samplerate)
+            self.sink(res, data)
+
+        def finished():
+            with engine._lock:
+                self.active -= 1
+            if finished_callback is not None:
+                finished_callback()
+
+        with engine._lock:
+            self.active += 1
+        self.analyser.action_noblock(audio, samplerate, output_device, sink, finished, interrupt_listening,
+                                     auto_play, block_size=block_size)
+
+
+class LipSyncEngine:
+    def __init__(self, max_workers: int | None = None):
+        """
+        多路口型同步引擎. 所有语音流的分析共享一个按机器核数设置的线程池,
+        每个音频块作为一个任务提交, 各路语音轮流使用线程, 一路语音的积压不会拖慢其他语音.
+        :param max_workers: 分析线程数, 默认为CPU核数
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = _MeteredExecutor(self.max_workers)
+        self.streams: dict[str, LipSyncStream] = {}
+        self.audio_seconds = 0.0
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_stream(self, name: str, analyser: Analyser, sink) -> LipSyncStream:
+        """
+        添加一路语音
+        :param name: 名称, 不能重复
+        :param analyser: 这一路独占的分析器
+        :param sink: 接收分析结果的回调, 与 Analyser 的 callback 相同: sink(result, data)
+        """
+        if name in self.streams:
+            raise ValueError(f'Stream already exists: {name}')
+        analyser.analysis_executor = self.executor
+        stream = LipSyncStream(self, name, analyser, sink)
+        self.streams[name] = stream
+        return stream
+
+    def remove_stream(self, name: str):
+        stream = self.streams.pop(name)
+        stream.analyser.analysis_executor = None
+
+    def action(self, name: str, audio: AudioInput, samplerate: int | float, output_device: int, **kwargs):
+        """
+        向指定的一路提交语音, 见 LipSyncStream.action
+        """
+        self.streams[name].action(audio, samplerate, output_device, **kwargs)
+
+    def _account(self, stream: LipSyncStream, seconds: float):
+        with self._lock:
+            stream.audio_seconds += seconds
+            self.audio_seconds += seconds
+
+    def throughput(self) -> dict[str, float]:
+        """
+        吞吐量统计
+        realtime_factor: 单个分析线程每秒能分析多少秒音频
+        capacity: 线程池满载时最多能实时驱动的语音路数 (线程数 × realtime_factor)
+        utilization: 线程池的繁忙程度
+        """
+        with self._lock:
+            audio_seconds = self.audio_seconds
+            active = sum(1 for s in self.streams.values() if s.active)
+        busy = self.executor.busy_seconds
+        wall = time.perf_counter() - self._started
+        realtime_factor = audio_seconds / busy if busy else 0.0
+        return {
+            'streams': len(self.streams),
+            'active_streams': active,
+            'workers': self.max_workers,
+            'audio_seconds': audio_seconds,
+            'busy_seconds': busy,
+            'wall_seconds': wall,
+            'realtime_factor': realtime_factor,
+            'capacity': realtime_factor * self.max_workers,
+            'utilization': busy / (wall * self.max_workers) if wall else 0.0,
+        }
+
+    def close(self):
+        # 分析器(和它自己的线程池)属于调用者, 只关闭引擎的共享线程池
+        self.executor.shutdown()
+        # 共享线程池已经关闭, 之后直接使用这些分析器时回到各自的分析线程
+        for stream in self.streams.values():
+            stream.analyser.analysis_executor = None
@@ -0,0 +1,363 @@
+import functools
+
+import numpy as np
+
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 3
+TOP_DB = 80.0
+AMIN = 1e-10
+
+
+class MFCCPlan:
+    def __init__(self, samplerate: int | float, n_fft: int, hop_length: int = HOP_LENGTH):
+        """
+        MFCC计算计划, 预先计算并缓存 (samplerate, n_fft) 对应的窗函数, mel滤波器组和DCT基.
+        计算结果与 librosa.feature.mfcc(y, sr, n_fft=n_fft, dct_type=1, n_mfcc=3)[1:].T 一致.
+        不要直接创建, 请使用 get_plan()
+        :param samplerate: 采样率
+        :param n_fft: FFT窗口大小
+        :param hop_length: 帧移
+        """
+        self.samplerate = samplerate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        # 周期hann窗, 与 librosa.filters.get_window('hann', n_fft, fftbins=True) 相同
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+        # (n_fft // 2 + 1, N_MELS) 转置保存, 帧在前时可直接右乘
+        self.mel_basis = mel_filterbank(samplerate, n_fft, N_MELS).T.copy()
+        # 只保留第2到第N_MFCC个DCT-I(ortho)系数
+        self.dct_basis = dct1_basis(N_MELS)[1:N_MFCC].T.astype(np.float32).copy()
+
+    def frames(self, y: np.ndarray) -> np.ndarray:
+        """
+        对已对齐的信号分帧(不做center填充)
+        :return: shape (T, n_fft) 的只读视图
+        """
+        if y.size < self.n_fft:
+            return np.empty((0, self.n_fft), dtype=np.float32)
+        return np.lib.stride_tricks.sliding_window_view(y, self.n_fft)[::self.hop_length]
+
+    def frames2mfcc(self, frames: np.ndarray, out: np.ndarray | None = None,
+                    work: 'MFCCWorkspace | None' = None) -> np.ndarray:
+        """
+        :param frames: shape (T, n_fft)
+        :param out: 结果写入这个数组, shape (T, N_MFCC - 1), float32
+        :param work: 中间结果使用这个工作区, 不分配内存. 结果与不使用工作区时完全相同
+        :return: shape (T, N_MFCC - 1)
+        """
+        if frames.shape[0] == 0:
+            return np.empty((0, N_MFCC - 1), dtype=np.float32) if out is None else out
+        if work is not None:
+            return self._frames2mfcc_into(frames, out, work)
+        spec = np.fft.rfft(frames * self.window, axis=1)
+        power = (spec.real ** 2 + spec.imag ** 2).astype(np.float32)
+        mel = power @ self.mel_basis
+        # power_to_db, 与 librosa 相同, top_db 相对于本次计算的最大值
+        db = 10.0 * np.log10(np.maximum(AMIN, mel))
+        np.maximum(db, db.max() - TOP_DB, out=db)
+        if out is None:
+            return db @ self.dct_basis
+        return np.matmul(db, self.dct_basis, out=out)
+
+    def _frames2mfcc_into(self, frames: np.ndarray, out: np.ndarray | None, work: 'MFCCWorkspace') -> np.ndarray:
+        # 与 frames2mfcc 相同的运算, 每一步都写入工作区
+        windowed, spec, power, imag, mel = work.buffers(frames.shape[0])
+        np.multiply(frames, self.window, out=windowed)
+        try:
+            np.fft.rfft(windowed, axis=1, out=spec)
+        except TypeError:
+            # NumPy 1.x 的 rfft 没有 out 参数
+            spec[:] = np.fft.rfft(windowed, axis=1)
+        np.multiply(spec.real, spec.real, out=power)
+        np.multiply(spec.imag, spec.imag, out=imag)
+        power += imag
+        np.matmul(power, self.mel_basis, out=mel)
+        np.maximum(AMIN, mel, out=mel)
+        np.log10(mel, out=mel)
+        mel *= 10.0
+        np.maximum(mel, mel.max() - TOP_DB, out=mel)
+        if out is None:
+            return mel @ self.dct_basis
+        return np.matmul(mel, self.dct_basis, out=out)
+
+    def mfcc(self, y: np.ndarray) -> np.ndarray:
+        """
+        对一整块音频计算MFCC, 与librosa相同, 两端各填充 n_fft // 2 个0 (center=True)
+        :return: shape (T, N_MFCC - 1)
+        """
+        pad = self.n_fft // 2
+        y = np.pad(np.asarray(y, dtype=np.float32), (pad, pad))
+        return self.frames2mfcc(self.frames(y))
+
+
+@functools.cache
+def get_plan(samplerate: int | float, n_fft: int, hop_length: int = HOP_LENGTH) -> MFCCPlan:
+    return MFCCPlan(samplerate, n_fft, hop_length)
+
+
+class MFCCWorkspace:
+    def __init__(self, plan: MFCCPlan):
+        """
+        MFCCPlan.frames2mfcc 的中间结果缓冲区, 按需要的最大帧数分配一次, 之后重复使用. 不能在多个线程中同时使用
+        """
+        self.plan = plan
+        self.capacity = 0
+        self._buffers: tuple[np.ndarray, ...] = ()
+
+    def buffers(self, frames: int) -> tuple[np.ndarray, ...]:
+        """
+        :return: (加窗后的帧, 频谱, 功率谱, 虚部平方, mel谱) 的前 frames 行
+        """
+        if frames > self.capacity:
+            n_fft = self.plan.n_fft
+            bins = n_fft // 2 + 1
+            self._buffers = (np.empty((frames, n_fft), dtype=np.float32),
+                             np.empty((frames, bins), dtype=np.complex64),
+                             np.empty((frames, bins), dtype=np.float32),
+                             np.empty((frames, bins), dtype=np.float32),
+                             np.empty((frames, N_MELS), dtype=np.float32))
+            self.capacity = frames
+        return tuple(b[:frames] for b in self._buffers)
+
+
+def analysis_hop(samplerate: int | float, analysis_rate: int | float) -> int:
+    """
+    重采样到 analysis_rate 后的帧移. 按时间换算 HOP_LENGTH 并向下取整, 每块的帧数与按原始采样率分析时相同
+    """
+    return max(1, int(HOP_LENGTH * analysis_rate / samplerate))
+
+
+def hz_to_mel(f: np.ndarray) -> np.ndarray:
+    """Slaney mel刻度, 1000Hz以下线性, 以上对数. 与 librosa.hz_to_mel(htk=False) 相同"""
+    f = np.asarray(f, dtype=np.float64)
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    return np.where(f >= min_log_hz,
+                    min_log_mel + np.log(np.maximum(f, min_log_hz) / min_log_hz) / logstep,
+                    f / f_sp)
+
+
+def mel_to_hz(m: np.ndarray) -> np.ndarray:
+    """hz_to_mel 的逆变换"""
+    m = np.asarray(m, dtype=np.float64)
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    return np.where(m >= min_log_mel, min_log_hz * np.exp(logstep * (m - min_log_mel)), f_sp * m)
+
+
+def mel_filterbank(samplerate: int | float, n_fft: int, n_mels: int = N_MELS) -> np.ndarray:
+    """
+    三角mel滤波器组(Slaney归一化), 与 librosa.filters.mel(sr=samplerate, n_fft=n_fft, n_mels=n_mels) 相同
+    :return: shape (n_mels, n_fft // 2 + 1)
+    """
+    fftfreqs = np.fft.rfftfreq(n_fft, d=1.0 / samplerate)
+    mel_f = mel_to_hz(np.linspace(hz_to_mel(0.0), hz_to_mel(samplerate / 2), n_mels + 2))
+    fdiff = np.diff(mel_f)
+    ramps = mel_f[:, None] - fftfreqs[None, :]
+    lower = -ramps[:-2] / fdiff[:-1, None]
+    upper = ramps[2:] / fdiff[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    # 每个滤波器的面积归一化
+    weights *= (2.0 / (mel_f[2:] - mel_f[:-2]))[:, None]
+    return weights.astype(np.float32)
+
+
+def dct1_basis(n: int) -> np.ndarray:
+    """
+    DCT-I(norm='ortho')的基矩阵, 与 scipy.fft.dct(np.eye(n), type=1, norm='ortho', axis=0) 相同
+    :return: shape (n, n), 第k行为第k个系数
+    """
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    w = np.ones(n)
+    w[[0, -1]] = 1 / np.sqrt(2)
+    return 2 * np.cos(np.pi * k * i / (n - 1)) * w[:, None] * w[None, :] / np.sqrt(2 * (n - 1))
+
+
+class StreamingMFCC:
+    def __init__(self, samplerate: int | float, n_fft: int, hop_length: int = HOP_LENGTH,
+                 reuse_buffers: bool = False):
+        """
+        流式MFCC, 与一次分析会话绑定.
+        保留上一块没有凑满一帧的尾部样本(STFT重叠部分), 每次 push 只输出新样本带来的帧,
+        块与块之间的帧不会丢失, 也不会重复计算.
+        :param samplerate: 采样率
+        :param n_fft: FFT窗口大小
+        :param hop_length: 帧移
+        :param reuse_buffers: 中间结果和输出都写入预分配的工作区, 稳定运行时 push 不分配内存.
+            此时 push 返回的数组在下一次 push 时会被覆盖
+        """
+        self.plan = get_plan(samplerate, n_fft, hop_length)
+        self.reuse_buffers = reuse_buffers
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._size = 0
+        self._skip = 0
+        self._history = np.empty((0, N_MFCC - 1), dtype=np.float32)
+        self._work = MFCCWorkspace(self.plan) if reuse_buffers else None
+        # reuse_buffers 时 push 的输出, 以及保存上一次输出的缓冲区
+        self._out = np.empty((0, N_MFCC - 1), dtype=np.float32)
+        self._history_buffer = np.empty((0, N_MFCC - 1), dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        # 与 center=True 相同, 会话开头填充 n_fft // 2 个0
+        pad = self.plan.n_fft // 2
+        self._size = 0
+        self._skip = 0
+        self._reserve(pad)
+        self._buffer[:pad] = 0
+        self._size = pad
+        self._history = np.empty((0, N_MFCC - 1), dtype=np.float32)
+
+    def _reserve(self, size: int):
+        if self._buffer.size < size:
+            buffer = np.zeros(size, dtype=np.float32)
+            buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+
+    def push(self, y: np.ndarray, min_frames: int = 0) -> np.ndarray:
+        """
+        输入新的音频块, 返回这块音频新增的MFCC帧
+        :param y: 单声道音频块
+        :param min_frames: 新增帧数不足时, 用之前输出过的帧在前面补足, 用于短块也能进行DTW比较
+        :return: shape (T, N_MFCC - 1)
+        """
+        plan = self.plan
+        if self._skip:
+            # hop_length > n_fft 时, 两帧之间的样本不参与计算
+            skip = min(self._skip, y.size)
+            y = y[skip:]
+            self._skip -= skip
+        self._reserve(self._size + y.size)
+        self._buffer[self._size:self._size + y.size] = y
+        self._size += y.size
+
+        frames = plan.frames(self._buffer[:self._size])
+        count = frames.shape[0]
+        if self.reuse_buffers:
+            mfccs = self._frames2mfcc_into(frames, min_frames)
+        else:
+            mfccs = plan.frames2mfcc(frames)
+
+        # 保留没有被完整帧消费的样本, 作为下一块的重叠部分
+        consumed = count * plan.hop_length
+        if consumed >= self._size:
+            self._skip = consumed - self._size
+            self._size = 0
+        elif consumed:
+            tail = self._size - consumed
+            self._buffer[:tail] = self._buffer[consumed:self._size]
+            self._size = tail
+
+        if self.reuse_buffers:
+            return mfccs
+        if count < min_frames and self._history.shape[0]:
+            mfccs = np.concatenate((self._history[-(min_frames - count):], mfccs))
+        if count:
+            self._history = mfccs
+        return mfccs
+
+    def _frames2mfcc_into(self, frames: np.ndarray, min_frames: int) -> np.ndarray:
+        # 与 push 中分配内存的版本结果相同: 先在输出的前面补上之前的帧, 再把新的帧写在后面
+        count = frames.shape[0]
+        history = self._history
+        pad = min(min_frames - count, history.shape[0]) if count < min_frames else 0
+        if self._out.shape[0] < pad + count:
+            self._out = np.empty((pad + count, N_MFCC - 1), dtype=np.float32)
+        out = self._out[:pad + count]
+        out[:pad] = history[history.shape[0] - pad:]
+        self.plan.frames2mfcc(frames, out=out[pad:], work=self._work)
+        if count:
+            if self._history_buffer.shape[0] < out.shape[0]:
+                self._history_buffer = np.empty_like(out)
+            self._history = self._history_buffer[:out.shape[0]]
+            self._history[:] = out
+        return out
+
+
+class BlockMFCC:
+    def __init__(self, samplerate: int | float, n_fft: int, block_size: int, context: int,
+                 hop_length: int = HOP_LENGTH):
+        """
+        整段音频的批量MFCC. 一次对很多块做一次STFT, 结果与把音频按 block_size 分块依次输入 StreamingMFCC 完全相同:
+        每一帧归属于它最后一个样本所在的块, top_db 按块计算.
+        可以分多次输入以限制内存, 每次输入的长度(最后一次除外)必须是 block_size 的整数倍, 或者在 push 时给出每块的结束位置.
+        :param samplerate: 采样率
+        :param n_fft: FFT窗口大小
+        :param block_size: 块大小
+        :param context: 保留上一次输入的最后多少帧, 用于补足下一次输入开头的块
+        :param hop_length: 帧移
+        """
+        self.plan = get_plan(samplerate, n_fft, hop_length)
+        self.block_size = block_size
+        self.context = context
+        pad = n_fft // 2
+        # 与 center=True 相同, 开头填充 n_fft // 2 个0. 位置均为填充后信号中的绝对位置
+        self._tail = np.zeros(pad, dtype=np.float32)
+        self._tail_start = 0
+        self._next_frame = 0
+        self._samples = 0
+        self._carry = np.empty((0, N_MFCC - 1), dtype=np.float32)
+
+    def push(self, y: np.ndarray, block_ends: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :param y: 单声道音频, 包含 ceil(len(y) / block_size) 块
+        :param block_ends: 每块结束的位置(从第一次输入开始计数的样本数), 块大小不固定时使用,
+            例如重采样后每块的样本数不是整数时. 为None时按 block_size 分块
+        :return: (mfccs, ends, counts)
+            mfccs: shape (T, N_MFCC - 1), 开头是上一次输入保留的最多 context 帧, 之后是本次新增的帧
+            ends: 每块结束时 mfccs 中已有的帧数
+            counts: 每块新增的帧数
+        """
+        plan = self.plan
+        hop = plan.hop_length
+        n_fft = plan.n_fft
+        pad = n_fft // 2
+        if block_ends is None:
+            block_ends = np.minimum(self._samples + self.block_size * np.arange(1, -(-y.size // self.block_size) + 1),
+                                    self._samples + y.size)
+        blocks = len(block_ends)
+
+        buffer = np.concatenate((self._tail, np.asarray(y, dtype=np.float32)))
+        end = self._tail_start + buffer.size
+        first = self._next_frame
+        last = (end - n_fft) // hop + 1 if end >= n_fft else 0
+        if last > first:
+            offset = first * hop - self._tail_start
+            frames = np.lib.stride_tricks.sliding_window_view(buffer[offset:], n_fft)[::hop][:last - first]
+        else:
+            frames = np.empty((0, n_fft), dtype=np.float32)
+
+        # 每一帧所属的块
+        owner = np.searchsorted(block_ends, np.arange(first, max(last, first)) * hop + n_fft - 1 - pad, side='right')
+        counts = np.bincount(owner, minlength=blocks)[:blocks]
+        mfccs = self._frames2mfcc(frames, counts)
+
+        self._next_frame = max(last, first)
+        keep = min(self._next_frame * hop - self._tail_start, buffer.size)
+        self._tail = buffer[keep:].copy()
+        self._tail_start += keep
+        self._samples += y.size
+
+        carry = self._carry
+        mfccs = np.concatenate((carry, mfccs))
+        self._carry = mfccs[-self.context:] if self.context else mfccs[:0]
+        return mfccs, carry.shape[0] + np.cumsum(counts), counts
+
+    def _frames2mfcc(self, frames: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        plan = self.plan
+        if frames.shape[0] == 0:
+            return np.empty((0, N_MFCC - 1), dtype=np.float32)
+        spec = np.fft.rfft(frames * plan.window, axis=1)
+        power = (spec.real ** 2 + spec.imag ** 2).astype(np.float32)
+        db = 10.0 * np.log10(np.maximum(AMIN, power @ plan.mel_basis))
+        # top_db 相对于每一块自己的最大值, 与逐块计算相同
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[counts > 0]
+        block_max = np.maximum.reduceat(db.max(axis=1), starts)
+        np.maximum(db, np.repeat(block_max, counts[counts > 0])[:, None] - TOP_DB, out=db)
+        return db @ plan.dct_basis
@@ -0,0 +1,245 @@
+import bisect
+import json
+import threading
+import time
+import traceback
+
+# 各阶段耗时直方图的桶上界(秒)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # 最后一个桶是 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数, 返回所在桶的上界, 落在最后一个桶时返回最大值"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], self.counts)),
+        }
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 't0')
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.stage, time.perf_counter() - self.t0)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+# 未开启统计时使用, 不计时也不分配对象
+NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    def __init__(self):
+        """
+        热路径统计: 各阶段耗时直方图, 计数器(块数、音频时长、欠载、丢弃、迟到等)和队列深度.
+        可以在多个线程中同时记录. 交给 Analyser / VTSAdapter 的 metrics 参数即可开启, 不传时没有任何统计开销.
+
+        阶段:
+            read: 读取一块音频(SoundFile.read 或等待迭代器)
+            write: 把音频写入输出流或环形缓冲区
+            process: 分析一块音频, 其中包括 mfcc, dtw, softmax
+            callback: 用户回调, 通常包括发送参数
+            vts_request: VTSWebSocket.request 的一次往返
+            vts_send: AsyncVTSWebSocket 发送一条消息
+        """
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, float] = {}
+        self.gauges: dict[str, float] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            h = self.histograms.get(stage)
+            if h is None:
+                h = self.histograms[stage] = Histogram()
+            h.observe(seconds)
+
+    def time(self, stage: str) -> _Timer:
+        """
+        用法: with metrics.time('mfcc'): ...
+        """
+        return _Timer(self, stage)
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def timed_blocks(self, blocks, samplerate: int | float):
+        """
+        包装音频块迭代器, 记录每块的读取耗时、块数和音频时长
+        """
+        it = iter(blocks)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                data = next(it)
+            except StopIteration:
+                return
+            self.observe('read', time.perf_counter() - t0)
+            self.inc('blocks')
+            self.inc('audio_seconds', len(data) / samplerate)
+            yield data
+
+    def realtime_factor(self) -> float:
+        """每秒分析耗时能处理多少秒音频, 小于1说明分析跟不上播放"""
+        with self._lock:
+            audio = self.counters.get('audio_seconds', 0)
+            process = self.histograms.get('process')
+            busy = process.sum if process is not None else 0.0
+        return audio / busy if busy else 0.0
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> dict:
+        """
+        :return: 可以直接序列化为JSON的统计快照
+        """
+        realtime_factor = self.realtime_factor()
+        with self._lock:
+            return {
+                'time': time.time(),
+                'started': self.started,
+                'stages': {k: h.snapshot() for k, h in self.histograms.items()},
+                'counters': dict(self.counters),
+                'gauges': {**self.gauges, 'realtime_factor': realtime_factor},
+            }
+
+    def to_prometheus(self, prefix: str = 'pymouth') -> str:
+        """
+        :return: Prometheus 文本格式
+        """
+        snapshot = self.snapshot()
+        lines = [f'# HELP {prefix}_stage_seconds Hot path stage latency.',
+                 f'# TYPE {prefix}_stage_seconds histogram']
+        for stage, h in sorted(snapshot['stages'].items()):
+            cumulative = 0
+            for bound, n in h['buckets'].items():
+                cumulative += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {h["sum"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {h["count"]}')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total {value}')
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class SnapshotReporter:
+    def __init__(self, metrics: Metrics, sink, interval: float = 10.0):
+        """
+        定期导出JSON快照
+        :param metrics: 统计
+        :param sink: 文件路径(每个快照追加一行JSON), 或接收快照dict的函数
+        :param interval: 导出间隔(秒)
+        """
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        self.metrics = metrics
+        self.sink = sink
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def report(self):
+        snapshot = self.metrics.snapshot()
+        if callable(self.sink):
+            self.sink(snapshot)
+            return
+        with open(self.sink, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(snapshot) + '\n')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        # 停止时补一次, 不丢失最后一段的统计
+        try:
+            self.report()
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,394 @@
+import collections
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import sounddevice as sd
+
+# 每次音频回调(以及同步播放时每次写入)的最大帧数, 与分析的块大小无关. 中断最多要等这么多帧才生效
+CALLBACK_FRAMES = 512
+# 中断时的淡出时长(秒), 直接截断波形会有爆音
+FADE_SECONDS = 0.005
+
+
+class RingBuffer:
+    def __init__(self, capacity: int, channels: int, dtype: np.dtype = np.float32):
+        """
+        预分配的单生产者/单消费者环形缓冲区.
+        读写位置只增不减, 且分别只由消费者和生产者修改, 因此不需要加锁.
+        :param capacity: 容量(帧)
+        :param channels: 声道数
+        :param dtype: 数据类型
+        """
+        self.buffer = np.zeros((capacity, channels), dtype=dtype)
+        self.capacity = capacity
+        self.read_index = 0
+        self.write_index = 0
+
+    def available(self) -> int:
+        """可读帧数"""
+        return self.write_index - self.read_index
+
+    def space(self) -> int:
+        """可写帧数"""
+        return self.capacity - self.available()
+
+    def write(self, data: np.ndarray) -> int:
+        """
+        写入尽可能多的帧, 不会阻塞
+        :param data: shape (n,) 或 (n, channels)
+        :return: 实际写入的帧数
+        """
+        data = data.reshape(len(data), -1)
+        n = min(len(data), self.space())
+        start = self.write_index % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        self.buffer[:n - first] = data[first:n]
+        self.write_index += n
+        return n
+
+    def read(self, out: np.ndarray) -> int:
+        """
+        读取帧到 out 中, 不足的部分填充0, 不会阻塞
+        :param out: shape (n, channels)
+        :return: 实际读取的帧数
+        """
+        n = min(len(out), self.available())
+        start = self.read_index % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:n] = self.buffer[:n - first]
+        out[n:] = 0
+        self.read_index += n
+        return n
+
+    def clear(self):
+        """丢弃所有未读的帧, 只能由消费者调用"""
+        self.read_index = self.write_index
+
+
+class CallbackPlayer:
+    def __init__(self,
+                 samplerate: int | float,
+                 channels: int,
+                 device: int,
+                 dtype: np.dtype = np.float32,
+                 block_size: int = 4096,
+                 buffer_blocks: int = 4,
+                 prebuffer_blocks: int | None = None):
+        """
+        基于 sounddevice 回调的播放器. 音频回调只从环形缓冲区取数据, 从不等待分析或网络.
+        :param samplerate: 采样率
+        :param channels: 声道数
+        :param device: 输出设备Index
+        :param dtype: 数据类型
+        :param block_size: 块大小, 环形缓冲区和预缓冲以块为单位. 每次回调的帧数不超过 CALLBACK_FRAMES,
+            这样 fade_out 可以在一块的中间生效
+        :param buffer_blocks: 环形缓冲区能容纳的块数
+        :param prebuffer_blocks: 缓冲区中有多少块时开始播放, 默认为缓冲区写满时. 越小开始得越快, 但越容易欠载
+        """
+        self.ring = RingBuffer(block_size * buffer_blocks, channels, dtype)
+        self.prebuffer = block_size * (buffer_blocks if prebuffer_blocks is None else prebuffer_blocks)
+        self.samplerate = samplerate
+        self.block_duration = block_size / samplerate
+        self.underflow_count = 0
+        self.overflow_count = 0
+        self.frames_played = 0
+        self.aborted = False
+        # 没有数据要播放(例如常驻的输出流在两段语音之间), 此时缓冲区为空不算欠载
+        self.idle = False
+        # fade_out 之后丢弃缓冲区中的数据, 直到 resume
+        self.muted = False
+        # 最近一次 fade_out 从调用到淡出的第一帧被听到的时间(秒)
+        self.interrupt_latency: float | None = None
+        # (帧位置, 这一帧被听到的 time.perf_counter() 时刻), 每次回调更新
+        self._clock: tuple[int, float] | None = None
+        self._eof = False
+        self._finished = threading.Event()
+        self._fade_frames = max(1, int(FADE_SECONDS * samplerate))
+        # 还没有执行的 fade_out 的调用时刻, 以及淡出后是否停止
+        self._fade_requested: float | None = None
+        self._stop_after_fade = False
+        # resume 时的写入位置, 回调丢弃这之前的数据后恢复播放
+        self._resume_at: int | None = None
+        import sounddevice as sd
+        self._callback_stop = sd.CallbackStop
+        self.stream = sd.OutputStream(samplerate=samplerate,
+                                      blocksize=min(block_size, CALLBACK_FRAMES),
+                                      device=device,
+                                      channels=channels,
+                                      dtype=dtype,
+                                      callback=self._callback,
+                                      finished_callback=self._finished.set)
+
+    def _callback(self, outdata: np.ndarray, frames: int, time_info, status: 'sd.CallbackFlags'):
+        if status.output_underflow:
+            self.underflow_count += 1
+        # outdata 中第一帧到达DAC的时间, 部分宿主API不提供时使用流的输出延迟估算
+        delay = time_info.outputBufferDacTime - time_info.currentTime
+        if delay <= 0:
+            delay = self.stream.latency
+        heard = time.perf_counter() + delay
+        self._clock = (self.ring.read_index, heard)
+        if self.muted:
+            self._mute(outdata, frames, heard)
+            return
+        n = self.ring.read(outdata)
+        self.frames_played += n
+        if n < frames:
+            if self._eof:
+                raise self._callback_stop
+            if not self.idle:
+                self.underflow_count += 1
+
+    def _mute(self, outdata: np.ndarray, frames: int, heard: float):
+        ring = self.ring
+        resume = self._resume_at
+        requested = self._fade_requested
+        if requested is not None:
+            # 只淡出 fade_out 之前写入的数据
+            fade = min(self._fade_frames, frames, ring.available() if resume is None else resume - ring.read_index)
+            n = ring.read(outdata[:max(fade, 0)])
+            if n:
+                np.multiply(outdata[:n], np.linspace(1, 0, n, dtype=np.float32)[:, None], out=outdata[:n],
+                            casting='unsafe')
+            outdata[n:] = 0
+            self.frames_played += n
+            self.interrupt_latency = heard - requested
+            self._fade_requested = None
+        else:
+            outdata[:] = 0
+        if self._stop_after_fade:
+            ring.clear()
+            raise self._callback_stop
+        if resume is None:
+            ring.clear()
+        else:
+            ring.read_index = max(ring.read_index, resume)
+            self._resume_at = None
+            self.muted = False
+
+    def fade_out(self, stop: bool = True):
+        """
+        中断播放: 下一次回调(最多 CALLBACK_FRAMES 帧之后)把缓冲区开头的 FADE_SECONDS 淡出, 丢弃其余的数据.
+        输出设备自身缓冲的音频(见 stream.latency)仍会播放完.
+        :param stop: 淡出后是否停止输出流. 为False时之后一直输出静音, 直到 resume
+        """
+        if self.muted:
+            return
+        # 先静音再标记结束: 回调在两者之间运行时, 只会看到静音(淡出), 不会因为结束标记直接截断波形
+        self._stop_after_fade = stop
+        self._fade_requested = time.perf_counter()
+        self.muted = True
+        if stop:
+            self._eof = True
+            self.aborted = True
+        if not self.stream.active:
+            # 还没有开始播放, 没有需要淡出的声音
+            self._fade_requested = None
+
+    def resume(self):
+        """
+        fade_out(stop=False) 之后恢复播放, 只能由写入数据的线程调用. 之前写入的数据都会被丢弃
+        """
+        if self.muted:
+            self._resume_at = self.ring.write_index
+
+    def presentation_time(self, frame: int) -> float | None:
+        """
+        估算第 frame 帧(从播放器创建开始计数)被听到的时刻
+        :return: time.perf_counter() 时间, 还没有开始播放时返回 None
+        """
+        clock = self._clock
+        if clock is None:
+            return None
+        return clock[1] + (frame - clock[0]) / self.samplerate
+
+    def start(self):
+        if not self.stream.active and not self._finished.is_set():
+            self.stream.start()
+
+    def write(self, data: np.ndarray, block: bool = True) -> bool:
+        """
+        把音频写入环形缓冲区. 缓冲区中的数据达到预缓冲大小时自动开始播放, 避免开头就出现欠载
+        :param data: 音频块
+        :param block: 缓冲区已满时是否等待. 不等待时放不下的帧会被丢弃, 并计入 overflow_count
+        :return: 是否全部写入
+        """
+        written = self.ring.write(data)
+        if written < len(data) or self.ring.available() >= self.prebuffer:
+            self.start()
+        if not block:
+            if written < len(data):
+                self.overflow_count += 1
+                return False
+            return True
+        while written < len(data):
+            if not self.stream.active:
+                return False
+            time.sleep(self.block_duration / 8)
+            written += self.ring.write(data[written:])
+        return True
+
+    def drain(self, timeout: float | None = None):
+        """标记数据已经写完, 等待缓冲区中的音频全部播放完毕"""
+        if self.muted and self._resume_at is None:
+            # fade_out(stop=False) 之后没有 resume, 没有要播放的数据, 下一次回调淡出后直接停止
+            self._stop_after_fade = True
+        self._eof = True
+        self.start()
+        self._finished.wait(timeout)
+
+    def abort(self):
+        """立即停止播放, 丢弃缓冲区中的音频"""
+        self._eof = True
+        self.aborted = True
+        self.stream.abort()
+        self.ring.clear()
+
+    def close(self):
+        self.stream.close()
+
+
+class AnalysisWorker:
+    def __init__(self, handler, max_pending: int = 8, executor: Executor | None = None):
+        """
+        在独立线程中执行分析和参数发送, 播放线程只负责提交数据.
+        数据按提交顺序逐个处理. 分析跟不上时丢弃最旧的数据, 让口型追上声音, 丢弃的块数记录在 dropped_count 中.
+        :param handler: 处理函数, 接收一个音频块
+        :param max_pending: 最多积压的块数
+        :param executor: 共享的线程池. 每次只向线程池提交一个块, 处理完再提交下一个,
+            多个 AnalysisWorker 共享同一个线程池时可以公平地分配CPU. 默认使用独占的线程
+        """
+        self.handler = handler
+        self.max_pending = max_pending
+        self.dropped_count = 0
+        self._own_executor = executor is None
+        self.executor = ThreadPoolExecutor(1) if executor is None else executor
+        self._items = collections.deque()
+        self._scheduled = False
+        self._cond = threading.Condition()
+
+    def _drain(self):
+        with self._cond:
+            if not self._items:
+                # 提交之后数据被 join(discard=True) 丢弃了
+                self._scheduled = False
+                self._cond.notify_all()
+                return
+            item, _ = self._items.popleft()
+            self._cond.notify_all()
+        try:
+            self.handler(item)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._cond:
+                if self._items:
+                    self.executor.submit(self._drain)
+                else:
+                    self._scheduled = False
+                    self._cond.notify_all()
+
+    def pending(self) -> int:
+        """积压的块数"""
+        return len(self._items)
+
+    def submit(self, item, block: bool = False, required: bool = False):
+        """
+        :param item: 待处理的数据
+        :param block: 积压已满时是否等待. 不等待时丢弃最旧的数据
+        :param required: 这项数据不会被丢弃(例如一段语音结束的标记), 积压已满时丢弃之前最旧的其他数据
+        """
+        with self._cond:
+            if block:
+                while len(self._items) >= self.max_pending:
+                    self._cond.wait()
+            elif len(self._items) >= self.max_pending:
+                for i, (_, keep) in enumerate(self._items):
+                    if not keep:
+                        del self._items[i]
+                        self.dropped_count += 1
+                        break
+            self._items.append((item, required))
+            if not self._scheduled:
+                self._scheduled = True
+                self.executor.submit(self._drain)
+
+    def join(self, discard: bool = False):
+        """
+        等待积压的数据处理完毕
+        :param discard: 是否丢弃还没有处理的数据
+        """
+        with self._cond:
+            if discard:
+                self._items.clear()
+            while self._scheduled:
+                self._cond.wait()
+        if self._own_executor:
+            self.executor.shutdown()
+
+
+class PresentationScheduler:
+    def __init__(self, clock, poll_interval: float = 0.005):
+        """
+        按音频被听到的时刻发布分析结果. 提交的帧位置必须单调递增.
+        :param clock: 帧位置 -> 被听到的 time.perf_counter() 时刻, 时刻未知时返回 None. 通常是 CallbackPlayer.presentation_time
+        :param poll_interval: 时刻未知时的轮询间隔(秒)
+        """
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.late_count = 0
+        self.queue = queue.Queue()
+        self._closing = False
+        self._cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, fn = item
+            while not self._cancelled.is_set():
+                due = self.clock(frame)
+                if due is None and self._closing:
+                    # 播放已经结束但从未开始计时, 不再等待
+                    break
+                delay = self.poll_interval if due is None else due - time.perf_counter()
+                if due is not None and delay <= 0:
+                    break
+                self._cancelled.wait(min(delay, self.poll_interval * 10))
+            if self._cancelled.is_set():
+                continue
+            if due is not None and time.perf_counter() - due > self.poll_interval * 10:
+                self.late_count += 1
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+
+    def submit(self, frame: int, fn):
+        """
+        :param frame: 音频块第一帧的位置
+        :param fn: 到达该时刻时执行的函数
+        """
+        self.queue.put((frame, fn))
+
+    def join(self, discard: bool = False):
+        """
+        :param discard: 是否丢弃还没有发布的结果
+        """
+        self._closing = True
+        if discard:
+            self._cancelled.set()
+        self.queue.put(None)
+        self.thread.join()
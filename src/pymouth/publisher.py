@@ -0,0 +1,122 @@
+import threading
+import time
+import traceback
+
+from .vts_websockets import VTSParameterData
+
+# 两次分析结果之间最长的插值时长(秒), 更长的间隔视为新的一段语音
+MAX_INTERPOLATION = 0.5
+
+
+class ParameterPublisher:
+    def __init__(self, send, rate: float = 60.0, epsilon: float = 0.01, keepalive: float = 0.5):
+        """
+        以固定频率发布口型参数.
+        分析结果通过 update 提交, 发布线程在两次分析结果之间做线性插值, 变化小于 epsilon 的参数不发送,
+        同一次发布的所有参数合并为一个请求.
+        :param send: 发送函数, 接收 list[VTSParameterData], 例如 VTSWebSocket.set_params
+        :param rate: 发布频率(Hz)
+        :param epsilon: 与上次发送的值相比, 变化小于这个值的参数不发送
+        :param keepalive: 超过这个时间(秒)没有发送时, 重新发送所有参数. VTS在1秒内收不到参数会收回控制权
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.send = send
+        self.interval = 1 / rate
+        self.epsilon = epsilon
+        self.keepalive = keepalive
+        self.sent_count = 0
+        self.suppressed_count = 0
+        # 参数id -> (起始值, 目标值, 起始时刻, 插值时长)
+        self._segments: dict[str, tuple[float, float, float, float]] = {}
+        self._sent: dict[str, float] = {}
+        self._last_send = 0.0
+        self._last_update: float | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def update(self, values: dict[str, float], now: float | None = None):
+        """
+        提交一次分析结果, 参数会在距上次提交的时长内从当前值过渡到新值. 可以在任意线程中调用
+        :param values: 参数id -> 值
+        """
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            if self._last_update is None:
+                duration = self.interval
+            else:
+                duration = min(max(now - self._last_update, self.interval), MAX_INTERPOLATION)
+            self._last_update = now
+            for k, v in values.items():
+                current = self._value_at(k, now)
+                self._segments[k] = (v if current is None else current, float(v), now, duration)
+
+    def _value_at(self, k: str, now: float) -> float | None:
+        segment = self._segments.get(k)
+        if segment is None:
+            return None
+        start, target, t0, duration = segment
+        return start + (target - start) * min(max((now - t0) / duration, 0.0), 1.0)
+
+    def tick(self, now: float | None = None) -> list[VTSParameterData]:
+        """
+        发布一次当前的插值结果
+        :return: 本次发送的参数
+        """
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            values = {k: self._value_at(k, now) for k in self._segments}
+            # 只在仍有分析结果提交时保持控制权, 说完之后交还给VTS
+            active = self._last_update is not None and now - self._last_update < self.keepalive * 2
+
+        if active and now - self._last_send >= self.keepalive:
+            changed = list(values)
+        else:
+            changed = [k for k, v in values.items() if k not in self._sent or abs(v - self._sent[k]) >= self.epsilon]
+        self.suppressed_count += len(values) - len(changed)
+        if not changed:
+            return []
+
+        params = [VTSParameterData(k, values[k]) for k in changed]
+        self.send(params)
+        self._sent.update((k, values[k]) for k in changed)
+        self._last_send = now
+        self.sent_count += 1
+        return params
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while True:
+            next_tick += self.interval
+            now = time.perf_counter()
+            if next_tick < now:
+                # 发送太慢时跳过错过的节拍, 不追赶
+                next_tick = now
+            if self._stop.wait(next_tick - now):
+                break
+            try:
+                self.tick()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,147 @@
+import functools
+import math
+
+import numpy as np
+
+# 滤波器每侧的过零点数, 越大过渡带越窄, 计算量与之成正比
+ZEROS = 8
+# 截止频率相对于较低的奈奎斯特频率的比例
+ROLLOFF = 0.9
+KAISER_BETA = 8.0
+
+
+@functools.cache
+def polyphase_filter(up: int, down: int) -> tuple[np.ndarray, int]:
+    """
+    有理数重采样(先插值 up 倍, 低通, 再抽取 down 倍)的多相低通滤波器, 按 (up, down) 缓存.
+    :return: (filters, half)
+        filters: shape (up, taps), 第p行是第p相的系数, 已经倒序, 可以直接与按时间顺序排列的输入窗口做点积
+        half: 原型滤波器的半长(插值后的采样点)
+    """
+    m = max(up, down)
+    half = ZEROS * m
+    n = np.arange(-half, half + 1)
+    cutoff = ROLLOFF / m
+    # Kaiser窗sinc, 增益 up 补偿插值时补0损失的能量
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(2 * half + 1, KAISER_BETA) * up
+    taps = -(-h.size // up)
+    h = np.concatenate((h, np.zeros(taps * up - h.size)))
+    # 第p相: h[p], h[p + up], h[p + 2up], ...
+    return np.ascontiguousarray(h.reshape(taps, up).T[:, ::-1], dtype=np.float32), half
+
+
+class Resampler:
+    def __init__(self, source_rate: int | float, target_rate: int | float):
+        """
+        多相FIR重采样. 滤波器在创建时计算(相同的比例共享), 之后每个输出样本只做一次点积.
+        输出的第 m 个样本对应输入时间 m * source_rate / target_rate, 没有群延迟.
+        :param source_rate: 输入采样率
+        :param target_rate: 输出采样率
+        """
+        source_rate, target_rate = int(source_rate), int(target_rate)
+        if source_rate <= 0 or target_rate <= 0:
+            raise ValueError("Samplerate must be positive")
+        g = math.gcd(source_rate, target_rate)
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self.up = target_rate // g
+        self.down = source_rate // g
+        self.filters, self.half = polyphase_filter(self.up, self.down)
+        self.taps = self.filters.shape[1]
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0
+        self._next = 0
+
+    def reset(self):
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0
+        self._next = 0
+
+    def output_count(self, n: int) -> int:
+        """流式输入 n 个样本后, push 累计输出的样本数"""
+        return max(0, (n * self.up - self.half - 1) // self.down + 1)
+
+    def push(self, x: np.ndarray) -> np.ndarray:
+        """
+        流式重采样, 保留滤波器需要的历史样本, 块与块之间是连续的.
+        每个输出样本要等到它之后 half / up 个输入样本到达才能计算, 所以输出比输入晚不到1毫秒
+        """
+        x = np.asarray(x, dtype=np.float32)
+        buf = np.concatenate((self._history, x))
+        offset = self._consumed - self._history.size
+        self._consumed += x.size
+        count = self.output_count(self._consumed) - self._next
+        y = self._compute(buf, offset, self._next, count)
+        self._next += count
+        self._history = buf[buf.size - (self.taps - 1):].copy() if self.taps > 1 else buf[:0]
+        return y
+
+    def resample(self, x: np.ndarray) -> np.ndarray:
+        """
+        独立重采样一块音频, 两端视为0, 输出 ceil(len(x) * up / down) 个样本. 不影响 push 的状态
+        """
+        x = np.asarray(x, dtype=np.float32)
+        count = -(-x.size * self.up // self.down)
+        if not count:
+            return np.empty(0, dtype=np.float32)
+        last = ((count - 1) * self.down + self.half) // self.up
+        buf = np.concatenate((np.zeros(self.taps - 1, dtype=np.float32), x,
+                              np.zeros(max(0, last - (x.size - 1)), dtype=np.float32)))
+        return self._compute(buf, -(self.taps - 1), 0, count)
+
+    def _compute(self, buf: np.ndarray, offset: int, first: int, count: int) -> np.ndarray:
+        """
+        :param buf: 输入, buf[j] 是第 j + offset 个输入样本
+        :param first: 第一个输出样本的序号
+        :param count: 输出样本数
+        """
+        if count <= 0:
+            return np.empty(0, dtype=np.float32)
+        kernel = _numba_kernel()
+        if kernel is not None:
+            return kernel(buf, self.filters, self.up, self.down, self.half, offset, first, count)
+        t = np.arange(first, first + count) * self.down + self.half
+        # 每个输出样本用到的最新的输入样本, 以及所用的相
+        newest = t // self.up - offset
+        windows = np.lib.stride_tricks.sliding_window_view(buf, self.taps)[newest - (self.taps - 1)]
+        return np.einsum('ij,ij->i', windows, self.filters[t % self.up])
+
+
+@functools.cache
+def get_resampler(source_rate: int | float, target_rate: int | float) -> Resampler:
+    """
+    独立分块重采样(Resampler.resample)使用的共享实例, 流式重采样请为每个会话创建新的 Resampler
+    """
+    return Resampler(source_rate, target_rate)
+
+
+@functools.cache
+def _numba_kernel():
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit('float32[::1](float32[::1], float32[:, ::1], int64, int64, int64, int64, int64, int64)',
+                cache=True, nogil=True, fastmath=True, boundscheck=False)
+    def kernel(buf, filters, up, down, half, offset, first, count):
+        taps = filters.shape[1]
+        y = np.empty(count, dtype=np.float32)
+        # 每输出一个样本, 相位前进 down % up, 输入位置前进 down // up (相位溢出时再加1), 不需要每个样本做除法
+        t = first * down + half
+        phase = t % up
+        start = t // up - offset - (taps - 1)
+        step, rest = down // up, down % up
+        for k in range(count):
+            s = np.float32(0.0)
+            for i in range(taps):
+                s += buf[start + i] * filters[phase, i]
+            y[k] = s
+            phase += rest
+            start += step
+            if phase >= up:
+                phase -= up
+                start += 1
+        return y
+
+    return kernel
@@ -0,0 +1,316 @@
+import itertools
+import math
+import queue
+import threading
+import time
+import traceback
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .audio_source import AudioInput, open_audio, reblock, convert, ReadAhead
+from .playback import CallbackPlayer, AnalysisWorker, PresentationScheduler
+from .resample import Resampler
+
+if TYPE_CHECKING:
+    from .analyser import Analyser
+
+
+class Utterance:
+    def __init__(self, audio: AudioInput, samplerate: int | float | None, priority: int, finished_callback=None):
+        """
+        PlaybackSession 队列中的一段语音, 由 PlaybackSession.play 创建
+        """
+        self.audio = audio
+        self.samplerate = samplerate
+        self.priority = priority
+        self.finished_callback = finished_callback
+        # 在会话中的起止帧位置(会话的采样率), 开始播放后才有值
+        self.start_frame: int | None = None
+        self.end_frame: int | None = None
+        # 是否被 PlaybackSession.interrupt 中断
+        self.interrupted = False
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        等待这段语音播放完毕(最后一帧被听到), 或者被丢弃
+        :return: 是否已经结束
+        """
+        return self._done.wait(timeout)
+
+    def _finish(self):
+        if self._done.is_set():
+            return
+        try:
+            if self.finished_callback is not None:
+                self.finished_callback()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._done.set()
+
+
+class PlaybackSession:
+    def __init__(self,
+                 analyser: 'Analyser',
+                 output_device: int | None,
+                 samplerate: int,
+                 callback,
+                 channels: int = 1,
+                 dtype: np.dtype = np.float32,
+                 block_size: int = 4096,
+                 buffer_blocks: int = 4):
+        """
+        常驻的播放会话, 由 Analyser.open_session 创建.
+        输出流在会话开始时打开一次, 之后一直保持打开, 打开设备的开销不再计入每一句话.
+        提交的语音排队依次写入同一个环形缓冲区, 前后两句之间没有间隙, 分析器的状态(流式MFCC, 包络等)也在句子之间延续.
+        分析结果在对应的音频被听到时才调用 callback, 与 lookahead 相同.
+        会话期间分析器不能同时用于 action_block.
+        :param analyser: 分析器
+        :param output_device: 输出设备Index, 为None时不播放, 只按顺序分析并立即回调
+        :param samplerate: 输出流的采样率, 采样率不同的语音会先重采样到这个采样率
+        :param callback: 与 action_block 的 callback 相同: callback(result, data)
+        :param channels: 输出流的声道数, 1 或 2. 单声道语音在立体声输出中复制到两个声道, 立体声语音在单声道输出中取第一个声道
+        :param dtype: 输出流的数据类型
+        :param block_size: 每块的帧数
+        :param buffer_blocks: 环形缓冲区能容纳的块数
+        """
+        if channels not in (1, 2):
+            raise ValueError('Only single or dual channels are supported.')
+        self.analyser = analyser
+        self.samplerate = samplerate
+        self.callback = callback
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.block_size = block_size
+        # 已经写入的帧数, 即下一块在会话中的位置
+        self.position = 0
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        # 已经提交但还没有结束的语音
+        self._active: set[Utterance] = set()
+        self._lock = threading.Lock()
+        self._discard = False
+        self._closed = False
+        # 每次 interrupt 加1, 之前的分析结果不再发布
+        self._generation = 0
+        self._publish_lock = threading.Lock()
+
+        analyser._begin_session(samplerate, block_size)
+        self.player = None
+        self.scheduler = None
+        if output_device is not None:
+            self.player = CallbackPlayer(samplerate, channels, output_device, self.dtype, block_size,
+                                         buffer_blocks=buffer_blocks, prebuffer_blocks=1)
+            self.player.idle = True
+            # 立即开始, 空闲时输出静音, 之后的语音写入缓冲区后在下一次回调中就会播放
+            self.player.start()
+            self.scheduler = PresentationScheduler(self.player.presentation_time)
+        self.worker = AnalysisWorker(self._handle, executor=analyser.analysis_executor)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def play(self,
+             audio: AudioInput,
+             samplerate: int | float | None = None,
+             priority: int = 0,
+             finished_callback=None) -> Utterance:
+        """
+        把一段语音加入队列, 立即返回.
+        :param audio: 音频数据, action_block 支持的任意输入
+        :param samplerate: 音频的采样率, 为None时与会话相同. 文件输入时以文件的采样率为准
+        :param priority: 优先级, 越大越先播放, 相同时按提交顺序. 正在播放的语音不会被打断
+        :param finished_callback: 这段语音的最后一帧被听到(或者被丢弃)时调用
+        """
+        if self._closed:
+            raise RuntimeError('Playback session is closed')
+        utterance = Utterance(audio, samplerate, priority, finished_callback)
+        with self._lock:
+            self._active.add(utterance)
+        self._queue.put((-priority, next(self._order), utterance))
+        return utterance
+
+    def pending(self) -> int:
+        """排队中还没有开始播放的语音数"""
+        return self._queue.qsize()
+
+    def clear(self):
+        """丢弃排队中还没有开始播放的语音, 正在播放的语音不受影响"""
+        while True:
+            try:
+                _, _, utterance = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if utterance is None:
+                # 关闭标记
+                self._queue.put((math.inf, next(self._order), None))
+                break
+            self._end(utterance)
+
+    def interrupt(self, clear: bool = False):
+        """
+        中断正在播放的语音, 可以在任何线程中调用: 下一次音频回调(最多 CALLBACK_FRAMES 帧之后)淡出并丢弃缓冲区中剩余的数据,
+        还没有发布的分析结果被丢弃, 并立即以无声的结果(见 Analyser.silence)和一块全0的数据调用 callback.
+        输出流保持打开, 之后继续播放队列中的语音.
+        :param clear: 是否同时丢弃排队中还没有开始播放的语音
+        """
+        t0 = time.perf_counter()
+        if clear:
+            self.clear()
+        if self.player is not None:
+            self.player.fade_out(stop=False)
+        with self._publish_lock:
+            self._generation += 1
+            try:
+                shape = self.block_size if self.channels == 1 else (self.block_size, self.channels)
+                self.callback(self.analyser.silence(), np.zeros(shape, dtype=self.dtype))
+            except Exception:
+                traceback.print_exc()
+        if self.analyser.metrics is not None:
+            self.analyser.metrics.observe('interrupt', time.perf_counter() - t0)
+
+    def close(self, discard: bool = False):
+        """
+        结束会话, 关闭输出流
+        :param discard: 是否丢弃还没有播放的语音. 为False时等待队列中的语音全部播放完毕
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if discard:
+            self._discard = True
+            self.clear()
+            if self.player is not None:
+                self.player.abort()
+        self._queue.put((math.inf, next(self._order), None))
+        self.thread.join()
+        if self.player is not None and not discard:
+            self.player.drain()
+        analyser = self.analyser
+        self.worker.join(discard=discard)
+        analyser.overflow_count += self.worker.dropped_count
+        analyser._count('dropped_blocks', self.worker.dropped_count)
+        if self.scheduler is not None:
+            self.scheduler.join(discard=discard)
+            analyser.late_count += self.scheduler.late_count
+            analyser._count('late_blocks', self.scheduler.late_count)
+        if self.player is not None:
+            self.player.close()
+            analyser.underflow_count += self.player.underflow_count
+            analyser.overflow_count += self.player.overflow_count
+            analyser._count('underflows', self.player.underflow_count)
+        analyser.mfcc_stream = None
+        analyser.resampler = None
+        analyser._cache_pending = []
+        # 丢弃的数据中的结束标记
+        with self._lock:
+            remaining = list(self._active)
+        for utterance in remaining:
+            self._end(utterance)
+
+    def _end(self, utterance: Utterance):
+        with self._lock:
+            self._active.discard(utterance)
+        utterance._finish()
+
+    def _run(self):
+        while True:
+            _, _, utterance = self._queue.get()
+            if utterance is None:
+                break
+            self._feed(utterance)
+
+    def _feed(self, utterance: Utterance):
+        generation = self._generation
+        utterance.start_frame = self.position
+        if self.player is not None:
+            # 之前被中断过, 丢弃中断之前写入的数据, 从这一句开始恢复播放
+            self.player.resume()
+            self.player.idle = False
+        try:
+            samplerate = self.samplerate if utterance.samplerate is None else utterance.samplerate
+            with open_audio(utterance.audio, samplerate, self.block_size, self.dtype,
+                            read_ahead=self.analyser.read_ahead, memory_map=self.analyser.memory_map) as source:
+                for data in reblock(self._conform(source), self.block_size, self.dtype):
+                    if self._discard:
+                        break
+                    if generation != self._generation:
+                        utterance.interrupted = True
+                        break
+                    # 不播放时等待分析, 不丢弃数据
+                    self.worker.submit((self.position, data, utterance, generation), block=self.player is None)
+                    if self.player is not None:
+                        with self.analyser._time('write'):
+                            if not self.player.write(data):
+                                break
+                    self.position += len(data)
+                if isinstance(source.blocks, ReadAhead):
+                    self.analyser._count('read_stalls', source.blocks.stall_count)
+        except Exception:
+            traceback.print_exc()
+        utterance.end_frame = self.position
+        self.worker.submit((self.position, None, utterance, generation), block=self.player is None, required=True)
+        if self.player is not None and self._queue.empty():
+            self.player.idle = True
+
+    def _conform(self, source):
+        """转换为会话的声道数和采样率"""
+        resamplers = None
+        if source.samplerate != self.samplerate:
+            resamplers = [Resampler(source.samplerate, self.samplerate) for _ in range(self.channels)]
+        consumed = produced = 0
+        for data in source:
+            if resamplers is not None:
+                x = convert(data, np.float32).reshape(len(data), -1)
+                data = np.stack([r.push(x[:, min(c, x.shape[1] - 1)]) for c, r in enumerate(resamplers)], axis=1)
+                consumed += len(x)
+                produced += len(data)
+            yield self._channels(data)
+        if resamplers is not None:
+            # 输出比输入晚半个滤波器, 补0取出剩余的样本
+            r = resamplers[0]
+            rest = -(-consumed * r.up // r.down) - produced
+            if rest > 0:
+                zeros = np.zeros(r.taps, dtype=np.float32)
+                yield self._channels(np.stack([r.push(zeros)[:rest] for r in resamplers], axis=1))
+
+    def _channels(self, data: np.ndarray) -> np.ndarray:
+        if data.ndim == 1:
+            return data if self.channels == 1 else np.repeat(data[:, None], self.channels, axis=1)
+        if data.shape[1] == self.channels:
+            return data[:, 0] if self.channels == 1 else data
+        return np.ascontiguousarray(data[:, 0]) if self.channels == 1 else np.repeat(data[:, :1], self.channels, axis=1)
+
+    def _handle(self, item):
+        frame, data, utterance, generation = item
+        if data is None:
+            def publish():
+                self._end(utterance)
+        elif generation != self._generation:
+            # 已经被中断
+            return
+        else:
+            with self.analyser._time('process'):
+                res = self.analyser.process(data, self.samplerate)
+
+            def publish():
+                with self._publish_lock:
+                    if generation != self._generation:
+                        return
+                    with self.analyser._time('callback'):
+                        self.callback(res, data)
+        if self.scheduler is None:
+            publish()
+        else:
+            self.scheduler.submit(frame, publish)
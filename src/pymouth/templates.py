@@ -0,0 +1,209 @@
+import hashlib
+import os
+
+import numpy as np
+
+from .audio_source import AudioInput, open_audio
+from .dtw_engine import dtw_bank_batch, dtw_groups
+
+# process / analyse 输出的元音顺序, 也是模板标签的顺序
+VOWELS = ('VoiceSilence', 'VoiceA', 'VoiceI', 'VoiceU', 'VoiceE', 'VoiceO')
+
+
+def label_index(label: str | int) -> int:
+    """
+    :param label: VOWELS 中的名称, 不带 Voice 前缀的简写('A', 'silence'), 或下标
+    """
+    if isinstance(label, (int, np.integer)):
+        if not 0 <= label < len(VOWELS):
+            raise ValueError(f'Unknown vowel: {label}')
+        return int(label)
+    for i, name in enumerate(VOWELS):
+        if label.lower() in (name.lower(), name[len('Voice'):].lower()):
+            return i
+    raise ValueError(f'Unknown vowel: {label}')
+
+
+class TemplateBank:
+    def __init__(self, templates, labels=None, samplerate: int | None = None):
+        """
+        元音模板库. 创建时完成所有预处理, 分析时直接交给DTW内核, 不再转换.
+        每个元音可以有多个模板, 一个元音的距离取它所有模板中最小的.
+        :param templates: shape (K, N, D), K个长度为N的MFCC帧序列
+        :param labels: 每个模板的元音, 见 label_index. 为None时 K 必须为6, 按 VOWELS 顺序每个元音一个模板
+        :param samplerate: 计算模板MFCC时的分析采样率, 见 Analyser 的 analysis_rate.
+            为None时模板按音频的原始采样率计算(内置模板)
+        """
+        templates = np.asarray(templates, dtype=np.float64)
+        if templates.ndim != 3 or not templates.shape[0]:
+            raise ValueError(f'Templates must have shape (K, N, D), got {templates.shape}')
+        if labels is None:
+            labels = range(templates.shape[0])
+        labels = np.array([label_index(v) for v in labels], dtype=np.intp)
+        if labels.shape != templates.shape[:1]:
+            raise ValueError(f'Length mismatch. templates: {templates.shape[0]}, labels: {labels.size}')
+        missing = sorted(set(range(len(VOWELS))) - set(labels.tolist()))
+        if missing:
+            raise ValueError(f'No template for {", ".join(VOWELS[i] for i in missing)}')
+
+        # 按元音排序, 每个元音的模板连续存放, 可以用 reduceat 一次取每个元音的最小距离
+        order = np.argsort(labels, kind='stable')
+        # JIT内核直接使用的连续 float64 数组
+        self.templates = np.ascontiguousarray(templates[order])
+        self.labels = labels[order]
+        self.samplerate = None if samplerate is None else int(samplerate)
+        self._starts = np.searchsorted(self.labels, np.arange(len(VOWELS)))
+        # 剪枝用: 每组的起止位置, 以及每个模板每一维的包络
+        self._offsets = np.append(self._starts, len(self.labels)).astype(np.int64)
+        self._lower = np.ascontiguousarray(self.templates.min(axis=1))
+        self._upper = np.ascontiguousarray(self.templates.max(axis=1))
+        # 一个元音一个模板时不需要合并
+        self._single = self.labels.size == len(VOWELS)
+        # 内容指纹, 用于分析结果缓存的键
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.labels.astype('<i8').tobytes())
+        h.update(f'{self.templates.shape}'.encode())
+        h.update(self.templates.astype('<f8').tobytes())
+        self.fingerprint = h.digest()
+
+    def __len__(self):
+        return self.templates.shape[0]
+
+    @property
+    def length(self) -> int:
+        """模板的帧数. 短于这个帧数的查询会用之前的帧补足"""
+        return self.templates.shape[1]
+
+    def reduce(self, distances: np.ndarray) -> np.ndarray:
+        """
+        把每个模板的距离合并为每个元音的距离
+        :param distances: shape (..., K)
+        :return: shape (..., 6), 顺序见 VOWELS
+        """
+        if self._single:
+            return distances
+        return np.minimum.reduceat(distances, self._starts, axis=-1)
+
+    def uses_pruning(self, prune: bool = True, margin: float = np.inf) -> bool:
+        """
+        distances 在这些参数下是否走剪枝的路径(dtw_groups)
+        """
+        # 一个元音一个模板时精确剪枝没有可以跳过的模板
+        return prune and not (self._single and margin == np.inf)
+
+    def distances(self, query: np.ndarray, prune: bool = True, margin: float = np.inf) -> np.ndarray:
+        """
+        :param query: shape (M, D) 或 (Q, M, D)
+        :param prune: 是否用下界剪枝和提前终止跳过不可能是最小值的模板, 结果不变. 见 dtw_engine.dtw_groups
+        :param margin: 近似剪枝的距离余量, 见 dtw_engine.dtw_groups. 为inf时结果与不剪枝完全相同
+        :return: 每个元音的DTW距离, shape (6,) 或 (Q, 6)
+        """
+        query = np.asarray(query)
+        queries = query[None] if query.ndim == 2 else query
+        if self.uses_pruning(prune, margin):
+            res = dtw_groups(self.templates, self._lower, self._upper, self._offsets, queries, margin)
+        else:
+            res = self.reduce(dtw_bank_batch(self.templates, queries))
+        return res[0] if query.ndim == 2 else res
+
+    def save(self, path: str):
+        """
+        保存为 .npz, 包含 templates, labels(元音名称), 以及 samplerate(有分析采样率时)
+        """
+        extra = {} if self.samplerate is None else {'samplerate': np.int64(self.samplerate)}
+        np.savez(path, templates=self.templates, labels=np.array([VOWELS[i] for i in self.labels]), **extra)
+
+    @classmethod
+    def load(cls, path: str) -> 'TemplateBank':
+        """
+        :param path: save 保存的 .npz; 或 shape (6, N, D) 的 .npy, 按 VOWELS 顺序每个元音一个模板
+        """
+        if os.path.splitext(path)[1].lower() == '.npy':
+            return cls(np.load(path))
+        with np.load(path) as f:
+            return cls(f['templates'], f['labels'].tolist() if 'labels' in f else None,
+                       int(f['samplerate']) if 'samplerate' in f else None)
+
+    @classmethod
+    def from_recording(cls,
+                       audio: AudioInput,
+                       samplerate: int | float,
+                       segments: list[tuple[str, float, float]],
+                       block_size: int = 4096,
+                       per_vowel: int | None = 1,
+                       fallback: 'TemplateBank | None' = None,
+                       analysis_rate: int | None = None) -> 'TemplateBank':
+        """
+        从标注过的录音生成模板, 例如依次读出 あいうえお 的 aiueo.wav.
+        每个片段按半块的间隔切出完整的块, 每块的MFCC是一个候选模板(与非流式分析一块音频时相同).
+        :param audio: 音频数据, 与 action_block 相同
+        :param samplerate: 采样率, 文件输入时以文件的采样率为准
+        :param segments: [(元音, 开始秒, 结束秒), ...], 片段短于一块时取以片段中点为中心的一块
+        :param block_size: 块大小, 应与播放时的 block_size 相同
+        :param per_vowel: 每个元音保留几个模板, 从候选中选出到其余候选DTW距离之和最小的一组(k-medoids).
+            为None时保留所有候选
+        :param fallback: 录音中没有的元音使用这个模板库中的模板, 例如 Analyser 的默认模板库.
+            为None时录音必须包含所有元音
+        :param analysis_rate: 分析采样率, 每块先重采样到这个采样率再计算MFCC, 与 Analyser(analysis_rate=...) 相同.
+            内置模板是按原始采样率计算的, 使用 analysis_rate 时需要用这个方法生成对应的模板
+        """
+        from .analyser import get_n_fft, channel_conversion
+        from .features import get_plan, analysis_hop
+        from .resample import get_resampler
+
+        with open_audio(audio, samplerate, 1 << 16) as source:
+            samplerate = source.samplerate
+            blocks = [channel_conversion(data) for data in source]
+        y = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.float32)
+        if y.size < block_size:
+            raise ValueError('Recording is shorter than one block')
+        if analysis_rate is None or analysis_rate == samplerate:
+            resample = None
+            plan = get_plan(samplerate, get_n_fft(block_size, samplerate))
+        else:
+            # 与非流式分析相同: 每块独立重采样
+            resample = get_resampler(samplerate, analysis_rate).resample
+            plan = get_plan(analysis_rate, get_n_fft(resample(y[:block_size]).size, analysis_rate),
+                            analysis_hop(samplerate, analysis_rate))
+
+        candidates: dict[int, list[np.ndarray]] = {}
+        for label, start, end in segments:
+            first, last = max(round(start * samplerate), 0), min(round(end * samplerate), y.size)
+            starts = list(range(first, last - block_size + 1, max(1, block_size // 2)))
+            if not starts:
+                middle = (first + last) // 2
+                starts = [min(max(middle - block_size // 2, 0), y.size - block_size)]
+            candidates.setdefault(label_index(label), []).extend(
+                plan.mfcc(y[s:s + block_size] if resample is None else resample(y[s:s + block_size])) for s in starts)
+
+        templates, labels = [], []
+        for label, mfccs in sorted(candidates.items()):
+            mfccs = np.array(mfccs, dtype=np.float64)
+            if per_vowel is not None and per_vowel < len(mfccs):
+                mfccs = mfccs[_medoids(mfccs, per_vowel)]
+            templates.extend(mfccs)
+            labels.extend([label] * len(mfccs))
+        if fallback is not None:
+            if fallback.samplerate != analysis_rate and not (fallback.samplerate is None and resample is None):
+                raise ValueError(f'Fallback templates were computed at {fallback.samplerate}, not {analysis_rate}')
+            for t, label in zip(fallback.templates, fallback.labels):
+                if label not in candidates:
+                    templates.append(t)
+                    labels.append(label)
+        return cls(np.array(templates), labels, analysis_rate)
+
+
+def _medoids(candidates: np.ndarray, k: int) -> list[int]:
+    """
+    贪心选出 k 个中心点, 使每个候选到最近中心点的DTW距离之和最小. 第一个是整体的中心点
+    """
+    pairwise = dtw_bank_batch(candidates, candidates)
+    nearest = np.full(len(candidates), np.inf)
+    chosen = []
+    for _ in range(k):
+        cost = np.minimum(nearest[None, :], pairwise).sum(axis=1)
+        cost[chosen] = np.inf
+        i = int(np.argmin(cost))
+        chosen.append(i)
+        nearest = np.minimum(nearest, pairwise[i])
+    return sorted(chosen)
@@ -0,0 +1,181 @@
+import hashlib
+import struct
+
+import numpy as np
+
+from .analyser import Analyser, DBAnalyser, VOWELS
+from .audio_source import AudioInput, open_audio
+
+MAGIC = b'PYMOUTH\x00'
+VERSION = 2
+# magic, version, kind, dtype, columns, samplerate, hop, count, source_hash, analyser
+HEADER = struct.Struct('<8sHBBIIIQ32s16s')
+# 版本1的文件头没有 analyser
+HEADER_V1 = struct.Struct('<8sHBBIIIQ32s')
+KINDS = ('vowel', 'db')
+DTYPES = (np.dtype('<f2'), np.dtype('<f4'))
+
+
+class LipSyncTrack:
+    def __init__(self,
+                 kind: str,
+                 values: np.ndarray,
+                 timestamps: np.ndarray,
+                 samplerate: int,
+                 hop: int,
+                 source_hash: bytes = bytes(32),
+                 analyser: str = ''):
+        """
+        预先计算好的口型轨道. 播放时直接查表, 不做任何分析.
+        文件格式(小端): 80字节文件头(版本1为64字节), 之后是 timestamps (float64, T) 和 values (float16/float32, T x columns),
+        可以用 np.memmap 直接映射, 不需要读入内存.
+        :param kind: 'vowel' 时每行是 VOWELS 顺序的6个概率, 'db' 时每行是一个开口值
+        :param values: shape (T, columns)
+        :param timestamps: shape (T,), 每行开始的时间(秒)
+        :param samplerate: 源音频采样率
+        :param hop: 每行对应的样本数
+        :param source_hash: 源音频PCM的哈希, 见 hash_audio
+        :param analyser: 生成轨道的分析器类名, 例如 'RMSAnalyser'. 未知时为空字符串
+        """
+        if kind not in KINDS:
+            raise ValueError(f'Unknown track kind: {kind}')
+        values = values.reshape(len(values), -1)
+        if len(timestamps) != len(values):
+            raise ValueError(f'Length mismatch. timestamps: {len(timestamps)}, values: {len(values)}')
+        self.kind = kind
+        self.values = values
+        self.timestamps = timestamps
+        self.samplerate = samplerate
+        self.hop = hop
+        self.source_hash = source_hash
+        self.analyser = analyser
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def columns(self) -> tuple[str, ...]:
+        return VOWELS if self.kind == 'vowel' else ('MouthOpen',)
+
+    @property
+    def duration(self) -> float:
+        return (len(self) * self.hop) / self.samplerate
+
+    def index(self, t: float) -> int:
+        """t 秒时生效的行"""
+        return max(int(np.searchsorted(self.timestamps, t, side='right')) - 1, 0)
+
+    def at(self, t: float):
+        """
+        :return: t 秒时的结果, 与 Analyser.process 的返回值相同. 'vowel' 为 dict, 'db' 为 float
+        """
+        row = self.values[self.index(t)]
+        if self.kind == 'db':
+            return float(row[0])
+        return dict(zip(VOWELS, row.tolist()))
+
+    def matches(self, audio: AudioInput, samplerate: int | float = None) -> bool:
+        """音频是否是这个轨道的源音频"""
+        return hash_audio(audio, samplerate or self.samplerate) == self.source_hash
+
+    def save(self, path: str, dtype: np.dtype = np.float16):
+        """
+        :param dtype: float16 体积减半, 精度约为千分之一, 足够驱动口型; 需要精确值时使用 float32
+        """
+        dtype = np.dtype(dtype).newbyteorder('<')
+        if dtype not in DTYPES:
+            raise ValueError(f'Unsupported dtype: {dtype}')
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, KINDS.index(self.kind), DTYPES.index(dtype), self.values.shape[1],
+                                int(self.samplerate), self.hop, len(self), self.source_hash,
+                                self.analyser.encode('ascii')))
+            f.write(np.ascontiguousarray(self.timestamps, dtype='<f8').tobytes())
+            f.write(np.ascontiguousarray(self.values, dtype=dtype).tobytes())
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'LipSyncTrack':
+        """
+        :param mmap: 是否内存映射. 映射时只有用到的部分才会被读入内存
+        """
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER_V1.size:
+            raise ValueError(f'Not a lip-sync track: {path}')
+        magic, version, kind, dtype, columns, samplerate, hop, count, source_hash = HEADER_V1.unpack_from(header)
+        if magic != MAGIC:
+            raise ValueError(f'Not a lip-sync track: {path}')
+        if version not in (1, VERSION) or kind >= len(KINDS) or dtype >= len(DTYPES):
+            raise ValueError(f'Unsupported track: version {version}, kind {kind}, dtype {dtype}')
+        dtype = DTYPES[dtype]
+        if version == 1:
+            analyser = ''
+            offset = HEADER_V1.size
+        elif len(header) < HEADER.size:
+            raise ValueError(f'Not a lip-sync track: {path}')
+        else:
+            analyser = HEADER.unpack(header)[-1].rstrip(b'\x00').decode('ascii')
+            offset = HEADER.size
+        if mmap:
+            timestamps = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(count,))
+            values = np.memmap(path, dtype=dtype, mode='r', offset=offset + 8 * count, shape=(count, columns))
+        else:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                timestamps = np.fromfile(f, dtype='<f8', count=count)
+                values = np.fromfile(f, dtype=dtype, count=count * columns).reshape(count, columns)
+        return cls(KINDS[kind], values, timestamps, samplerate, hop, source_hash, analyser)
+
+
+class TrackCursor:
+    def __init__(self, track: LipSyncTrack, samplerate: int | float):
+        """
+        按播放顺序读取轨道, 与 Analyser.process 的签名相同, 可以代替它在播放时使用.
+        每调用一次前进一块, 返回这块开始时的结果
+        """
+        self.track = track
+        self.samplerate = samplerate
+        self.position = 0
+
+    def __call__(self, data: np.ndarray, samplerate: int | float):
+        res = self.track.at(self.position / self.samplerate)
+        self.position += len(data)
+        return res
+
+
+def hash_audio(audio: AudioInput, samplerate: int | float, block_size: int = 65536) -> bytes:
+    """
+    源音频的内容哈希. 对解码后的 float32 PCM 计算, 与文件格式和输入方式无关
+    """
+    h = hashlib.blake2b(digest_size=32)
+    with open_audio(audio, samplerate, block_size) as source:
+        for data in source:
+            h.update(np.ascontiguousarray(data, dtype='<f4').tobytes())
+    return h.digest()
+
+
+def bake(analyser: Analyser,
+         audio: AudioInput,
+         samplerate: int | float,
+         hop: int = 4096,
+         chunk_seconds: float = 60.0) -> LipSyncTrack:
+    """
+    离线分析音频, 生成口型轨道. 音频只读取一次, 同时计算内容哈希
+    :param analyser: DBAnalyser(包括 RMSAnalyser) 生成 'db' 轨道, 其他生成 'vowel' 轨道
+    :param audio: 音频数据, 与 action_block 相同
+    :param samplerate: 采样率, 文件输入时以文件的采样率为准
+    :param hop: 每行对应的样本数, 与播放时的 block_size 相同时结果与实时分析一致
+    :param chunk_seconds: 见 Analyser.analyse
+    """
+    h = hashlib.blake2b(digest_size=32)
+    chunk = hop * max(1, int(chunk_seconds * samplerate / hop))
+    with open_audio(audio, samplerate, chunk) as source:
+        samplerate = source.samplerate
+
+        def hashed():
+            for data in source:
+                h.update(np.ascontiguousarray(data, dtype='<f4').tobytes())
+                yield data
+
+        values, timestamps = analyser.analyse(hashed(), samplerate, hop, chunk_seconds)
+    kind = 'db' if isinstance(analyser, DBAnalyser) else 'vowel'
+    return LipSyncTrack(kind, values, timestamps, int(samplerate), hop, h.digest(), type(analyser).__name__)
@@ -1,8 +1,14 @@
+import asyncio
+import itertools
 import json
 import os
 
+from websockets.asyncio.client import connect as async_connect, ClientConnection as AsyncClientConnection
+from websockets.exceptions import ConnectionClosed
 from websockets.sync.client import connect, ClientConnection
 
+from .metrics import Metrics, NULL_TIMER
+
 
 class VTSParameterData:
     def __init__(self, id: str, value: any):
@@ -19,8 +25,9 @@ class VTSPluginInfo:
 
 
 class VTSWebSocket:
-    def __init__(self, ws_uri: str, plugin_info: VTSPluginInfo):
+    def __init__(self, ws_uri: str, plugin_info: VTSPluginInfo, metrics: Metrics | None = None):
         self.ws_uri = ws_uri
+        self.metrics = metrics
         self.plugin_info = plugin_info
         self.req_msg = {
             "apiName": "VTubeStudioPublicAPI",
@@ -39,8 +46,9 @@ class VTSWebSocket:
         req = {**self.req_msg, "requestID": api if req_id is None else req_id, "messageType": api}
         if data is not None:
             req = {**req, "data": data}
-        self.client.send(json.dumps(req, ensure_ascii=False, skipkeys=True))
-        res = self.client.recv()
+        with NULL_TIMER if self.metrics is None else self.metrics.time('vts_request'):
+            self.client.send(json.dumps(req, ensure_ascii=False, skipkeys=True))
+            res = self.client.recv()
         if response:
             return json.loads(res)
 
@@ -88,6 +96,171 @@ class VTSWebSocket:
     def set_single_param(self, param: VTSParameterData):
         self.set_params([param])
 
+
+class AsyncVTSWebSocket:
+    def __init__(self, ws_uri: str, plugin_info: VTSPluginInfo, max_pending: int = 64,
+                 metrics: Metrics | None = None):
+        """
+        基于asyncio的VTubeStudio客户端.
+        后台读循环按 requestID 匹配响应, 可以同时有多个请求在等待响应.
+        set_params 只把消息放入发送队列, 不等待响应, 可以在任意线程中调用.
+        :param ws_uri: websocket uri
+        :param plugin_info: 插件信息
+        :param max_pending: 发送队列长度, 队列满时丢弃最旧的参数消息
+        :param metrics: 统计每条消息的发送耗时、发送队列深度和丢弃的消息数
+        """
+        self.ws_uri = ws_uri
+        self.metrics = metrics
+        self.plugin_info = plugin_info
+        self.req_msg = {
+            "apiName": "VTubeStudioPublicAPI",
+            "apiVersion": "1.0",
+        }
+
+        self.client: AsyncClientConnection | None = None
+        self.vts_token = None
+        self.max_pending = max_pending
+        self.dropped_count = 0
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._outbox: asyncio.Queue | None = None
+        self._pending: dict[str, asyncio.Future] = {}
+        self._req_ids = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+
+    async def close(self):
+        assert self.client is not None
+        # 先把已经排队的参数发出去
+        if self._outbox is not None:
+            try:
+                await asyncio.wait_for(self._outbox.join(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await self.client.close()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _message(self, api: str, req_id: str, data: dict = None) -> str:
+        req = {**self.req_msg, "requestID": req_id, "messageType": api}
+        if data is not None:
+            req = {**req, "data": data}
+        return json.dumps(req, ensure_ascii=False, skipkeys=True)
+
+    async def request(self, api: str, req_id: str = None, data: dict = None, response: bool = True) -> any:
+        """
+        发送请求. response 为 False 时只发送, 不等待响应
+        """
+        assert self.client is not None
+        req_id = f'{api}-{next(self._req_ids)}' if req_id is None else req_id
+        if not response:
+            await self.client.send(self._message(api, req_id, data))
+            return None
+
+        future = self.loop.create_future()
+        self._pending[req_id] = future
+        try:
+            await self.client.send(self._message(api, req_id, data))
+            return await future
+        finally:
+            self._pending.pop(req_id, None)
+
+    async def _read_loop(self):
+        try:
+            async for message in self.client:
+                res = json.loads(message)
+                future = self._pending.get(res.get('requestID'))
+                if future is not None and not future.done():
+                    future.set_result(res)
+        except ConnectionClosed:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('VTubeStudio connection closed'))
+
+    async def _write_loop(self):
+        while True:
+            message = await self._outbox.get()
+            try:
+                with NULL_TIMER if self.metrics is None else self.metrics.time('vts_send'):
+                    await self.client.send(message)
+            except ConnectionClosed:
+                pass
+            finally:
+                self._outbox.task_done()
+
+    async def connect(self):
+        self.loop = asyncio.get_running_loop()
+        self.client = await async_connect(uri=self.ws_uri)
+        self._outbox = asyncio.Queue(self.max_pending)
+        self._tasks = [asyncio.create_task(self._read_loop()), asyncio.create_task(self._write_loop())]
+
+        res = await self.request('APIStateRequest')
+        if res['data']['currentSessionAuthenticated'] is True:
+            return
+        if os.path.exists(self.plugin_info.authentication_token_path):
+            with open(self.plugin_info.authentication_token_path, 'r', encoding='utf-8') as f:
+                self.vts_token = f.read()
+        else:
+            await self.authenticate_token()
+
+        if await self.authenticate():
+            return
+
+        await self.authenticate_token()
+        if await self.authenticate() is False:
+            raise Exception('Authentication failed')
+
+    async def authenticate(self) -> bool:
+        assert self.vts_token is not None
+        res = await self.request('AuthenticationRequest', data={"pluginName": self.plugin_info.plugin_name,
+                                                                "pluginDeveloper": self.plugin_info.developer,
+                                                                "authenticationToken": self.vts_token})
+        return res['data']['authenticated']
+
+    async def authenticate_token(self):
+        res = await self.request('AuthenticationTokenRequest', data={"pluginName": self.plugin_info.plugin_name,
+                                                                     "pluginDeveloper": self.plugin_info.developer,
+                                                                     "pluginIcon": self.plugin_info.plugin_icon})
+        self.vts_token = res['data']['authenticationToken']
+        with open(self.plugin_info.authentication_token_path, 'w', encoding='utf-8') as f:
+            f.write(self.vts_token)
+
+    def send_nowait(self, api: str, data: dict = None):
+        """
+        把消息放入发送队列后立即返回, 不等待响应. 可以在任意线程中调用
+        """
+        assert self.loop is not None
+        message = self._message(api, f'{api}-{next(self._req_ids)}', data)
+        self.loop.call_soon_threadsafe(self._enqueue, message)
+
+    def _enqueue(self, message: str):
+        while True:
+            try:
+                self._outbox.put_nowait(message)
+                if self.metrics is not None:
+                    self.metrics.set_gauge('vts_outbox_depth', self._outbox.qsize())
+                return
+            except asyncio.QueueFull:
+                # 参数已经过时, 丢弃最旧的
+                self._outbox.get_nowait()
+                self._outbox.task_done()
+                self.dropped_count += 1
+                if self.metrics is not None:
+                    self.metrics.inc('vts_dropped_messages')
+
+    def set_params(self, params: list[VTSParameterData]):
+        data = {
+            "faceFound": False,
+            "mode": "add",
+            "parameterValues": [d.__dict__ for d in params],
+        }
+        self.send_nowait('InjectParameterDataRequest', data=data)
+
+    def set_single_param(self, param: VTSParameterData):
+        self.set_params([param])
+
 # ws = VTSWebSocket()
 # ws.connect()
 # ss = VTSParameterData('MouthOpen', 0.9)
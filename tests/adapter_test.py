@@ -1,9 +1,31 @@
 import asyncio
 import time
 import unittest
+from unittest import mock
 
-from src.pymouth.adapter import VTSAdapter
-from src.pymouth.analyser import VowelAnalyser, DBAnalyser
+import numpy as np
+
+from src.pymouth.adapter import VTSAdapter, AsyncVTSAdapter
+from src.pymouth.analyser import Analyser, VowelAnalyser, DBAnalyser
+
+
+class AsyncActionBlockTest(unittest.IsolatedAsyncioTestCase):
+    """不需要VTS, 参数发送到假的客户端"""
+
+    async def test_unsupported_analyser_returns(self):
+        a = AsyncVTSAdapter(Analyser())
+        self.assertFalse(a.action(np.zeros(4096, dtype=np.float32), 44100, None, auto_play=False))
+        await asyncio.wait_for(a.action_block(np.zeros(4096, dtype=np.float32), 44100, None, auto_play=False), 5)
+
+    async def test_finished_callback_raises(self):
+        def fail():
+            raise RuntimeError('finished_callback failed')
+
+        a = AsyncVTSAdapter(VowelAnalyser())
+        a.vts = mock.Mock()
+        await asyncio.wait_for(a.action_block(np.zeros(4096 * 2, dtype=np.float32), 44100, None,
+                                              finished_callback=fail, auto_play=False), 5)
+        self.assertEqual(a.vts.set_params.call_count, 2)
 
 
 class AdapterAsyncTest(unittest.IsolatedAsyncioTestCase):
@@ -0,0 +1,157 @@
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.pymouth.analyser import RMSAnalyser, VowelAnalyser, DBAnalyser, VOWELS, default_templates
+from src.pymouth.metrics import Metrics
+from src.pymouth.templates import TemplateBank
+
+
+class RMSAnalyserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sr = 44100
+        t = np.arange(4096) / self.sr
+        self.loud = (0.5 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        self.silence = np.zeros(4096, dtype=np.float32)
+
+    def test_silence(self):
+        self.assertEqual(RMSAnalyser().process(self.silence, self.sr), 0)
+
+    def test_attack_release(self):
+        a = RMSAnalyser(attack=0.05, release=0.2)
+        rise = [a.process(self.loud, self.sr) for _ in range(10)]
+        self.assertTrue(all(x < y for x, y in zip(rise, rise[1:])))
+        self.assertAlmostEqual(rise[-1], 1.0, places=2)
+
+        fall = [a.process(self.silence, self.sr) for _ in range(3)]
+        self.assertTrue(all(x > y for x, y in zip(fall, fall[1:])))
+        # release 比 attack 慢
+        self.assertGreater(fall[0], 1 - rise[0])
+
+    def test_stereo(self):
+        stereo = np.stack([self.loud, self.loud], axis=1)
+        self.assertGreater(RMSAnalyser(attack=0).process(stereo, self.sr), 0.9)
+
+    def test_invalid_params(self):
+        with self.assertRaises(ValueError):
+            RMSAnalyser(noise_floor=-10, ceiling=-20)
+
+
+class WarmupTest(unittest.TestCase):
+
+    def test_warmup_leaves_no_state(self):
+        audio = np.random.default_rng(1).uniform(-0.5, 0.5, size=4096 * 3).astype(np.float32)
+
+        def run(analyser):
+            res = []
+            analyser.action_block(audio, 44100, output_device=None, callback=lambda md, data: res.append(md),
+                                  auto_play=False)
+            return res
+
+        metrics = Metrics()
+        warm = VowelAnalyser(streaming=True, metrics=metrics)
+        warm.warmup(44100, 4096)
+        self.assertEqual(metrics.snapshot()['stages'], {})
+        self.assertEqual(run(warm), run(VowelAnalyser(streaming=True)))
+
+        # 噪声不会留下张开的包络
+        rms = RMSAnalyser()
+        rms.warmup(44100, 4096)
+        self.assertEqual(rms.envelope, 0.0)
+
+    def test_warmup_loads_only_used_kernels(self):
+        rng = np.random.default_rng(0)
+        bank = TemplateBank(rng.normal(size=(7, 9, 2)), [*VOWELS, 'VoiceA'])
+        cases = [(VowelAnalyser(), False),
+                 (VowelAnalyser(pruning='approximate'), True),
+                 (VowelAnalyser(templates=bank), True),
+                 (VowelAnalyser(templates=bank, pruning=None), False)]
+        for analyser, pruned in cases:
+            with mock.patch('src.pymouth.analyser.dtw_warmup') as warmup:
+                analyser.warmup(44100, 4096)
+            warmup.assert_called_once_with(pruned=pruned)
+
+
+class AnalyseTest(unittest.TestCase):
+
+    def setUp(self):
+        t = np.arange(44100 * 3) / 44100
+        # 第二秒静音, 末尾留一个不完整的块
+        y = 0.3 * np.sin(2 * np.pi * 180 * t) * (np.abs(t - 1.5) > 0.5)
+        self.y = np.concatenate((y, 0.1 * np.ones(1000))).astype(np.float32)
+
+    def blocks(self, analyser, hop):
+        res = []
+        analyser.action_block(self.y, 44100, output_device=None, callback=lambda md, data: res.append(md),
+                              auto_play=False, block_size=hop)
+        return res
+
+    def test_matches_streaming(self):
+        for hop in (1024, 4096):
+            expected = [[md[k] for k in VOWELS] for md in self.blocks(VowelAnalyser(streaming=True), hop)]
+            # 分段处理时结果也相同
+            scores, timestamps = VowelAnalyser().analyse(self.y, 44100, hop, chunk_seconds=0.5)
+            np.testing.assert_allclose(scores, expected, atol=1e-6)
+            self.assertEqual(timestamps[1], hop / 44100)
+
+    def test_analysis_rate(self):
+        bank = TemplateBank(default_templates().templates, samplerate=16000)
+        analyser = VowelAnalyser(streaming=True, templates=bank)
+        self.assertEqual(analyser.analysis_rate, 16000)
+        expected = [[md[k] for k in VOWELS] for md in self.blocks(analyser, 4096)]
+        scores, _ = VowelAnalyser(templates=bank).analyse(self.y, 44100, chunk_seconds=0.5)
+        np.testing.assert_allclose(scores, expected, atol=1e-6)
+        self.assertNotEqual(expected, [[md[k] for k in VOWELS] for md in self.blocks(VowelAnalyser(streaming=True), 4096)])
+        with self.assertRaises(ValueError):
+            VowelAnalyser(templates=bank, analysis_rate=22050)
+        # 内置模板按原始采样率计算
+        with self.assertRaises(ValueError):
+            VowelAnalyser(analysis_rate=16000)
+
+    def test_file_samplerate(self):
+        # 文件输入时分析使用文件的采样率, 与调用者给出的采样率无关
+        audio = os.path.join(os.path.dirname(__file__), 'aiueo.wav')
+        res = []
+        for samplerate in (44100, 16000):
+            analyser = VowelAnalyser()
+            res.append([])
+            analyser.action_block(audio, samplerate, output_device=None, auto_play=False,
+                                  callback=lambda md, data: res[-1].append(md))
+        self.assertEqual(res[0], res[1])
+
+    def test_db_and_rms(self):
+        expected = self.blocks(DBAnalyser(streaming=True), 4096)
+        np.testing.assert_allclose(DBAnalyser().analyse(self.y, 44100)[0], expected, atol=1e-6)
+        np.testing.assert_array_equal(RMSAnalyser().analyse(self.y, 44100)[0], self.blocks(RMSAnalyser(), 4096))
+
+
+class InterruptTest(unittest.TestCase):
+
+    def test_interrupt_resets_mouth(self):
+        y = np.random.default_rng(0).uniform(-0.5, 0.5, 4096 * 6).astype(np.float32)
+        for analyser, silence in ((VowelAnalyser(), dict(zip(VOWELS, [1.0, 0, 0, 0, 0, 0]))), (RMSAnalyser(), 0.0)):
+            results = []
+
+            def callback(res, data):
+                results.append((res, len(data), not data.any()))
+                if len(results) == 2:
+                    analyser.interrupt()
+
+            analyser.action_block(y, 44100, output_device=None, callback=callback, auto_play=False)
+            # 中断后不再处理之后的块, 最后以无声的结果和一块全0的数据回调一次
+            self.assertEqual([n for _, n, _ in results], [4096, 4096, 4096])
+            self.assertEqual(results[-1][0], silence)
+            self.assertTrue(results[-1][2])
+            # 没有正在进行的 action 时什么都不做
+            analyser.interrupt()
+
+    def test_interrupt_listening(self):
+        y = np.zeros(4096 * 4, dtype=np.float32)
+        results = []
+        VowelAnalyser().action_block(y, 44100, output_device=None, callback=lambda res, d: results.append(res),
+                                     interrupt_listening=lambda: len(results) >= 1, auto_play=False)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[-1]['VoiceSilence'], 1.0)
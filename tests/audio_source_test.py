@@ -0,0 +1,251 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from src.pymouth.analyser import VowelAnalyser, RMSAnalyser
+from src.pymouth.audio_source import open_audio, reblock, iter_async, convert, map_wav, view_wav, ReadAhead, read_blocks
+
+
+class AudioSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.audio = np.random.default_rng(0).uniform(-1, 1, size=(10000, 2)).astype(np.float32)
+        self.chunks = np.split(self.audio, [1, 700, 4000, 4096, 9000])
+
+    def test_reblock(self):
+        blocks = list(reblock(self.chunks, 4096))
+        self.assertEqual([len(b) for b in blocks], [4096, 4096, 1808])
+        np.testing.assert_array_equal(np.concatenate(blocks), self.audio)
+
+    def test_iterator(self):
+        with open_audio(iter(self.chunks), 44100, 4096) as source:
+            self.assertEqual(source.channels, 2)
+            self.assertTrue(source.live)
+            np.testing.assert_array_equal(np.concatenate(list(source)), self.audio)
+
+    def test_empty_iterator(self):
+        with open_audio(iter(()), 44100, 4096) as source:
+            self.assertEqual(list(source), [])
+
+    def test_async_iterator(self):
+        async def chunks():
+            for c in self.chunks:
+                await asyncio.sleep(0)
+                yield c
+
+        with open_audio(chunks(), 44100, 4096) as source:
+            np.testing.assert_array_equal(np.concatenate(list(source)), self.audio)
+
+    def test_async_iterator_on_other_loop(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        async def chunks():
+            for c in self.chunks:
+                yield c
+
+        try:
+            got = np.concatenate(list(iter_async(chunks(), loop)))
+            np.testing.assert_array_equal(got, self.audio)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+    def test_analyser_accepts_chunks(self):
+        res = []
+        VowelAnalyser().action_block(iter(self.chunks), 44100, output_device=None,
+                                     callback=lambda md, data: res.append(len(data)), auto_play=False)
+        self.assertEqual(res, [4096, 4096, 1808])
+
+
+class BufferReuseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.audio = np.random.default_rng(0).uniform(-1, 1, size=(10000, 2)).astype(np.float32)
+        self.pcm = convert(self.audio, np.int16)
+
+    def test_convert(self):
+        self.assertEqual(self.pcm.dtype, np.int16)
+        np.testing.assert_allclose(convert(self.pcm, np.float32), self.audio, atol=1 / 32768)
+        self.assertEqual(convert(np.array([1.5, -1.5]), np.int16).tolist(), [32767, -32768])
+        np.testing.assert_array_equal(convert(self.audio.astype(np.float16), np.float32),
+                                      self.audio.astype(np.float16).astype(np.float32))
+        self.assertIs(convert(self.audio, np.float32), self.audio)
+
+    def test_file_blocks_reuse_buffers(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'a.flac')
+            sf.write(path, self.pcm, 44100)
+            got = []
+            with open_audio(path, 44100, 4096, reuse_buffers=True) as source:
+                for block in source:
+                    got.append(block.copy())
+                    source.release(block)
+                self.assertEqual(source.pool.allocated, 1)
+            np.testing.assert_array_equal(np.concatenate(got), convert(self.pcm, np.float32))
+
+    def test_native_int16(self):
+        # 整数PCM按满量程转换, 与对应的浮点数据结果相同
+        chunks = np.split(self.pcm, [1, 700, 4000, 4096, 9000])
+        with open_audio(iter(chunks), 44100, 4096, reuse_buffers=True) as source:
+            blocks = []
+            for block in source:
+                self.assertEqual(block.dtype, np.float32)
+                blocks.append(block.copy())
+                source.release(block)
+            self.assertLessEqual(source.pool.allocated, 2)
+        np.testing.assert_allclose(np.concatenate(blocks), self.audio, atol=1 / 32768)
+
+        def run(analyser, audio):
+            res = []
+            analyser.action_block(audio, 44100, output_device=None, auto_play=False,
+                                  callback=lambda md, data: res.append(md))
+            return res
+
+        float_audio = convert(self.pcm, np.float32)
+        self.assertEqual(run(VowelAnalyser(streaming=True), float_audio),
+                         run(VowelAnalyser(streaming=True, reuse_buffers=True), self.pcm))
+        self.assertEqual(run(RMSAnalyser(), float_audio), run(RMSAnalyser(reuse_buffers=True), self.pcm))
+
+
+class FileInputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.audio = np.random.default_rng(0).uniform(-1, 1, size=(10000, 2)).astype(np.float32)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, data, subtype):
+        path = os.path.join(self.dir.name, name)
+        sf.write(path, data, 22050, subtype=subtype)
+        return path
+
+    def decoded(self, path, dtype=np.float32):
+        with sf.SoundFile(path) as f:
+            return list(read_blocks(f, 4096, dtype))
+
+    def test_map_wav(self):
+        for data in (self.audio, self.audio[:, 0]):
+            for subtype in ('PCM_16', 'PCM_32', 'FLOAT'):
+                path = self.write(f'{subtype}.wav', data, subtype)
+                self.assertIsNotNone(map_wav(path))
+                with open_audio(path, 44100, 4096, memory_map=True) as source:
+                    self.assertEqual(source.samplerate, 22050)
+                    self.assertEqual(source.channels, data.ndim)
+                    blocks = list(source)
+                if subtype == 'FLOAT':
+                    # 格式相同时块是只读映射的视图
+                    self.assertFalse(blocks[0].flags.writeable)
+                # 与 soundfile 解码的结果完全相同
+                expected = self.decoded(path)
+                self.assertEqual(len(blocks), len(expected))
+                for a, b in zip(blocks, expected):
+                    self.assertEqual(a.dtype, b.dtype)
+                    np.testing.assert_array_equal(a, b)
+
+        self.assertIsNone(map_wav(self.write('a.flac', self.audio, 'PCM_16')))
+
+        # 默认由 soundfile 读取, 块不引用文件, 播放完可以立即删除
+        path = self.write('default.wav', self.audio, 'FLOAT')
+        with open_audio(path, 44100, 4096) as source:
+            block = next(iter(source))
+        self.assertTrue(block.flags.writeable)
+        self.assertIsNone(map_wav(self.write('a24.wav', self.audio, 'PCM_24')))
+
+    def test_read_ahead(self):
+        path = self.write('a.flac', self.audio, 'PCM_16')
+        with open_audio(path, 44100, 1000, read_ahead=2, reuse_buffers=True) as source:
+            self.assertIsInstance(source.blocks, ReadAhead)
+            blocks = []
+            for block in source:
+                blocks.append(block.copy())
+                source.release(block)
+        np.testing.assert_array_equal(np.concatenate(blocks), np.concatenate(self.decoded(path)))
+
+        # 提前关闭时读取线程退出, 之后不再读取文件
+        source = open_audio(path, 44100, 100, read_ahead=2)
+        next(iter(source))
+        source.close()
+        self.assertFalse(source.blocks.thread.is_alive())
+
+    def test_read_ahead_stalls(self):
+        def blocks():
+            for _ in range(3):
+                time.sleep(0.05)
+                yield np.zeros(10)
+
+        it = ReadAhead(blocks(), 4)
+        self.assertEqual(len(list(it)), 3)
+        self.assertGreaterEqual(it.stall_count, 3)
+
+    def test_read_ahead_error(self):
+        def blocks():
+            yield np.zeros(10)
+            raise OSError('disk error')
+
+        it = ReadAhead(blocks(), 4)
+        self.assertEqual(len(next(it)), 10)
+        with self.assertRaises(OSError):
+            next(it)
+        self.assertEqual(list(it), [])
+
+    def test_encoded_bytes(self):
+        class Response:
+            # 不能定位的流, 例如HTTP响应
+            def __init__(self, data):
+                self.body = io.BytesIO(data)
+
+            def read(self, n=-1):
+                return self.body.read(n)
+
+        for fmt, subtype in (('WAV', 'PCM_16'), ('WAV', 'FLOAT'), ('WAV', 'PCM_24'), ('FLAC', 'PCM_16')):
+            buf = io.BytesIO()
+            sf.write(buf, self.audio, 22050, format=fmt, subtype=subtype)
+            data = buf.getvalue()
+            self.assertEqual(view_wav(data) is not None, fmt == 'WAV' and subtype != 'PCM_24')
+            expected = np.concatenate(self.decoded(io.BytesIO(data)))
+            for audio in (data, bytearray(data), memoryview(data), io.BytesIO(data), Response(data)):
+                with open_audio(audio, 44100, 4096) as source:
+                    self.assertEqual(source.samplerate, 22050)
+                    np.testing.assert_array_equal(np.concatenate(list(source)), expected)
+
+        # WAV 的块直接是 bytes 的视图
+        buf = io.BytesIO()
+        sf.write(buf, self.audio, 22050, format='WAV', subtype='FLOAT')
+        data = buf.getvalue()
+        with open_audio(data, 44100, 4096) as source:
+            self.assertTrue(np.shares_memory(next(iter(source)), np.frombuffer(data, dtype=np.uint8)))
+
+    def test_soundfile(self):
+        # SoundFile 也有 read, 不能当作文件对象解码
+        for name, subtype in (('a.wav', 'PCM_16'), ('a.flac', 'PCM_16')):
+            path = self.write(name, self.audio, subtype)
+            with sf.SoundFile(path) as f, open_audio(f, 44100, 4096) as source:
+                self.assertEqual(source.samplerate, 22050)
+                np.testing.assert_array_equal(np.concatenate(list(source)), np.concatenate(self.decoded(path)))
+        with sf.SoundFile('tests/aiueo.wav') as f, open_audio(f, 44100) as source:
+            self.assertEqual(len(list(source)), 53)
+
+    def test_analyser_accepts_bytes(self):
+        path = self.write('a.wav', self.audio, 'PCM_16')
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        def run(audio):
+            res = []
+            VowelAnalyser().action_block(audio, 44100, output_device=None, auto_play=False,
+                                         callback=lambda md, d: res.append(md))
+            return res
+
+        self.assertEqual(len(run(path)), 3)
+        self.assertEqual(run(data), run(path))
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.pymouth.analyser import VowelAnalyser, DBAnalyser
+from src.pymouth.cache import AnalysisCache
+from src.pymouth.metrics import Metrics
+
+AIUEO = os.path.join(os.path.dirname(__file__), 'aiueo.wav')
+
+
+def collect(analyser, audio=AIUEO):
+    res = []
+    analyser.action_block(audio, 44100, output_device=None, callback=lambda md, data: res.append(md),
+                          auto_play=False)
+    return res
+
+
+class AnalysisCacheTest(unittest.TestCase):
+
+    def test_lru_budget(self):
+        cache = AnalysisCache(max_bytes=3 * (16 + 48 + 160))
+        keys = [AnalysisCache.key(i) for i in range(4)]
+        for k in keys[:3]:
+            cache.put(k, np.zeros(6))
+        cache.get(keys[0])
+        cache.put(keys[3], np.zeros(6))
+        # keys[1] 最久未使用, 被淘汰
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_repeated_utterance(self):
+        for streaming in (False, True):
+            expected = collect(VowelAnalyser(streaming=streaming))
+            metrics = Metrics()
+            cache = AnalysisCache()
+            analyser = VowelAnalyser(streaming=streaming, metrics=metrics, cache=cache)
+            self.assertEqual(collect(analyser), expected)
+            self.assertEqual(cache.hits, 0)
+
+            metrics.reset()
+            self.assertEqual(collect(analyser), expected)
+            self.assertEqual(cache.misses, len(expected))
+            self.assertEqual(cache.hits, len(expected))
+            # 整句命中时不计算MFCC和DTW
+            self.assertNotIn('mfcc', metrics.snapshot()['stages'])
+            self.assertNotIn('dtw', metrics.snapshot()['stages'])
+
+    def test_streaming_diverging_suffix(self):
+        rng = np.random.default_rng(0)
+        prefix = rng.uniform(-0.5, 0.5, 4096 * 3).astype(np.float32)
+        a = np.concatenate((prefix, rng.uniform(-0.5, 0.5, 4096 * 2).astype(np.float32)))
+        b = np.concatenate((prefix, rng.uniform(-0.5, 0.5, 4096 * 2).astype(np.float32)))
+
+        cache = AnalysisCache()
+        collect(VowelAnalyser(streaming=True, cache=cache), a)
+        # 前缀命中, 之后的块补上前缀的帧后再计算, 结果与不使用缓存相同
+        self.assertEqual(collect(VowelAnalyser(streaming=True, cache=cache), b),
+                         collect(VowelAnalyser(streaming=True), b))
+        self.assertEqual(cache.hits, 3)
+
+    def test_streaming_long_prefix(self):
+        # 长时间命中时只保留最后几块, 之后未命中时从保留的块重建状态, 结果仍与不使用缓存相同
+        rng = np.random.default_rng(1)
+        prefix = rng.uniform(-0.5, 0.5, 44100 * 5).astype(np.float32)
+        a = np.concatenate((prefix, rng.uniform(-0.5, 0.5, 4096 * 3).astype(np.float32)))
+        b = np.concatenate((prefix, rng.uniform(-0.5, 0.5, 4096 * 3).astype(np.float32)))
+        for block_size in (4096, 1000):
+            def run(analyser, audio):
+                res = []
+                analyser.action_block(audio, 44100, output_device=None, callback=lambda md, data: res.append(md),
+                                      auto_play=False, block_size=block_size)
+                return res
+
+            cache = AnalysisCache()
+            run(VowelAnalyser(streaming=True, cache=cache), a)
+            analyser = VowelAnalyser(streaming=True, cache=cache)
+            pending = []
+            defer = analyser._defer
+
+            def record(data):
+                defer(data)
+                pending.append(len(analyser._cache_pending))
+
+            analyser._defer = record
+            self.assertEqual(run(analyser, b), run(VowelAnalyser(streaming=True), b))
+            self.assertGreater(len(pending), 50)
+            self.assertLessEqual(max(pending), 10)
+
+    def test_parameters_in_key(self):
+        cache = AnalysisCache()
+        collect(VowelAnalyser(cache=cache))
+        collect(VowelAnalyser(temperature=5.0, cache=cache))
+        self.assertEqual(cache.hits, 0)
+        # DBAnalyser 复用相同的元音结果
+        collect(DBAnalyser(cache=cache))
+        self.assertGreater(cache.hits, 0)
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as d:
+            expected = collect(VowelAnalyser(cache=AnalysisCache(directory=d)))
+            cache = AnalysisCache(directory=d)
+            self.assertEqual(collect(VowelAnalyser(cache=cache)), expected)
+            self.assertEqual(cache.disk_hits, len(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
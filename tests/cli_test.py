@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.pymouth.cli import main, find_audio, track_path, _warmup
+from src.pymouth.track import LipSyncTrack
+
+TESTS = os.path.dirname(__file__)
+
+
+class BakeCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.voice = os.path.join(self.dir.name, 'voice')
+        os.makedirs(os.path.join(self.voice, 'sub'))
+        shutil.copy(os.path.join(TESTS, 'aiueo.wav'), self.voice)
+        shutil.copy(os.path.join(TESTS, 'zh.wav'), os.path.join(self.voice, 'sub'))
+        self.output = os.path.join(self.dir.name, 'tracks')
+        self.index = os.path.join(self.dir.name, 'index.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_find_audio(self):
+        files = find_audio([self.voice, os.path.join(self.voice, '*.wav')])
+        self.assertEqual([os.path.basename(f) for f in files], ['aiueo.wav', 'zh.wav'])
+        self.assertEqual(track_path('/a/b/c.wav', None, None), '/a/b/c.pmt')
+        self.assertEqual(track_path('/a/b/c.wav', '/out', '/a'), os.path.join('/out', 'b', 'c.pmt'))
+
+    def test_bake_and_skip(self):
+        args = ['bake', self.voice, '-o', self.output, '-j', '2', '--index', self.index, '-q']
+        self.assertEqual(main(args), 0)
+        with open(self.index, encoding='utf-8') as f:
+            index = json.load(f)['tracks']
+        self.assertEqual(len(index), 2)
+        for file, entry in index.items():
+            track = LipSyncTrack.load(entry['track'])
+            self.assertTrue(track.matches(file))
+        self.assertTrue(os.path.exists(os.path.join(self.output, 'sub', 'zh.pmt')))
+
+        # 内容没有变化时跳过, 换了分析器时重新生成
+        mtime = os.path.getmtime(os.path.join(self.output, 'aiueo.pmt'))
+        # 全部跳过时不启动工作进程
+        with mock.patch('src.pymouth.cli.ProcessPoolExecutor') as pool:
+            self.assertEqual(main(args), 0)
+        pool.assert_not_called()
+        self.assertEqual(os.path.getmtime(os.path.join(self.output, 'aiueo.pmt')), mtime)
+        self.assertEqual(main([*args, '-a', 'rms']), 0)
+        self.assertEqual(LipSyncTrack.load(os.path.join(self.output, 'aiueo.pmt')).analyser, 'RMSAnalyser')
+        # db 和 rms 都生成 'db' 轨道, 但分析器不同; dtype 改变时也重新生成
+        mtime = os.path.getmtime(os.path.join(self.output, 'aiueo.pmt'))
+        self.assertEqual(main([*args, '-a', 'db']), 0)
+        track = LipSyncTrack.load(os.path.join(self.output, 'aiueo.pmt'))
+        self.assertEqual(track.analyser, 'DBAnalyser')
+        self.assertNotEqual(os.path.getmtime(os.path.join(self.output, 'aiueo.pmt')), mtime)
+        self.assertEqual(main([*args, '-a', 'db', '--dtype', 'float32']), 0)
+        self.assertEqual(LipSyncTrack.load(os.path.join(self.output, 'aiueo.pmt')).values.dtype, np.float32)
+
+    def test_warmup_loads_only_used_kernels(self):
+        for analyser, calls in (('vowel', [mock.call(pruned=False)]), ('db', [mock.call(pruned=False)]),
+                                ('rms', [])):
+            with mock.patch('src.pymouth.analyser.dtw_warmup') as warmup:
+                _warmup(analyser)
+            self.assertEqual(warmup.call_args_list, calls)
+
+    def test_same_stem(self):
+        # a.wav 和 a.flac 会写同一个轨道文件
+        shutil.copy(os.path.join(TESTS, 'aiueo.wav'), os.path.join(self.voice, 'aiueo.flac'))
+        self.assertEqual(main(['bake', self.voice, '-q']), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.voice, 'aiueo.pmt')))
+
+
+if __name__ == '__main__':
+    unittest.main()
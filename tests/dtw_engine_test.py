@@ -0,0 +1,66 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+from dtw import dtw
+
+from src.pymouth.analyser import Analyser, softmax
+from src.pymouth.dtw_engine import dtw_bank, dtw_bank_batch, dtw_groups, _dtw_bank_numpy
+
+
+class DTWEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = np.array([Analyser.V_Silence, Analyser.V_A, Analyser.V_I,
+                              Analyser.V_U, Analyser.V_E, Analyser.V_O], dtype=np.float64)
+        self.rng = np.random.default_rng(2016)
+
+    def expected(self, bank, query):
+        return np.array([dtw(t, query, distance_only=True).normalizedDistance for t in bank])
+
+    def test_parity_with_dtw_python(self):
+        for m in (1, 2, 5, 9, 17):
+            query = self.rng.normal(loc=120, scale=60, size=(m, 2))
+            np.testing.assert_allclose(dtw_bank(self.bank, query), self.expected(self.bank, query), rtol=1e-10)
+
+    def test_numpy_kernel_parity_with_dtw_python(self):
+        for m in (1, 3, 9, 12):
+            query = self.rng.normal(loc=120, scale=60, size=(m, 2))
+            np.testing.assert_allclose(_dtw_bank_numpy(self.bank, query), self.expected(self.bank, query),
+                                       rtol=1e-10)
+
+    def test_template_matches_itself(self):
+        res = dtw_bank(self.bank, self.bank[1])
+        self.assertEqual(int(np.argmin(res)), 1)
+        self.assertAlmostEqual(res[1], 0.0)
+
+    def test_pruned_groups(self):
+        # 每组8个相近的模板, 与逐个计算后按组取最小值完全相同
+        bank = (self.bank[:, None] + self.rng.normal(scale=15, size=(6, 8, 9, 2))).reshape(48, 9, 2)
+        offsets = np.arange(0, 49, 8)
+        queries = self.bank[self.rng.integers(0, 6, 40)] + self.rng.normal(scale=20, size=(40, 9, 2))
+        expected = np.minimum.reduceat(dtw_bank_batch(bank, queries), offsets[:-1], axis=1)
+        res = dtw_groups(bank, bank.min(axis=1), bank.max(axis=1), offsets, queries)
+        np.testing.assert_array_equal(res, expected)
+
+        # 近似剪枝: 跳过的组的概率不超过最大概率的千分之一
+        margin = 10 * np.log(1000)
+        res = dtw_groups(bank, bank.min(axis=1), bank.max(axis=1), offsets, queries, margin=margin)
+        np.testing.assert_allclose(softmax(-res, 10, axis=1), softmax(-expected, 10, axis=1), atol=5e-3)
+
+    def test_shape_mismatch(self):
+        with self.assertRaises(ValueError):
+            dtw_bank(self.bank, np.zeros((9, 3)))
+
+    @unittest.skipIf(importlib.util.find_spec('numba') is None, 'numba is not installed')
+    def test_kernels_load_from_disk_cache(self):
+        # 内核指定了签名, 导入时就会编译或加载. 第一个进程编译并写入缓存(可能已经存在), 之后的进程直接加载
+        script = ('from src.pymouth.dtw_jit import pruned_kernel\n'
+                  'print(sum(pruned_kernel.stats.cache_hits.values()), sum(pruned_kernel.stats.cache_misses.values()))')
+        root = os.path.join(os.path.dirname(__file__), '..')
+        for _ in range(2):
+            out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=root, check=True)
+        self.assertEqual(out.stdout.split(), ['1', '0'])
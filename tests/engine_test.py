@@ -0,0 +1,61 @@
+import threading
+import unittest
+
+import numpy as np
+
+from src.pymouth.analyser import VowelAnalyser, RMSAnalyser
+from src.pymouth.engine import LipSyncEngine
+
+
+class LipSyncEngineTest(unittest.TestCase):
+
+    def test_streams(self):
+        rng = np.random.default_rng(0)
+        audio = {name: rng.uniform(-0.5, 0.5, size=4096 * n).astype(np.float32)
+                 for name, n in (('a', 3), ('b', 5), ('c', 2))}
+        results = {name: [] for name in audio}
+        done = threading.Semaphore(0)
+
+        with LipSyncEngine(max_workers=2) as engine:
+            for name in audio:
+                analyser = RMSAnalyser() if name == 'c' else VowelAnalyser()
+                engine.add_stream(name, analyser, lambda res, data, n=name: results[n].append(data))
+            for name, y in audio.items():
+                engine.action(name, y, 44100, output_device=None, auto_play=False, finished_callback=done.release)
+            for _ in audio:
+                done.acquire(timeout=30)
+
+            stats = engine.throughput()
+
+        for name, y in audio.items():
+            # 每一路的结果按顺序只交给自己的 sink
+            np.testing.assert_array_equal(np.concatenate(results[name]), y)
+        self.assertEqual(stats['streams'], 3)
+        self.assertEqual(stats['active_streams'], 0)
+        self.assertAlmostEqual(stats['audio_seconds'], 4096 * 10 / 44100)
+        self.assertGreater(stats['capacity'], 0)
+
+    def test_analyser_usable_after_close(self):
+        analyser = VowelAnalyser()
+        with LipSyncEngine(max_workers=1) as engine:
+            engine.add_stream('a', analyser, print)
+        self.assertIsNone(analyser.analysis_executor)
+        results = []
+        analyser.action_block(np.zeros(4096 * 2, dtype=np.float32), 44100, output_device=None,
+                              callback=lambda res, data: results.append(res), auto_play=False)
+        self.assertEqual(len(results), 2)
+
+        # 分析器自己的线程池没有被引擎关闭
+        done = threading.Event()
+        results.clear()
+        analyser.action_noblock(np.zeros(4096 * 2, dtype=np.float32), 44100, output_device=None,
+                                callback=lambda res, data: results.append(res), finished_callback=done.set,
+                                auto_play=False)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(len(results), 2)
+
+    def test_duplicate_stream(self):
+        with LipSyncEngine(max_workers=1) as engine:
+            engine.add_stream('a', VowelAnalyser(), print)
+            with self.assertRaises(ValueError):
+                engine.add_stream('a', VowelAnalyser(), print)
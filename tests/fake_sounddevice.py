@@ -0,0 +1,136 @@
+import contextlib
+import sys
+import threading
+import time
+import types
+from unittest import mock
+
+import numpy as np
+
+
+class CallbackStop(Exception):
+    pass
+
+
+class CallbackFlags:
+    def __init__(self, output_underflow: bool = False):
+        self.output_underflow = output_underflow
+
+
+class TimeInfo:
+    def __init__(self, now: float, latency: float):
+        self.currentTime = now
+        self.outputBufferDacTime = now + latency
+
+
+class OutputStream:
+    """
+    代替 sounddevice.OutputStream 的假输出流, 不需要 PortAudio 和音频设备.
+    回调流在后台线程中按 speed 倍速调用回调, 输出记录在 output 中; 同步流的 write 也记录在 output 中
+    """
+    # 测试中打开过的所有流
+    opened: list['OutputStream'] = []
+    # 比实时快多少倍
+    speed = 20.0
+    latency = 0.01
+
+    def __init__(self, samplerate, blocksize=0, device=None, channels=1, dtype=np.float32, callback=None,
+                 finished_callback=None):
+        self.samplerate = samplerate
+        self.blocksize = blocksize or 512
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.callback = callback
+        self.finished_callback = finished_callback
+        self.output: list[np.ndarray] = []
+        self.active = False
+        self.stopped = False
+        self.aborted = False
+        self.closed = False
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._finished = False
+        self._lock = threading.Lock()
+        OutputStream.opened.append(self)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        self.close()
+
+    def start(self):
+        if self.active or self.closed:
+            return
+        self.active = True
+        if self.callback is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        period = self.blocksize / self.samplerate / self.speed
+        t = time.perf_counter()
+        while not self._stop.is_set():
+            outdata = np.zeros((self.blocksize, self.channels), dtype=self.dtype)
+            try:
+                self.callback(outdata, self.blocksize, TimeInfo(time.perf_counter(), self.latency), CallbackFlags())
+            except CallbackStop:
+                self.output.append(outdata)
+                break
+            self.output.append(outdata)
+            t += period
+            time.sleep(max(0.0, t - time.perf_counter()))
+        self.active = False
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        if self.finished_callback is not None:
+            self.finished_callback()
+
+    def _halt(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self.active or self._thread is None:
+            self.active = False
+            self._finish()
+
+    def write(self, data: np.ndarray):
+        self.output.append(np.array(data, dtype=self.dtype).reshape(len(data), -1))
+        time.sleep(len(data) / self.samplerate / self.speed)
+        return False
+
+    def stop(self):
+        self.stopped = True
+        self._halt()
+
+    def abort(self):
+        self.aborted = True
+        self._halt()
+
+    def close(self):
+        self._halt()
+        self.closed = True
+
+    def played(self) -> np.ndarray:
+        """输出的所有帧, shape (n, channels)"""
+        if not self.output:
+            return np.zeros((0, self.channels), dtype=self.dtype)
+        return np.concatenate(self.output)
+
+
+@contextlib.contextmanager
+def patched():
+    """在这个范围内 import sounddevice 得到假的模块"""
+    module = types.ModuleType('sounddevice')
+    module.OutputStream = OutputStream
+    module.CallbackStop = CallbackStop
+    OutputStream.opened = []
+    with mock.patch.dict(sys.modules, {'sounddevice': module}):
+        yield OutputStream.opened
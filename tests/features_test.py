@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from src.pymouth.analyser import VowelAnalyser, get_n_fft
+from src.pymouth.features import get_plan, StreamingMFCC, mel_filterbank
+
+AIUEO = os.path.join(os.path.dirname(__file__), 'aiueo.wav')
+
+
+class FeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        y, self.sr = sf.read(AIUEO, dtype=np.float32)
+        self.y = np.ascontiguousarray(y[:, 0])
+
+    def test_plan_parity_with_librosa(self):
+        for size in (4096, 2048, 1000):
+            block = self.y[40000:40000 + size]
+            n_fft = get_n_fft(block.size, self.sr)
+            expected = librosa.feature.mfcc(y=block, sr=self.sr, n_fft=n_fft, dct_type=1, n_mfcc=3)[1:].T
+            np.testing.assert_allclose(get_plan(self.sr, n_fft).mfcc(block), expected, atol=1e-3)
+
+    def test_mel_filterbank_parity_with_librosa(self):
+        for sr, n_fft in ((44100, 1024), (16000, 512), (48000, 1000)):
+            np.testing.assert_allclose(mel_filterbank(sr, n_fft), librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=128),
+                                       atol=1e-7)
+
+    def test_first_block_without_librosa(self):
+        script = ('import sys, numpy as np\n'
+                  'from src.pymouth import VTSAdapter, VowelAnalyser\n'
+                  'VowelAnalyser().process(np.zeros(4096, dtype=np.float32), 44100)\n'
+                  'print(\'librosa\' in sys.modules, \'sounddevice\' in sys.modules)')
+        root = os.path.join(os.path.dirname(__file__), '..')
+        out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=root, check=True)
+        self.assertEqual(out.stdout.split(), ['False', 'False'])
+
+    def test_plan_is_cached(self):
+        self.assertIs(get_plan(self.sr, 1024), get_plan(self.sr, 1024))
+
+    def test_streaming_emits_each_frame_once(self):
+        plan = get_plan(self.sr, 1024)
+        # 每次只输入一个帧移, 每次恰好产生一帧, 结果与对整段信号逐帧计算相同
+        frames = plan.frames(np.pad(self.y, (512, 0)))
+        expected = np.concatenate([plan.frames2mfcc(frames[i:i + 1]) for i in range(frames.shape[0])])
+        stream = StreamingMFCC(self.sr, 1024)
+        got = np.concatenate([stream.push(self.y[i:i + 512]) for i in range(0, self.y.size, 512)])
+        np.testing.assert_array_equal(got, expected)
+
+    def test_streaming_block_boundaries(self):
+        stream = StreamingMFCC(self.sr, 1024)
+        counts = [stream.push(self.y[i:i + 4096]).shape[0] for i in range(0, self.y.size, 4096)]
+        self.assertEqual(sum(counts), get_plan(self.sr, 1024).frames(np.pad(self.y, (512, 0))).shape[0])
+        self.assertEqual(counts[1], 4096 // 512)
+
+    def test_streaming_min_frames(self):
+        stream = StreamingMFCC(self.sr, 1024)
+        stream.push(self.y[:4096])
+        self.assertEqual(stream.push(self.y[4096:4096 + 1024], min_frames=9).shape[0], 9)
+
+    def test_streaming_analyser(self):
+        res = []
+        # 末尾留一个只有1024个样本的短块
+        y = self.y[:4096 * 10 + 1024]
+        VowelAnalyser(streaming=True).action_block(y, self.sr, output_device=None,
+                                                   callback=lambda md, data: res.append(md), auto_play=False)
+        self.assertEqual(len(res), 11)
+        for md in res:
+            self.assertAlmostEqual(sum(md.values()), 1.0, places=5)
+        # 尾块不足5帧时也能参与比较
+        self.assertNotEqual(res[-1]['VoiceSilence'], 1)
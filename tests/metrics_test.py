@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from src.pymouth.analyser import VowelAnalyser
+from src.pymouth.metrics import Metrics, Histogram, SnapshotReporter
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_histogram(self):
+        h = Histogram(buckets=(0.001, 0.01, 0.1))
+        for v in (0.0005, 0.002, 0.003, 0.05, 2.0):
+            h.observe(v)
+        self.assertEqual(h.counts, [1, 2, 1, 1])
+        self.assertEqual(h.quantile(0.5), 0.01)
+        self.assertEqual(h.quantile(1.0), 2.0)
+
+    def test_analyser_stages(self):
+        metrics = Metrics()
+        audio = np.random.default_rng(0).uniform(-0.5, 0.5, size=4096 * 3).astype(np.float32)
+        VowelAnalyser(metrics=metrics).action_block(audio, 44100, output_device=None,
+                                                    callback=lambda res, data: None, auto_play=False)
+
+        snapshot = metrics.snapshot()
+        for stage in ('read', 'process', 'mfcc', 'dtw', 'softmax', 'callback'):
+            self.assertEqual(snapshot['stages'][stage]['count'], 3, stage)
+        self.assertEqual(snapshot['counters']['blocks'], 3)
+        self.assertAlmostEqual(snapshot['counters']['audio_seconds'], 4096 * 3 / 44100)
+        self.assertGreater(snapshot['gauges']['realtime_factor'], 0)
+
+        text = metrics.to_prometheus()
+        self.assertIn('pymouth_stage_seconds_bucket{stage="dtw",le="+Inf"} 3', text)
+        self.assertIn('pymouth_blocks_total 3', text)
+
+    def test_reporter(self):
+        metrics = Metrics()
+        metrics.inc('blocks')
+        snapshots = []
+        with SnapshotReporter(metrics, snapshots.append, interval=60):
+            pass
+        self.assertEqual(snapshots[-1]['counters'], {'blocks': 1})
@@ -0,0 +1,194 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.pymouth.analyser import VowelAnalyser
+from src.pymouth.playback import RingBuffer, AnalysisWorker, PresentationScheduler, CallbackPlayer
+from tests import fake_sounddevice
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def test_wrap_around(self):
+        ring = RingBuffer(8, 1)
+        out = np.empty((5, 1), dtype=np.float32)
+        self.assertEqual(ring.write(np.arange(6, dtype=np.float32)), 6)
+        self.assertEqual(ring.read(out), 5)
+        self.assertEqual(ring.write(np.arange(6, 12, dtype=np.float32)), 6)
+        self.assertEqual(ring.available(), 7)
+        self.assertEqual(ring.read(out), 5)
+        np.testing.assert_array_equal(out[:, 0], [5, 6, 7, 8, 9])
+
+    def test_partial(self):
+        ring = RingBuffer(4, 2)
+        self.assertEqual(ring.write(np.ones((6, 2), dtype=np.float32)), 4)
+        self.assertEqual(ring.space(), 0)
+        out = np.full((6, 2), 9, dtype=np.float32)
+        self.assertEqual(ring.read(out), 4)
+        np.testing.assert_array_equal(out[4:], 0)
+
+    def test_clear(self):
+        ring = RingBuffer(4, 1)
+        ring.write(np.ones(3, dtype=np.float32))
+        ring.clear()
+        self.assertEqual(ring.available(), 0)
+        self.assertEqual(ring.space(), 4)
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.001)
+
+
+class CallbackPlayerTest(unittest.TestCase):
+    """回调播放, 使用不需要音频设备的假输出流"""
+
+    def player(self, **kwargs) -> CallbackPlayer:
+        with fake_sounddevice.patched():
+            player = CallbackPlayer(44100, 1, None, block_size=1024, **kwargs)
+        self.addCleanup(player.close)
+        return player
+
+    def test_plays_written_audio(self):
+        audio = np.random.default_rng(0).uniform(-0.5, 0.5, size=10000).astype(np.float32)
+        player = self.player()
+        for i in range(0, len(audio), 1024):
+            self.assertTrue(player.write(audio[i:i + 1024]))
+        player.drain(5)
+        played = player.stream.played()[:, 0]
+        np.testing.assert_array_equal(played[:len(audio)], audio)
+        np.testing.assert_array_equal(played[len(audio):], 0)
+        self.assertEqual(player.frames_played, len(audio))
+        self.assertEqual(player.underflow_count, 0)
+        self.assertFalse(player.aborted)
+
+    def test_underflow(self):
+        player = self.player(prebuffer_blocks=1)
+        # 一块就开始播放, 播完之后缓冲区为空
+        player.write(np.ones(1024, dtype=np.float32))
+        wait_until(lambda: player.underflow_count > 0)
+        player.write(np.ones(1024, dtype=np.float32))
+        player.drain(5)
+        self.assertEqual(player.frames_played, 2048)
+
+        # 没有数据要播放时缓冲区为空不算欠载
+        player = self.player(prebuffer_blocks=1)
+        player.idle = True
+        player.write(np.ones(1024, dtype=np.float32))
+        wait_until(lambda: len(player.stream.output) > 10)
+        self.assertEqual(player.underflow_count, 0)
+        player.abort()
+
+    def test_fade_out_and_resume(self):
+        player = self.player()
+        # 按实时速度播放, fade_out 时第一段还没有播完
+        player.stream.speed = 1.0
+        player.write(np.full(4096, 0.5, dtype=np.float32))
+        wait_until(lambda: player.frames_played > 0)
+        player.fade_out(stop=False)
+        wait_until(lambda: len(player.stream.output) >= 6)
+        # 淡出后输出流没有停止, 一直输出静音
+        self.assertTrue(player.stream.active)
+        self.assertIsNotNone(player.interrupt_latency)
+        self.assertFalse(any(block.any() for block in player.stream.output[3:]))
+
+        player.resume()
+        player.write(np.full(2048, 0.25, dtype=np.float32))
+        player.drain(5)
+        played = player.stream.played()[:, 0]
+        first = np.flatnonzero(played == 0.25)[0]
+        # 第一段没有播完, 淡出到静音; 恢复后的数据完整播放
+        self.assertLess(np.count_nonzero(played[:first] == 0.5), 4096)
+        self.assertTrue(((played[:first] > 0) & (played[:first] < 0.5)).any())
+        self.assertEqual(played[first - 1], 0)
+        np.testing.assert_array_equal(played[first:first + 2048], 0.25)
+        np.testing.assert_array_equal(played[first + 2048:], 0)
+        self.assertFalse(player.aborted)
+
+    def test_fade_out_stop(self):
+        player = self.player()
+        player.stream.speed = 1.0
+        player.write(np.full(4096, 0.5, dtype=np.float32))
+        wait_until(lambda: player.frames_played > 0)
+        player.fade_out()
+        player.drain(5)
+        self.assertFalse(player.stream.active)
+        self.assertTrue(player.aborted)
+        played = player.stream.played()[:, 0]
+        self.assertLess(player.frames_played, 4096)
+        self.assertEqual(played[-1], 0)
+
+    def test_analyser_interrupt(self):
+        audio = np.random.default_rng(1).uniform(-0.5, 0.5, size=44100 * 2).astype(np.float32)
+        analyser = VowelAnalyser(callback_playback=True)
+        results = []
+        with fake_sounddevice.patched() as streams, mock.patch.object(fake_sounddevice.OutputStream, 'speed', 2.0):
+            thread = threading.Thread(target=analyser.action_block,
+                                      args=(audio, 44100, None, lambda res, d: results.append(res)))
+            thread.start()
+            wait_until(lambda: results)
+            analyser.interrupt()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        # 淡出后停止, 剩余的音频没有播放
+        played = streams[0].played()[:, 0]
+        self.assertLess(len(played), len(audio))
+        self.assertEqual(played[-1], 0)
+
+
+class AnalysisWorkerTest(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        gate = threading.Event()
+        handled = []
+
+        def handler(item):
+            gate.wait()
+            handled.append(item)
+
+        worker = AnalysisWorker(handler, max_pending=2)
+        for i in range(6):
+            worker.submit(i)
+        gate.set()
+        worker.join()
+        # 第一个块已经在处理中, 后面只保留最新的两个块
+        self.assertEqual(handled[-2:], [4, 5])
+        self.assertEqual(worker.dropped_count + len(handled), 6)
+
+
+class PresentationSchedulerTest(unittest.TestCase):
+
+    def test_release_at_presentation_time(self):
+        t0 = time.perf_counter()
+        released = []
+        scheduler = PresentationScheduler(lambda frame: t0 + frame / 1000)
+        for frame in (0, 50, 100):
+            scheduler.submit(frame, lambda f=frame: released.append((f, time.perf_counter() - t0)))
+        scheduler.join()
+        self.assertEqual([f for f, _ in released], [0, 50, 100])
+        for frame, t in released:
+            self.assertGreaterEqual(t, frame / 1000)
+
+    def test_wait_for_clock(self):
+        clock = {}
+        released = []
+        scheduler = PresentationScheduler(lambda frame: clock.get('t'))
+        scheduler.submit(0, lambda: released.append(0))
+        time.sleep(0.05)
+        self.assertEqual(released, [])
+        clock['t'] = time.perf_counter()
+        scheduler.join()
+        self.assertEqual(released, [0])
+
+    def test_discard(self):
+        released = []
+        scheduler = PresentationScheduler(lambda frame: time.perf_counter() + 60)
+        scheduler.submit(0, lambda: released.append(0))
+        scheduler.join(discard=True)
+        self.assertEqual(released, [])
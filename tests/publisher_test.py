@@ -0,0 +1,54 @@
+import time
+import unittest
+
+from src.pymouth.publisher import ParameterPublisher
+
+
+class ParameterPublisherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.publisher = ParameterPublisher(self.sent.append, rate=100, epsilon=0.01)
+
+    def values(self):
+        return [{p.id: p.value for p in params} for params in self.sent]
+
+    def test_interpolation(self):
+        p = self.publisher
+        p.update({'MouthOpen': 0.0}, now=0.0)
+        p.tick(now=0.0)
+        p.update({'MouthOpen': 1.0}, now=0.1)
+        # 距上次提交0.1秒, 在0.1秒内从0过渡到1
+        p.tick(now=0.15)
+        p.tick(now=0.2)
+        p.tick(now=0.3)
+        for got, expected in zip([v['MouthOpen'] for v in self.values()], [0.0, 0.5, 1.0], strict=True):
+            self.assertAlmostEqual(got, expected)
+
+    def test_epsilon_and_coalescing(self):
+        p = self.publisher
+        p.update({'VoiceA': 0.5, 'VoiceI': 0.2}, now=0.0)
+        p.tick(now=0.0)
+        p.update({'VoiceA': 0.8, 'VoiceI': 0.205}, now=0.1)
+        p.tick(now=0.3)
+        self.assertEqual(self.values(), [{'VoiceA': 0.5, 'VoiceI': 0.2}, {'VoiceA': 0.8}])
+        self.assertEqual(p.suppressed_count, 1)
+        self.assertEqual(p.tick(now=0.31), [])
+
+    def test_keepalive(self):
+        p = self.publisher
+        p.update({'MouthOpen': 0.3}, now=0.0)
+        p.tick(now=0.0)
+        p.tick(now=0.2)
+        p.update({'MouthOpen': 0.3}, now=0.5)
+        p.tick(now=0.6)
+        self.assertEqual(len(self.sent), 2)
+        # 不再有分析结果提交后不再保持
+        p.tick(now=5.0)
+        self.assertEqual(len(self.sent), 2)
+
+    def test_thread(self):
+        with self.publisher as p:
+            p.update({'MouthOpen': 0.7})
+            time.sleep(0.1)
+        self.assertAlmostEqual(self.values()[-1]['MouthOpen'], 0.7)
@@ -0,0 +1,37 @@
+import unittest
+
+import numpy as np
+
+from src.pymouth.resample import Resampler
+
+
+class ResamplerTest(unittest.TestCase):
+
+    def test_sine(self):
+        for rate in (22050, 44100, 48000):
+            t = np.arange(rate) / rate
+            y = Resampler(rate, 16000).resample(np.sin(2 * np.pi * 440 * t))
+            self.assertEqual(y.size, 16000)
+            expected = np.sin(2 * np.pi * 440 * np.arange(16000) / 16000)
+            # 两端补0, 只比较中间部分
+            np.testing.assert_allclose(y[100:-100], expected[100:-100], atol=1e-3)
+
+    def test_removes_aliasing(self):
+        # 高于目标奈奎斯特频率的分量被滤掉, 不会混叠到低频
+        t = np.arange(44100) / 44100
+        y = Resampler(44100, 16000).resample(np.sin(2 * np.pi * 12000 * t))
+        self.assertLess(np.abs(y[100:-100]).max(), 1e-3)
+
+    def test_push_is_continuous(self):
+        x = np.random.default_rng(0).uniform(-1, 1, 44100).astype(np.float32)
+        r = Resampler(44100, 16000)
+        chunks = [r.push(x[i:i + 1000]) for i in range(0, x.size, 1000)]
+        self.assertEqual([c.size for c in chunks[:3]], [r.output_count(1000 * n) - r.output_count(1000 * (n - 1))
+                                                        for n in range(1, 4)])
+        y = np.concatenate(chunks)
+        self.assertEqual(y.size, r.output_count(x.size))
+        np.testing.assert_allclose(y, Resampler(44100, 16000).resample(x)[:y.size], atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
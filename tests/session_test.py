@@ -0,0 +1,172 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from src.pymouth.analyser import VowelAnalyser, RMSAnalyser
+from src.pymouth.playback import AnalysisWorker
+from tests import fake_sounddevice
+
+
+class PlaybackSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.audio = [rng.uniform(-0.5, 0.5, size=n).astype(np.float32) for n in (5000, 9000, 3000)]
+
+    def test_gapless_queue(self):
+        data = []
+        finished = []
+        analyser = VowelAnalyser(streaming=True)
+        with analyser.open_session(None, 44100, lambda res, d: data.append(d)) as session:
+            utterances = [session.play(y, finished_callback=lambda i=i: finished.append(i))
+                          for i, y in enumerate(self.audio)]
+        self.assertTrue(all(u.done for u in utterances))
+        self.assertEqual(finished, [0, 1, 2])
+        # 音频连续写入同一个输出流, 每句的最后一块不等下一句, 直接写出
+        self.assertEqual([len(d) for d in data], [4096, 904, 4096, 4096, 808, 3000])
+        np.testing.assert_array_equal(np.concatenate(data), np.concatenate(self.audio))
+        self.assertEqual([(u.start_frame, u.end_frame) for u in utterances], [(0, 5000), (5000, 14000), (14000, 17000)])
+
+        # 口型状态在句子之间延续: 结果与在同一个流式会话中依次分析这些块相同
+        session_results = []
+        with analyser.open_session(None, 44100, lambda res, d: session_results.append(res)) as session:
+            for y in self.audio:
+                session.play(y)
+        expected = VowelAnalyser(streaming=True)
+        expected._begin_session(44100, 4096)
+        self.assertEqual(session_results, [expected.process(d, 44100) for d in data])
+
+    def test_priority(self):
+        gate = threading.Event()
+        order = []
+
+        def blocking_chunks():
+            gate.wait()
+            yield self.audio[0]
+
+        with RMSAnalyser().open_session(None, 44100, lambda res, d: None) as session:
+            # 第一句正在播放(等待数据)时提交的语音按优先级排序
+            session.play(blocking_chunks(), finished_callback=lambda: order.append('first'))
+            while session.pending():
+                time.sleep(0.001)
+            for name, priority in (('low', 0), ('urgent', 5), ('normal', 1), ('low2', 0)):
+                session.play(self.audio[1], priority=priority, finished_callback=lambda n=name: order.append(n))
+            gate.set()
+        self.assertEqual(order, ['first', 'urgent', 'normal', 'low', 'low2'])
+
+    def test_resample_and_channels(self):
+        data = []
+        stereo = np.stack([self.audio[1], -self.audio[1]], axis=1)
+        with RMSAnalyser().open_session(None, 44100, lambda res, d: data.append(d), channels=2) as session:
+            session.play(stereo, 22050)
+            session.play(self.audio[0])
+        out = np.concatenate(data)
+        self.assertEqual(out.shape, (9000 * 2 + 5000, 2))
+        np.testing.assert_array_equal(out[18000:, 0], self.audio[0])
+        np.testing.assert_array_equal(out[18000:, 1], self.audio[0])
+        np.testing.assert_allclose(out[:18000, 0], -out[:18000, 1])
+
+    def test_close_discard(self):
+        finished = []
+        gate = threading.Event()
+
+        def blocking_chunks():
+            yield self.audio[0]
+            gate.wait()
+            yield self.audio[0]
+
+        session = RMSAnalyser().open_session(None, 44100, lambda res, d: None)
+        first = session.play(blocking_chunks(), finished_callback=lambda: finished.append(0))
+        second = session.play(self.audio[1], finished_callback=lambda: finished.append(1))
+        threading.Timer(0.05, gate.set).start()
+        session.close(discard=True)
+        self.assertTrue(first.done and second.done)
+        self.assertEqual(sorted(finished), [0, 1])
+        with self.assertRaises(RuntimeError):
+            session.play(self.audio[0])
+
+    def test_interrupt(self):
+        results = []
+        gate = threading.Event()
+
+        def chunks():
+            yield self.audio[1]
+            gate.wait()
+            yield self.audio[1]
+
+        with VowelAnalyser().open_session(None, 44100,
+                                          lambda res, d: results.append((res, len(d), not d.any()))) as session:
+            first = session.play(chunks())
+            while first.start_frame is None:
+                time.sleep(0.001)
+            session.interrupt()
+            gate.set()
+            first.wait(5)
+            second = session.play(self.audio[0])
+        self.assertTrue(first.interrupted)
+        self.assertFalse(second.interrupted)
+        # 中断时立即发布无声的结果, 之后继续播放下一句
+        silence = [i for i, (res, n, zero) in enumerate(results) if zero]
+        self.assertEqual(len(silence), 1)
+        self.assertEqual(results[silence[0]][:2], (VowelAnalyser().silence(), 4096))
+        self.assertEqual([n for _, n, _ in results[silence[0] + 1:]], [4096, 904])
+        self.assertLessEqual(first.end_frame, 9000 + 4096)
+
+    def close_within(self, session, timeout=5.0) -> bool:
+        t = threading.Thread(target=session.close, daemon=True)
+        t.start()
+        t.join(timeout)
+        return not t.is_alive()
+
+    def test_interrupt_then_close(self):
+        # 中断后静音的输出流没有恢复, close 也不能一直等待播放完毕
+        y = np.random.default_rng(1).uniform(-0.5, 0.5, size=44100).astype(np.float32)
+        for clear in (False, True):
+            with fake_sounddevice.patched() as streams:
+                session = VowelAnalyser().open_session(0, 44100, lambda res, d: None)
+                session.play(y)
+                session.play(y)
+                while not streams[0].output:
+                    time.sleep(0.001)
+                session.interrupt(clear=clear)
+                self.assertTrue(self.close_within(session))
+                self.assertFalse(streams[0].active)
+
+        # 上下文管理器中最后一步是中断
+        with fake_sounddevice.patched() as streams:
+            utterances = []
+
+            def run():
+                with VowelAnalyser().open_session(0, 44100, lambda res, d: None) as s:
+                    utterances.append(s.play(y))
+                    s.interrupt()
+
+            t = threading.Thread(target=run, daemon=True)
+            t.start()
+            t.join(5)
+            self.assertFalse(t.is_alive())
+            self.assertTrue(utterances[0].done)
+            self.assertFalse(streams[0].active)
+
+
+class AnalysisWorkerRequiredTest(unittest.TestCase):
+
+    def test_required_items_are_kept(self):
+        gate = threading.Event()
+        handled = []
+
+        def handler(item):
+            gate.wait()
+            handled.append(item)
+
+        worker = AnalysisWorker(handler, max_pending=2)
+        worker.submit(0)
+        worker.submit('end', required=True)
+        for i in range(1, 6):
+            worker.submit(i)
+        gate.set()
+        worker.join()
+        self.assertIn('end', handled)
+        self.assertEqual(handled[-1], 5)
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from src.pymouth.analyser import Analyser, VowelAnalyser, default_templates
+from src.pymouth.templates import TemplateBank, VOWELS
+
+AIUEO = os.path.join(os.path.dirname(__file__), 'aiueo.wav')
+# aiueo.wav 中每个元音所在的 4096 样本块, 见 mfcc.py
+BLOCKS = {'A': 3, 'I': 13, 'U': 23, 'E': 34, 'O': 46}
+
+
+def segments(blocks: int = 1):
+    return [(v, i * 4096 / 44100, (i + blocks) * 4096 / 44100) for v, i in BLOCKS.items()]
+
+
+class TemplateBankTest(unittest.TestCase):
+
+    def test_from_recording_matches_builtin(self):
+        bank = TemplateBank.from_recording(AIUEO, 44100, segments(), fallback=default_templates())
+        self.assertEqual(len(bank), 6)
+        np.testing.assert_allclose(bank.templates[1], Analyser.V_A, atol=1e-4)
+        np.testing.assert_allclose(bank.templates[5], Analyser.V_O, atol=1e-4)
+        np.testing.assert_array_equal(bank.templates[0], Analyser.V_Silence)
+
+    def test_multiple_templates_per_vowel(self):
+        bank = TemplateBank.from_recording(AIUEO, 44100, segments(blocks=3), per_vowel=2,
+                                           fallback=default_templates())
+        self.assertEqual(len(bank), 11)
+        self.assertEqual(bank.labels.tolist(), [0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+
+        analyser = VowelAnalyser(templates=bank)
+        y, _ = sf.read(AIUEO, dtype='float32')
+        for v, i in BLOCKS.items():
+            res = analyser.process(y[i * 4096:(i + 1) * 4096], 44100)
+            self.assertEqual(max(res, key=res.get), 'Voice' + v)
+
+    def test_pruning_is_exact(self):
+        bank = TemplateBank.from_recording(AIUEO, 44100, segments(blocks=6), per_vowel=None,
+                                           fallback=default_templates())
+        self.assertGreater(len(bank), 50)
+        y, _ = sf.read(AIUEO, dtype='float32')
+        blocks = [y[i:i + 4096] for i in range(0, y.shape[0] - 4096, 4096)]
+        pruned, full = VowelAnalyser(templates=bank), VowelAnalyser(templates=bank, pruning=None)
+        for block in blocks:
+            self.assertEqual(pruned.process(block, 44100), full.process(block, 44100))
+        with self.assertRaises(ValueError):
+            VowelAnalyser(pruning='fast')
+
+    def test_save_load(self):
+        bank = TemplateBank(np.random.default_rng(0).normal(size=(8, 9, 2)), [0, 1, 2, 3, 4, 5, 'a', 'VoiceO'])
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'bank.npz')
+            bank.save(path)
+            loaded = TemplateBank.load(path)
+            np.testing.assert_array_equal(loaded.templates, bank.templates)
+            self.assertEqual(loaded.fingerprint, bank.fingerprint)
+            self.assertIsNone(loaded.samplerate)
+
+            TemplateBank(bank.templates, bank.labels, samplerate=16000).save(path)
+            self.assertEqual(TemplateBank.load(path).samplerate, 16000)
+
+            path = os.path.join(d, 'bank.npy')
+            np.save(path, default_templates().templates)
+            self.assertEqual(VowelAnalyser(templates=path).templates.fingerprint, default_templates().fingerprint)
+
+    def test_analysis_rate(self):
+        bank = TemplateBank.from_recording(AIUEO, 44100, segments(), fallback=default_templates())
+        with self.assertRaises(ValueError):
+            TemplateBank.from_recording(AIUEO, 44100, segments(), fallback=bank, analysis_rate=16000)
+        bank = TemplateBank.from_recording(AIUEO, 44100, segments() + [('silence', 0, 4096 / 44100)],
+                                           analysis_rate=16000)
+        self.assertEqual(bank.samplerate, 16000)
+        # 模板的帧数与按原始采样率分析时相同
+        self.assertEqual(bank.length, default_templates().length)
+        analyser = VowelAnalyser(templates=bank)
+        y, _ = sf.read(AIUEO, dtype='float32')
+        for v, i in BLOCKS.items():
+            res = analyser.process(y[i * 4096:(i + 1) * 4096], 44100)
+            self.assertEqual(max(res, key=res.get), 'Voice' + v)
+
+    def test_missing_vowel(self):
+        with self.assertRaises(ValueError):
+            TemplateBank(np.zeros((5, 9, 2)), VOWELS[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.pymouth.analyser import VowelAnalyser, RMSAnalyser, VOWELS
+from src.pymouth.metrics import Metrics
+from src.pymouth.track import LipSyncTrack, bake
+
+AIUEO = os.path.join(os.path.dirname(__file__), 'aiueo.wav')
+
+
+class LipSyncTrackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'aiueo.pmt')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_roundtrip(self):
+        track = bake(VowelAnalyser(), AIUEO, 44100)
+        track.save(self.path)
+        loaded = LipSyncTrack.load(self.path)
+        self.assertIsInstance(loaded.values, np.memmap)
+        self.assertEqual((loaded.kind, loaded.samplerate, loaded.hop), ('vowel', 44100, 4096))
+        self.assertEqual(loaded.analyser, 'VowelAnalyser')
+        self.assertEqual(loaded.source_hash, track.source_hash)
+        np.testing.assert_array_equal(loaded.timestamps, track.timestamps)
+        np.testing.assert_allclose(loaded.values, track.values, atol=1e-3)
+        self.assertTrue(loaded.matches(AIUEO))
+        self.assertFalse(loaded.matches(np.zeros(4096, dtype=np.float32)))
+
+    def test_playback_uses_track(self):
+        expected = []
+        VowelAnalyser(streaming=True).action_block(AIUEO, 44100, None, lambda md, d: expected.append(md),
+                                                   auto_play=False)
+
+        bake(VowelAnalyser(), AIUEO, 44100).save(self.path, dtype=np.float32)
+        metrics = Metrics()
+        res = []
+        VowelAnalyser(metrics=metrics).action_block(AIUEO, 44100, None, lambda md, d: res.append(md),
+                                                    auto_play=False, track=LipSyncTrack.load(self.path))
+        np.testing.assert_allclose([[md[k] for k in VOWELS] for md in res],
+                                   [[md[k] for k in VOWELS] for md in expected], atol=1e-6)
+        # 播放时没有做任何分析
+        self.assertNotIn('mfcc', metrics.snapshot()['stages'])
+
+    def test_db_track(self):
+        track = bake(RMSAnalyser(), AIUEO, 44100)
+        self.assertEqual((track.kind, track.analyser), ('db', 'RMSAnalyser'))
+        self.assertIsInstance(track.at(1.0), float)
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'RIFF' + bytes(100))
+        with self.assertRaises(ValueError):
+            LipSyncTrack.load(self.path)
+
+    def test_load_version_1(self):
+        # 版本1的文件头没有 analyser
+        from src.pymouth.track import HEADER_V1, MAGIC
+        track = bake(RMSAnalyser(), AIUEO, 44100)
+        with open(self.path, 'wb') as f:
+            f.write(HEADER_V1.pack(MAGIC, 1, 1, 1, 1, 44100, 4096, len(track), track.source_hash))
+            f.write(np.ascontiguousarray(track.timestamps, dtype='<f8').tobytes())
+            f.write(np.ascontiguousarray(track.values, dtype='<f4').tobytes())
+        loaded = LipSyncTrack.load(self.path)
+        self.assertEqual((loaded.kind, loaded.analyser), ('db', ''))
+        np.testing.assert_allclose(loaded.values, track.values, rtol=1e-6)
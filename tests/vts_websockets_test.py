@@ -0,0 +1,61 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from websockets.asyncio.server import serve
+
+from src.pymouth.vts_websockets import AsyncVTSWebSocket, VTSPluginInfo, VTSParameterData
+
+
+class AsyncVTSWebSocketTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.injected = []
+        self.server = await serve(self.handler, 'localhost', 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.vts = AsyncVTSWebSocket(f'ws://localhost:{port}',
+                                     VTSPluginInfo(plugin_name='pymouth', developer='organics',
+                                                   authentication_token_path='./pymouth_vts_token.txt'))
+        await self.vts.connect()
+
+    async def asyncTearDown(self):
+        await self.vts.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handler(self, ws):
+        async for message in ws:
+            req = json.loads(message)
+            asyncio.create_task(self.reply(ws, req))
+
+    async def reply(self, ws, req):
+        data = {}
+        if req['messageType'] == 'APIStateRequest':
+            data = {'currentSessionAuthenticated': True}
+        elif req['messageType'] == 'InjectParameterDataRequest':
+            self.injected.append(req['data']['parameterValues'])
+        elif req['messageType'] == 'EchoRequest':
+            # 先到的请求后响应
+            await asyncio.sleep(req['data']['delay'])
+            data = req['data']
+        await ws.send(json.dumps({'requestID': req['requestID'], 'messageType': req['messageType'], 'data': data}))
+
+    async def test_concurrent_requests(self):
+        res = await asyncio.gather(*[self.vts.request('EchoRequest', data={'delay': d, 'i': i})
+                                     for i, d in enumerate((0.1, 0.05, 0))])
+        self.assertEqual([r['data']['i'] for r in res], [0, 1, 2])
+
+    async def test_set_params_from_thread(self):
+        def publish():
+            for i in range(10):
+                self.vts.set_single_param(VTSParameterData('MouthOpen', i / 10))
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        thread.join()
+        for _ in range(100):
+            if len(self.injected) == 10:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual([p[0]['value'] for p in self.injected], [i / 10 for i in range(10)])